@@ -60,3 +60,134 @@ def test_api_rules_put_get(tmp_path: Path):
     r2 = c.get("/api/v1/rules")
     assert r2.status_code == 200
     assert r2.json()["thr"] == 5
+
+
+def test_api_rules_put_bad_sqlite(tmp_path: Path):
+    c = TestClient(mk_api(tmp_path / "db.sqlite"))
+    ok = {"rid": "x", "rtp": "sub", "w": 5, "ps": ["../"], "fld": "req"}
+    assert c.put("/api/v1/rules", json={"thr": 5, "rls": [ok]}).status_code == 200
+    assert c.put("/api/v1/rules", json={"thr": 5, "rls": [{"rid": "y", "rtp": "sub"}]}).status_code == 400
+    assert c.put("/api/v1/rules", json={"thr": 5, "rls": [ok | {"w": "heavy"}]}).status_code == 400
+    assert c.put("/api/v1/rules", json={"thr": "high", "rls": [ok]}).status_code == 400
+    assert c.get("/api/v1/rules").json()["rls"] == [ok]  # failed puts changed nothing
+    assert c.delete("/api/v1/rules/rl/x").status_code == 200
+
+
+def test_api_rules_db_busy_503(tmp_path: Path, monkeypatch):
+    from waflite import api
+    from waflite.db import DbErr
+
+    def busy(*a, **k):
+        raise DbErr("db занята")
+
+    c = TestClient(mk_api(tmp_path / "db.sqlite"))
+    ok = {"rid": "x", "rtp": "sub", "w": 5, "ps": ["../"], "fld": "req"}
+    for n in ("sv_db", "rl_put", "rl_del"):
+        monkeypatch.setattr(api, n, busy)
+    assert c.put("/api/v1/rules", json={"thr": 5, "rls": [ok]}).status_code == 503
+    assert c.post("/api/v1/rules/rl", json=ok).status_code == 503
+    assert c.put("/api/v1/rules/rl/x", json=ok).status_code == 503
+    assert c.delete("/api/v1/rules/rl/x").status_code == 503
+
+
+def test_api_rule_crud(tmp_path: Path):
+    dbp = tmp_path / "db.sqlite"
+    c = TestClient(mk_api(dbp))
+    v0 = c.get("/api/v1/rules/ver").json()["ver"]
+    r = c.post("/api/v1/rules/rl", json={"rid": "x", "rtp": "sub", "w": 7, "ps": ["UNION"]})
+    assert r.status_code == 201
+    assert r.json()["ver"] > v0
+    assert c.post("/api/v1/rules/rl", json={"rid": "x", "rtp": "sub", "w": 7}).status_code == 409
+    r = c.post("/api/v1/scan", json={"req": "GET /?id=1 UNION SELECT 1 HTTP/1.1"})
+    assert r.json()["dec"] == "block"
+
+    r = c.put("/api/v1/rules/rl/x", json={"rid": "x", "rtp": "sub", "w": 1, "ps": ["UNION"]})
+    assert r.status_code == 200
+    assert c.get("/api/v1/rules/rl/x").json()["w"] == 1
+    assert c.put("/api/v1/rules/rl/y", json={"rid": "x", "rtp": "sub", "w": 1}).status_code == 400
+
+    assert c.delete("/api/v1/rules/rl/x").status_code == 200
+    assert c.delete("/api/v1/rules/rl/x").status_code == 404
+    assert c.get("/api/v1/rules/rl/x").status_code == 404
+
+
+def test_api_rules_etag(tmp_path: Path):
+    dbp = tmp_path / "db.json"
+    dbp.write_text('{"thr": 7, "ign_ua": [], "rls": []}', encoding="utf-8")
+    c = TestClient(mk_api(dbp))
+    r = c.get("/api/v1/rules")
+    tag = r.headers["etag"]
+    assert r.json()["thr"] == 7
+    r2 = c.get("/api/v1/rules", headers={"If-None-Match": tag})
+    assert r2.status_code == 304 and r2.content == b""
+
+    c.put("/api/v1/rules", json={"thr": 5, "ign_ua": [], "rls": []})
+    r3 = c.get("/api/v1/rules", headers={"If-None-Match": tag})
+    assert r3.status_code == 200
+    assert r3.json()["thr"] == 5 and r3.headers["etag"] != tag
+
+
+def test_api_scan_body_hdrs(tmp_path: Path):
+    dbp = tmp_path / "db.json"
+    dbp.write_text(
+        '{"thr": 5, "ign_ua": [], "rls": ['
+        '{"rid": "b", "rtp": "sub", "w": 5, "ps": ["<script"], "fld": "body"},'
+        '{"rid": "ck", "rtp": "sub", "w": 5, "ps": ["admin=1"], "fld": "cookie"}]}',
+        encoding="utf-8",
+    )
+    c = TestClient(mk_api(dbp))
+    r = c.post("/api/v1/scan", json={"req": "POST / HTTP/1.1", "body": "x=<script>"}).json()
+    assert r["m"] == ["b"]
+    r = c.post("/api/v1/scan", json={"req": "GET / HTTP/1.1", "hdrs": {"Cookie": "admin=1"}}).json()
+    assert r["m"] == ["ck"]
+
+
+def test_api_auth(tmp_path: Path):
+    dbp = tmp_path / "db.json"
+    dbp.write_text(
+        '{"thr": 7, "ign_ua": [], "rls": ['
+        '{"rid":"sqli","rtp":"sub","w":7,"ps":["union select"],"fld":"query"},'
+        '{"rid":"ck","rtp":"sub","w":2,"ps":["admin=1"],"fld":"cookie"}]}',
+        encoding="utf-8",
+    )
+    c = TestClient(mk_api(dbp))
+    h = {"X-Original-URI": "/p?id=1 union select 1", "X-Original-Method": "GET", "X-Real-IP": "1.2.3.4", "Cookie": "admin=1"}
+    r = c.get("/api/v1/auth", headers=h)
+    assert r.status_code == 403
+    assert r.content == b""
+    assert r.headers["x-waf-score"] == "9"
+    assert r.headers["x-waf-rules"] == "sqli,ck"
+    r = c.get("/api/v1/auth", headers={"X-Original-URI": "/ok"})
+    assert r.status_code == 204
+    assert r.headers["x-waf-decision"] == "allow"
+    assert c.get("/api/v1/auth").status_code == 400
+    assert c.get("/api/v1/stats").json()["scans"] == 2
+
+
+def test_api_server_timing(tmp_path: Path):
+    dbp = tmp_path / "db.json"
+    dbp.write_text('{"thr": 7, "ign_ua": [], "rls": [{"rid":"x","rtp":"sub","w":7,"ps":["UNION"]}]}', encoding="utf-8")
+    c = TestClient(mk_api(dbp))
+    for r in (
+        c.post("/api/v1/scan", json={"req": "GET / HTTP/1.1"}),
+        c.post("/api/v1/batch", json={"items": [{"req": "GET / HTTP/1.1"}]}),
+        c.get("/api/v1/auth", headers={"X-Original-URI": "/?q=UNION"}),
+    ):
+        assert r.headers["server-timing"].startswith("waf-rl;dur=")
+
+
+def test_api_stats_live(tmp_path: Path):
+    dbp = tmp_path / "db.json"
+    dbp.write_text(
+        '{"thr": 7, "ign_ua": [], "rls": [{"rid":"sqli_x","rtp":"sub","w":7,"ps":["UNION"],"fld":"req"}]}',
+        encoding="utf-8",
+    )
+    c = TestClient(mk_api(dbp))
+    c.post("/api/v1/scan", json={"ip": "6.6.6.6", "req": "GET /q?id=1 UNION SELECT HTTP/1.1", "ua": "x"})
+    c.post("/api/v1/batch", json={"items": [{"req": "GET / HTTP/1.1"}, {"ip": "6.6.6.6", "req": "GET /q UNION"}]})
+    c.get("/api/v1/auth", headers={"X-Original-URI": "/p?UNION", "X-Real-IP": "7.7.7.7"})
+    j = c.get("/api/v1/stats/live", params={"k": 1}).json()
+    assert sum(j["sec"]["scans"]) == 4 and sum(j["sec"]["blocks"]) == 3
+    assert j["rules"]["sqli_x"]["1m"] == 3
+    assert j["top"]["5m"]["ip"] == [["6.6.6.6", 2, 0]]
+    assert j["top"]["5m"]["path"] == [["/q", 2, 0]]
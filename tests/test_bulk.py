@@ -0,0 +1,63 @@
+import pytest
+
+from waflite.bulk import bscr
+from waflite.cli import run_cli
+from waflite.core import CfgErr, Rl, nrq, scr
+from waflite.rules import dfl_rls
+
+RLS = dfl_rls() + [
+    Rl("sp", "re", 1, (r"a\s+b",), "req"),
+    Rl("dot", "re", 1, (r"(?s)x.*y",), "req"),
+    Rl("anc", "re", 1, (r"^GET /$", r"\Aadmin"), "req"),
+    Rl("la", "re", 1, (r"foo(?=\s)", r"(?<=\n)bar"), "req"),
+    Rl("nl", "sub", 1, ("z\ng",), "req"),
+    Rl("ks", "re", 1, (r"select",), "req"),
+    Rl("ua", "sub", 2, ("Curl",), "ua"),
+    Rl("arg", "re", 2, (r"'",), "arg:id"),
+    Rl("tn", "sub", 1, ("/etc/passwd",), "path", ("normpath", "lower")),
+    Rl("th", "re", 1, (r"<img\b",), "args", ("htmlentity",)),
+]
+
+REQS = [
+    "GET / HTTP/1.1",
+    "GET /",
+    "GET /?q=a",
+    "b /x",
+    "admin",
+    "GET /?id=1' UNION SELECT HTTP/1.1",
+    "ſelect",
+    "",
+    "foo",
+    "bar foo bar",
+    "x\ny",
+    "xz",
+    "ghi y",
+    "GET /../etc/passwd",
+    "GET /?id=%27 HTTP/1.1",
+    "<ScRiPt>",
+]
+
+
+@pytest.mark.parametrize("k", [1, 3, len(REQS)])
+def test_bscr_same_as_scr(k):
+    rqs = [nrq({"req": r, "ua": "curl/8" if i % 3 else "x"}) for i, r in enumerate(REQS)]
+    got = []
+    for i in range(0, len(rqs), k):
+        got += bscr(RLS, rqs[i : i + k])
+    assert got == [scr(RLS, r) for r in rqs]
+
+
+def test_bscr_bad_rtp():
+    with pytest.raises(CfgErr):
+        bscr([Rl("x", "zzz", 1, ("a",))], [nrq({"req": "a"})])
+
+
+def test_cli_bulk_same_output(tmp_path):
+    ip = tmp_path / "in.txt"
+    ip.write_text("\n".join(r for r in REQS if r) + "\n", encoding="utf-8")
+    outs = []
+    for a in (["--eng", "row"], ["--eng", "bulk", "--chunk", "4"]):
+        op = tmp_path / f"out_{a[1]}.jsonl"
+        assert run_cli(["--in", str(ip), "--fmt", "raw", "--out", str(op), *a]) == 0
+        outs.append(op.read_bytes())
+    assert outs[0] == outs[1]
@@ -0,0 +1,84 @@
+import json
+import os
+import random
+from pathlib import Path
+
+import pytest
+
+from waflite import cidr
+from waflite.bulk import bscr
+from waflite.cidr import CTab, bld, idx_p, ld_idx, mk_cidr, prs_net
+from waflite.cli import run_cli
+from waflite.core import CfgErr, Rl, nrq, scr
+from waflite.eng import mk_eng
+
+
+def test_prs_net():
+    assert prs_net("10.1.2.3/8") == (4, (0x0A000000, 0x0AFFFFFF))
+    assert prs_net("1.2.3.4") == (4, (0x01020304, 0x01020304))
+    v, (lo, hi) = prs_net("2001:db8::/32")
+    assert v == 6 and hi - lo == (1 << 96) - 1
+    for s in ("1.2.3/8", "1.2.3.4/33", "x"):
+        with pytest.raises(ValueError):
+            prs_net(s)
+
+
+def test_inline_rule():
+    f = mk_cidr("r", ["10.0.0.0/8", "192.168.1.0/24", "2001:db8::/32", "10.5.0.0/16"])
+    assert f("10.9.9.9", "") and f("192.168.1.255", "") and f("2001:db8::1", "")
+    assert f("::ffff:10.0.0.1", "")  # IPv4-mapped
+    assert f("8.8.8.8, 10.1.1.1", "")  # X-Forwarded-For
+    assert not f("192.168.2.1", "") and not f("2001:db9::1", "") and not f("", "") and not f("nope", "")
+    with pytest.raises(CfgErr):
+        mk_cidr("r", ["10.0.0.0/99"])
+
+
+def test_list_file_index(tmp_path: Path):
+    rnd = random.Random(3)
+    nets = [f"{rnd.randrange(1, 224)}.{rnd.randrange(256)}.{rnd.randrange(256)}.0/{rnd.choice((16, 20, 24, 32))}" for _ in range(3000)]
+    src = tmp_path / "feed.txt"
+    src.write_text("# feed\n" + "\n".join(nets) + "\njunk\n2001:db8::/48 ; comment\n", encoding="utf-8")
+    r = bld(src)
+    assert r["bad"] == 1 and r["n6"] == 1 and 0 < r["n4"] <= 3000
+    t = ld_idx(idx_p(src))
+    ref = CTab.of([prs_net(n)[1] for n in nets], [])
+    for _ in range(3000):
+        x = rnd.getrandbits(32)
+        assert t.has(4, x) == ref.has(4, x)
+    assert t.has(6, prs_net("2001:db8::5")[1][0]) and not t.has(6, 1)
+    src.write_text("1.1.1.1\n", encoding="utf-8")
+    os.utime(src, ns=(1, 1))
+    assert ld_idx(idx_p(src), (src.stat().st_size, 1)) is None  # stale
+
+
+def test_rule_reloads_feed(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(cidr, "TTL", 0.0)
+    src = tmp_path / "bad_ips.txt"
+    src.write_text("203.0.113.0/24\n", encoding="utf-8")
+    e = mk_eng({"thr": 5, "rls": [{"rid": "rep", "rtp": "cidr", "w": 5, "ps": ["@" + str(src)], "fld": "ip"}]})
+    assert e.run({"ip": "203.0.113.7"})["dec"] == "block"
+    assert idx_p(src).exists()
+    src.write_text("198.51.100.0/24\n", encoding="utf-8")
+    os.utime(src, ns=(10**18, 10**18))
+    assert e.run({"ip": "203.0.113.7"})["dec"] == "allow"
+    assert e.run({"ip": "198.51.100.1"})["dec"] == "block"
+
+
+def test_eng_checks(tmp_path: Path):
+    with pytest.raises(CfgErr):
+        mk_eng({"rls": [{"rid": "x", "rtp": "cidr", "w": 1, "ps": ["@" + str(tmp_path / "none.txt")], "fld": "ip"}]})
+    with pytest.raises(CfgErr):
+        mk_eng({"rls": [{"rid": "x", "rtp": "cidr", "w": 1, "ps": ["10.0.0.0/8"], "fld": "body"}]})
+
+
+def test_bulk_same_as_scr():
+    rls = [Rl("c", "cidr", 3, ("10.0.0.0/8",), "ip"), Rl("s", "sub", 2, ("admin",), "req")]
+    rqs = [nrq({"ip": ip, "req": f"GET /{p} HTTP/1.1"}) for ip in ("10.1.1.1", "11.1.1.1", "") for p in ("admin", "x")]
+    assert bscr(rls, rqs) == [scr(rls, q) for q in rqs]
+
+
+def test_cli_cidr(tmp_path: Path, capsys):
+    src = tmp_path / "f.txt"
+    src.write_text("10.0.0.0/8\n10.0.0.0/9\n11.0.0.0/8\n", encoding="utf-8")
+    assert run_cli(["cidr", "--in", str(src)]) == 0
+    assert json.loads(capsys.readouterr().out) == {"p": str(idx_p(src)), "n4": 1, "n6": 0, "bad": 0}
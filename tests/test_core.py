@@ -1,6 +1,7 @@
 import pytest
 
-from waflite.core import Rl, nrq, mtch, scr, dec, CfgErr
+from waflite import core
+from waflite.core import Rl, nrq, mtch, npath, pfx_tab, scr, dec, tv, CfgErr
 
 
 def test_nrq_keys():
@@ -16,6 +17,10 @@ def test_nrq_keys():
         (Rl("a", "sub", 1, ("../",), "req"), {"req": "/ok"}, False),
         (Rl("b", "re", 1, (r"\bselect\b",), "req"), {"req": "SELECT 1"}, True),
         (Rl("b", "re", 1, (r"\bselect\b",), "req"), {"req": "hello"}, False),
+        (Rl("c", "eq", 1, ("sqlmap/1.0", "Nikto"), "ua"), {"ua": " NIKTO "}, True),
+        (Rl("c", "eq", 1, ("sqlmap/1.0", "Nikto"), "ua"), {"ua": "nikto2"}, False),
+        (Rl("d", "pfx", 1, ("/wp-", "/admin", "/adm"), "req"), {"req": "/ADMx"}, True),
+        (Rl("d", "pfx", 1, ("/wp-", "/admin", "/adm"), "req"), {"req": "/ad"}, False),
     ],
 )
 def test_mtch_ok(rl, rq, exp):
@@ -39,3 +44,70 @@ def test_scr_and_dec_pos_neg():
     s2, ms2 = scr(rls, {"req": "/?q=<script>alert(1)</script>"})
     assert s2 == 5 and "t2" in ms2
     assert dec(s2, 5) == "block"
+
+
+def test_rq_derived_lazy():
+    rq = nrq({"req": "POST /a%20b/c?id=1%27+or&x=&id=2 HTTP/1.1"})
+    assert "path" not in rq
+    assert rq["method"] == "POST"
+    assert rq["path"] == "/a b/c"
+    assert rq["query"] == "id=1' or&x=&id=2"
+    assert rq["arg:id"] == "1' or\n2"
+    assert rq.get("arg:x") == ""
+    assert rq.get("arg:nope") == ""
+    assert rq["args"] == "1' or\n2\n"
+    assert rq.get("zzz", 7) == 7
+
+
+def test_scr_arg_field():
+    rls = [Rl("q", "sub", 5, ("'",), "arg:id")]
+    assert scr(rls, nrq({"req": "GET /o'k?id=1 HTTP/1.1"})) == (0, [])
+    assert scr(rls, nrq({"req": "GET /?id=1%27 HTTP/1.1"})) == (5, ["q"])
+
+
+def test_pfx_tab_big():
+    ps = [f"/p{i}/" for i in range(100_000)] + ["/p1", "/x"]
+    t = pfx_tab(ps)
+    assert "/p1" in t and "/p10/" not in t and len(t) < len(ps)
+    rl = Rl("big", "pfx", 1, tuple(ps), "path")
+    assert mtch(rl, nrq({"req": "GET /p99999/z HTTP/1.1"}))
+    assert mtch(rl, nrq({"req": "GET /p1anything HTTP/1.1"}))
+    assert not mtch(rl, nrq({"req": "GET /p2 HTTP/1.1"}))
+    eq = Rl("big_eq", "eq", 1, tuple(f"bot-{i}" for i in range(100_000)), "ua")
+    assert mtch(eq, {"ua": "Bot-77777"}) and not mtch(eq, {"ua": "bot-100000"})
+
+
+@pytest.mark.parametrize(
+    "s,exp",
+    [
+        ("/a/./b//c", "/a/b/c"),
+        ("/a/b/../c", "/a/c"),
+        ("/a/../../etc/passwd", "/../etc/passwd"),
+        ("GET /x\\..\\y/.. HTTP/1.1", "GET / HTTP/1.1"),
+        ("/a/...", "/a/..."),
+    ],
+)
+def test_npath(s, exp):
+    assert npath(s) == exp
+
+
+def test_transform_chains(monkeypatch):
+    n = {"urldecode": 0, "lower": 0}
+    for k in n:
+        f = core.TFS[k]
+        monkeypatch.setitem(core.TFS, k, lambda v, f=f, k=k: n.__setitem__(k, n[k] + 1) or f(v))
+    rls = [
+        Rl("a", "sub", 1, ("'",), "req", ("urldecode",)),
+        Rl("b", "re", 1, ("union select",), "req", ("urldecode", "lower")),
+        Rl("c", "eq", 1, ("x",), "req", ("urldecode", "lower")),
+        Rl("d", "sub", 1, ("%27",), "req"),
+    ]
+    rq = nrq({"req": "GET /?id=1%27+UNION%20SELECT HTTP/1.1"})
+    assert scr(rls, rq) == (3, ["a", "b", "d"])
+    assert n == {"urldecode": 1, "lower": 1}
+    vs: dict = {}
+    assert tv({"req": "%2527"}, "req", ("urldecode", "urldecode"), vs) == "'"
+    assert vs[("req", ("urldecode",))] == "%27"
+    assert mtch(Rl("x", "sub", 1, ("<script",), "req", ("htmlentity",)), {"req": "&lt;script&gt;"})
+    with pytest.raises(CfgErr):
+        mtch(Rl("x", "sub", 1, ("a",), "req", ("base64",)), {"req": "a"})
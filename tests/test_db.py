@@ -0,0 +1,93 @@
+import sqlite3
+import threading
+from pathlib import Path
+
+import pytest
+
+from waflite.core import CfgErr
+from waflite.db import DupErr, ld_db, sv_db, db_ver, db_set, rl_get, rl_put, rl_del
+
+
+@pytest.mark.parametrize("nm", ["db.json", "db.sqlite"])
+def test_db_roundtrip(tmp_path: Path, nm: str):
+    p = tmp_path / nm
+    assert ld_db(p)["rls"] == []
+    sv_db(p, {"thr": 5, "ign_ua": ["probe"], "rls": [{"rid": "a", "rtp": "sub", "w": 1, "ps": ["x"], "fld": "req"}]})
+    d = ld_db(p)
+    assert d["thr"] == 5 and d["ign_ua"] == ["probe"]
+    assert d["rls"] == [{"rid": "a", "rtp": "sub", "w": 1, "ps": ["x"], "fld": "req"}]
+
+
+@pytest.mark.parametrize("nm", ["db.json", "db.sqlite"])
+def test_db_rule_ops(tmp_path: Path, nm: str):
+    p = tmp_path / nm
+    rl_put(p, {"rid": "a", "rtp": "sub", "w": 1, "ps": ["x"]})
+    rl_put(p, {"rid": "b", "rtp": "re", "w": 2, "ps": ["y"], "fld": "ua"})
+    with pytest.raises(DupErr):
+        rl_put(p, {"rid": "a", "rtp": "sub", "w": 9}, add=True)
+    rl_put(p, {"rid": "a", "rtp": "sub", "w": 3, "ps": ["z"]})
+    assert [x["rid"] for x in ld_db(p)["rls"]] == ["a", "b"]
+    assert rl_get(p, "a")["w"] == 3
+    assert rl_del(p, "a") is True
+    assert rl_del(p, "a") is False
+    assert rl_get(p, "a") is None
+    db_set(p, thr=11)
+    assert ld_db(p)["thr"] == 11
+    with pytest.raises(CfgErr):
+        rl_put(p, {"rid": "c"})
+
+
+def test_sq_ver_monotonic(tmp_path: Path):
+    p = tmp_path / "db.sqlite"
+    v0 = db_ver(p)
+    rl_put(p, {"rid": "a", "rtp": "sub", "w": 1, "ps": ["x"]})
+    v1 = db_ver(p)
+    rl_del(p, "a")
+    v2 = db_ver(p)
+    rl_del(p, "a")
+    assert v0 < v1 < v2 == db_ver(p)
+
+
+@pytest.mark.parametrize("nm", ["db.json", "db.sqlite"])
+def test_db_concurrent_adds(tmp_path: Path, nm: str):
+    p = tmp_path / nm
+
+    def add(i: int) -> None:
+        for j in range(10):
+            rl_put(p, {"rid": f"r{i}_{j}", "rtp": "sub", "w": 1, "ps": ["x"]})
+
+    ths = [threading.Thread(target=add, args=(i,)) for i in range(4)]
+    for t in ths:
+        t.start()
+    for t in ths:
+        t.join()
+    assert len(ld_db(p)["rls"]) == 40
+
+
+@pytest.mark.parametrize("nm", ["db.json", "db.sqlite"])
+def test_db_rule_t(tmp_path: Path, nm: str):
+    p = tmp_path / nm
+    rl_put(p, {"rid": "a", "rtp": "sub", "w": 1, "ps": ["../"], "t": ["urldecode", "normpath"]})
+    rl_put(p, {"rid": "b", "rtp": "sub", "w": 1, "ps": ["x"], "t": []})
+    assert rl_get(p, "a")["t"] == ["urldecode", "normpath"]
+    assert "t" not in rl_get(p, "b")
+    assert ld_db(p)["rls"][0]["t"] == ["urldecode", "normpath"]
+    with pytest.raises(CfgErr):
+        rl_put(p, {"rid": "c", "rtp": "sub", "w": 1, "ps": ["x"], "t": "lower"})
+
+
+def test_sq_migrate_t(tmp_path: Path):
+    p = tmp_path / "old.sqlite"
+    cn = sqlite3.connect(str(p))
+    cn.executescript(
+        "CREATE TABLE meta (k TEXT PRIMARY KEY, v NOT NULL);"
+        "CREATE TABLE rls (rid TEXT PRIMARY KEY, pos INTEGER NOT NULL, rtp TEXT NOT NULL,"
+        " w INTEGER NOT NULL, ps TEXT NOT NULL, fld TEXT NOT NULL);"
+        "INSERT INTO meta VALUES ('ver', 3), ('thr', 7), ('ign_ua', '[]');"
+        "INSERT INTO rls VALUES ('a', 0, 'sub', 1, '[\"x\"]', 'req');"
+    )
+    cn.commit()
+    cn.close()
+    assert ld_db(p)["rls"] == [{"rid": "a", "rtp": "sub", "w": 1, "ps": ["x"], "fld": "req"}]
+    rl_put(p, {"rid": "a", "rtp": "sub", "w": 1, "ps": ["x"], "t": ["lower"]})
+    assert rl_get(p, "a")["t"] == ["lower"]
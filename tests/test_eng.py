@@ -0,0 +1,117 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from waflite.cli import run_cli
+from waflite.core import CfgErr, scr
+from waflite.eng import EngC, ld_snap, mk_eng, pf_lits, snap_p, sv_snap
+from waflite.rules import dfl_rls
+
+
+@pytest.mark.parametrize(
+    "p,exp",
+    [
+        (r"\b(UNION|SELECT)\b", ("union", "select")),
+        (r"<\s*script\b", ("script",)),
+        (r"onerror\s*=", ("onerror",)),
+        (r"(\%27)|(\')|(#)", ("%27", "'", "#")),
+        (r"a?b*", ()),
+        (r"(foo|.*)", ()),
+        (r"([", ()),
+    ],
+)
+def test_pf_lits(p, exp):
+    assert pf_lits(p) == exp
+
+
+def test_eng_same_as_scr():
+    rls = dfl_rls()
+    e = mk_eng({"thr": 7, "rls": [r.__dict__ for r in rls]})
+    xs = [
+        "GET / HTTP/1.1",
+        "GET /?id=1 UNION SELECT 1 HTTP/1.1",
+        "GET /?id=1%27--",
+        "GET /?q=<SCRIPT>alert(1)</script>",
+        "GET /../../etc/passwd",
+        "GET /?x=1;bash -i",
+        "GET /?q=ſelect 1 union all",
+        "GET /?q=Kelect",
+    ]
+    for x in xs:
+        rq = {"ip": "", "req": x, "ua": "sqlmap/1.0", "st": 0}
+        assert e.scr(rq) == scr(rls, rq)
+
+
+def test_eng_bad_rule():
+    with pytest.raises(CfgErr):
+        mk_eng({"rls": [{"rid": "a", "rtp": "zzz", "w": 1}]})
+    with pytest.raises(CfgErr):
+        mk_eng({"rls": [{"rid": "a", "rtp": "re", "w": 1, "ps": ["(["]}]}, chk=True)
+
+
+def test_snap_roundtrip_and_stale(tmp_path: Path):
+    dbp = tmp_path / "db.json"
+    dbp.write_text(json.dumps({"thr": 5, "rls": [{"rid": "a", "rtp": "sub", "w": 5, "ps": ["../"]}]}), encoding="utf-8")
+    assert ld_snap(dbp) is None
+    sv_snap(dbp)
+    e = ld_snap(dbp)
+    assert e is not None and e.run({"req": "/../x"})["dec"] == "block"
+
+    dbp.write_text(json.dumps({"thr": 5, "rls": [{"rid": "b", "rtp": "sub", "w": 1, "ps": ["x"]}]}), encoding="utf-8")
+    assert ld_snap(dbp) is None
+
+
+def test_snap_sqlite_by_ver(tmp_path: Path, monkeypatch):
+    from waflite import eng
+    from waflite.db import rl_put
+
+    dbp = tmp_path / "db.sqlite"
+    rl_put(dbp, {"rid": "a", "rtp": "sub", "w": 9, "ps": ["../"]})
+    assert sv_snap(dbp)["sum"] is None
+    monkeypatch.setattr(eng, "ld_db", lambda p: pytest.fail("full db read on snapshot load"))
+    e = ld_snap(dbp)
+    assert e is not None and e.run({"req": "/../x"})["dec"] == "block"
+    monkeypatch.undo()
+    rl_put(dbp, {"rid": "a", "rtp": "sub", "w": 1, "ps": ["../"]})
+    assert ld_snap(dbp) is None
+
+
+def test_engc_reload(tmp_path: Path):
+    dbp = tmp_path / "db.sqlite"
+    ec = EngC(dbp)
+    assert ec.get().run({"req": "/../x"})["dec"] == "allow"
+    from waflite.db import rl_put
+
+    rl_put(dbp, {"rid": "a", "rtp": "sub", "w": 9, "ps": ["../"]})
+    assert ec.get().run({"req": "/../x"})["dec"] == "block"
+
+
+def test_cli_compile_rules(tmp_path: Path, capsys):
+    dbp = tmp_path / "db.json"
+    dbp.write_text('{"thr": 7, "ign_ua": [], "rls": []}', encoding="utf-8")
+    assert run_cli(["compile-rules", "--db", str(dbp)]) == 0
+    assert snap_p(dbp).exists()
+    assert json.loads(capsys.readouterr().out)["n"] == 0
+
+
+def test_eng_transforms(tmp_path: Path):
+    db = {
+        "thr": 4,
+        "rls": [
+            {"rid": "trav", "rtp": "sub", "w": 4, "ps": ["../"], "fld": "req", "t": ["urldecode", "urldecode"]},
+            {"rid": "adm", "rtp": "pfx", "w": 4, "ps": ["/admin"], "fld": "path", "t": ["normpath"]},
+        ],
+    }
+    e = mk_eng(db)
+    assert e.run({"req": "GET /%252e%252e%252fetc HTTP/1.1"})["m"] == ["trav"]
+    assert e.run({"req": "GET /x/..//ADMIN/ HTTP/1.1"})["m"] == ["trav", "adm"]
+    assert e.run({"req": "GET /static//admin.css HTTP/1.1"})["dec"] == "allow"
+    with pytest.raises(CfgErr):
+        mk_eng({"rls": [{"rid": "b", "rtp": "sub", "w": 1, "ps": ["x"], "fld": "body", "t": ["lower"]}]})
+    with pytest.raises(CfgErr):
+        mk_eng({"rls": [{"rid": "b", "rtp": "sub", "w": 1, "ps": ["x"], "t": ["nope"]}]})
+    dbp = tmp_path / "db.json"
+    dbp.write_text(json.dumps(db), encoding="utf-8")
+    sv_snap(dbp)
+    assert ld_snap(dbp).rls[0].t == ("urldecode", "urldecode")
@@ -0,0 +1,55 @@
+from collections import Counter
+import random
+
+from waflite.live import Live, SpSv
+
+
+def test_spsv_exact_under_cap():
+    s = SpSv(8)
+    for x in "aabbbc":
+        s.add(x)
+    assert s.top(2) == [("b", 3, 0), ("a", 2, 0)]
+
+
+def test_spsv_heavy_hitters():
+    rnd = random.Random(1)
+    xs = ["hot"] * 500 + ["warm"] * 200 + [f"n{i}" for i in range(2000)]
+    rnd.shuffle(xs)
+    s = SpSv(16)
+    for x in xs:
+        s.add(x)
+    assert len(s.c) == 16
+    assert sum(s.c.values()) == len(xs)
+    top = s.top(2)
+    assert [x for x, _, _ in top] == ["hot", "warm"]
+    tc = Counter(xs)
+    for x, n, e in s.top(16):
+        assert n - e <= tc[x] <= n
+
+
+def _r(dec, m=()):
+    return {"dec": dec, "scr": 0, "thr": 7, "m": list(m)}
+
+
+def test_live_windows():
+    lv = Live(secs=10, mins=30)
+    t = 6000.0
+    lv.add({"ip": "3.3.3.3", "req": "GET /c HTTP/1.1", "ua": "w"}, _r("block", ["r2"]), t - 600)
+    lv.add({"ip": "1.1.1.1", "req": "GET /a?x=1 HTTP/1.1", "ua": "u"}, _r("block", ["r1"]), t)
+    lv.add({"ip": "1.1.1.1", "req": "GET /a HTTP/1.1", "ua": "u"}, _r("block", ["r1", "r2"]), t + 1)
+    lv.add({"ip": "2.2.2.2", "req": "GET /b HTTP/1.1", "ua": "v"}, _r("allow"), t + 1)
+    j = lv.snap(5, t + 1)
+    assert j["sec"]["scans"][-2:] == [1, 2]
+    assert j["sec"]["blocks"][-2:] == [1, 1]
+    assert j["min"]["scans"][-1] == 3 and j["min"]["blocks"][-1] == 2
+    assert j["rules"]["r1"] == {"1m": 2, "5m": 2, "15m": 2}
+    assert j["rules"]["r2"] == {"1m": 1, "5m": 1, "15m": 2}
+    assert j["top"]["1m"]["ip"] == [["1.1.1.1", 2, 0]]
+    assert j["top"]["1m"]["path"] == [["/a", 2, 0]]
+    assert [x[0] for x in j["top"]["15m"]["ip"]] == ["1.1.1.1", "3.3.3.3"]
+    # an hour later everything has rotated out
+    j = lv.snap(5, t + 3600)
+    assert sum(j["min"]["scans"]) == 0 and j["top"]["15m"]["ip"] == []
+    assert j["rules"]["r1"]["15m"] == 0
+    lv.add({"ip": "9.9.9.9", "req": "GET / HTTP/1.1", "ua": ""}, _r("allow"), t + 1800)
+    assert lv.snap(5, t + 1800)["rules"]["r1"]["15m"] == 0
@@ -0,0 +1,117 @@
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+
+from waflite.io import rd_rqs
+from waflite.load import LdErr, mk_reqs, run_load
+
+
+def _rqs(tmp_path: Path):
+    p = tmp_path / "r.txt"
+    p.write_text("1.1.1.1\tGET /a?q=x y HTTP/1.1\tMozilla\nGET /b HTTP/1.1\n" * 5, encoding="utf-8")
+    return rd_rqs(p, "raw")
+
+
+def test_mk_reqs(tmp_path: Path):
+    rs = mk_reqs(_rqs(tmp_path), "shop", "h:1", "/base")
+    assert len(rs) == 10
+    assert rs[0][0].startswith(b"GET /base/a?q=x%20y HTTP/1.1\r\nHost: h:1\r\nUser-Agent: Mozilla\r\n")
+    rs = mk_reqs(_rqs(tmp_path), "batch", "h", bn=4)
+    assert [k for _, k in rs] == [4, 4, 2]
+    b = rs[0][0]
+    assert json.loads(b[b.index(b"\r\n\r\n") + 4 :])["items"][0]["ua"] == "Mozilla"
+    with pytest.raises(LdErr):
+        mk_reqs(_rqs(tmp_path), "nope", "h")
+
+
+def test_run_load_keepalive(tmp_path: Path):
+    seen = {"conns": 0, "reqs": 0}
+
+    async def h(r: asyncio.StreamReader, w: asyncio.StreamWriter) -> None:
+        seen["conns"] += 1
+        try:
+            while True:
+                hd = await r.readuntil(b"\r\n\r\n")
+                n = 0
+                for ln in hd.split(b"\r\n"):
+                    if ln.lower().startswith(b"content-length:"):
+                        n = int(ln.split(b":")[1])
+                await r.readexactly(n)
+                seen["reqs"] += 1
+                k = seen["reqs"]
+                if k % 7 == 0:
+                    w.write(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n2\r\nok\r\n0\r\n\r\n")
+                elif k % 11 == 0:
+                    w.write(b"HTTP/1.1 500 Err\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                    await w.drain()
+                    w.close()
+                    return
+                elif hd.startswith(b"GET /b"):
+                    w.write(b"HTTP/1.1 403 Forbidden\r\nContent-Length: 3\r\n\r\nno\n")
+                else:
+                    w.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}")
+                await w.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            w.close()
+
+    async def go():
+        s = await asyncio.start_server(h, "127.0.0.1", 0)
+        port = s.sockets[0].getsockname()[1]
+        url = f"http://127.0.0.1:{port}"
+        try:
+            return await run_load(url, mk_reqs(_rqs(tmp_path), "shop", "x"), n=100, conc=8, conns=4, emin=500)
+        finally:
+            s.close()
+
+    r = asyncio.run(go())
+    assert r["sent"] == 100
+    assert sum(r["status"].values()) == 100
+    assert r["errors"] == r["status"]["500"] == 8  # every 11th, except 77 (every 7th is chunked)
+    assert r["status"]["403"] > 0
+    assert r["lines"] == 100
+    assert 0 < r["lat_ms"]["p50"] <= r["lat_ms"]["p99"] <= r["lat_ms"]["max"]
+    assert seen["conns"] <= 4 + 8
+
+
+def test_run_load_refused():
+    async def go():
+        s = await asyncio.start_server(lambda r, w: None, "127.0.0.1", 0)
+        port = s.sockets[0].getsockname()[1]
+        s.close()
+        await s.wait_closed()
+        return await run_load(f"http://127.0.0.1:{port}", [(b"GET / HTTP/1.1\r\n\r\n", 1)], n=3, conc=2)
+
+    r = asyncio.run(go())
+    assert r["errors"] == 3 and r["ok"] == 0
+    with pytest.raises(LdErr):
+        asyncio.run(run_load("ftp://x", [(b"", 1)]))
+
+
+def test_run_load_head(tmp_path: Path):
+    async def h(r: asyncio.StreamReader, w: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                hd = await r.readuntil(b"\r\n\r\n")
+                if hd.startswith(b"HEAD"):  # length of the body a GET would get, no body
+                    w.write(b"HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\n")
+                else:
+                    w.write(b"HTTP/1.1 204 No Content\r\nContent-Length: 5\r\n\r\n")
+                await w.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            w.close()
+
+    p = tmp_path / "h.txt"
+    p.write_text("HEAD /a HTTP/1.1\nGET /b HTTP/1.1\n", encoding="utf-8")
+
+    async def go():
+        s = await asyncio.start_server(h, "127.0.0.1", 0)
+        port = s.sockets[0].getsockname()[1]
+        try:
+            return await run_load(f"http://127.0.0.1:{port}", mk_reqs(rd_rqs(p, "raw"), "shop", "x"), n=6, conc=1, tmo=2)
+        finally:
+            s.close()
+
+    r = asyncio.run(go())
+    assert r["err_kinds"] == {} and r["status"] == {"200": 3, "204": 3}
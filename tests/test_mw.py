@@ -0,0 +1,232 @@
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+from waflite.eng import mk_eng
+from waflite.mw import WafMiddleware
+from waflite.strm import BodyScan
+
+
+async def _app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def _eng():
+    return mk_eng(
+        {
+            "thr": 7,
+            "ign_ua": [],
+            "rls": [
+                {"rid": "sqli_x", "rtp": "re", "w": 7, "ps": ["UNION"], "fld": "req"},
+                {"rid": "ua_x", "rtp": "sub", "w": 7, "ps": ["sqlmap"], "fld": "ua"},
+            ],
+        }
+    )
+
+
+def test_mw_blocks_protected_prefix_only():
+    c = TestClient(WafMiddleware(_app, _eng(), paths=("/shop",)))
+    r = c.get("/shop/x?q=1%20UNION%20SELECT")
+    assert r.status_code == 403
+    assert "sqli_x" in r.text
+    assert c.get("/shop/x?q=1").text == "ok"
+    assert c.get("/other?q=UNION").text == "ok"
+    assert c.get("/shop", headers={"User-Agent": "sqlmap/1.7"}).status_code == 403
+
+
+def test_mw_ruleset_callable():
+    e = _eng()
+    c = TestClient(WafMiddleware(_app, lambda: e))
+    assert c.get("/?q=UNION").status_code == 403
+
+
+async def _echo(scope, receive, send):
+    b = b""
+    while True:
+        m = await receive()
+        if m["type"] == "http.disconnect":
+            raise RuntimeError("client gone")
+        b += m.get("body", b"")
+        if not m.get("more_body", False):
+            break
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+    await send({"type": "http.response.body", "body": b"got " + str(len(b)).encode()})
+
+
+def _beng():
+    return mk_eng(
+        {
+            "thr": 7,
+            "ign_ua": [],
+            "rls": [
+                {"rid": "b_sqli", "rtp": "re", "w": 7, "ps": [r"union\s+select"], "fld": "body"},
+                {"rid": "ck", "rtp": "sub", "w": 7, "ps": ["admin=1"], "fld": "cookie"},
+                {"rid": "ref", "rtp": "sub", "w": 7, "ps": ["evil.example"], "fld": "hdr:referer"},
+            ],
+        }
+    )
+
+
+def test_mw_body_streamed():
+    c = TestClient(WafMiddleware(_echo, _beng()))
+
+    def gen():
+        yield b"q=" + b"a" * 5000 + b" UNI"
+        yield b"ON   SEL"
+        yield b"ECT 1"
+
+    r = c.post("/", content=gen())
+    assert r.status_code == 403
+    assert "b_sqli" in r.text
+    assert c.post("/", content=b"q=union").text == "got 7"
+
+
+def test_mw_body_lim():
+    c = TestClient(WafMiddleware(_echo, _beng(), body_lim=10))
+    assert c.post("/", content=b"a" * 20 + b"union select").status_code == 200
+
+
+def test_mw_body_lookahead_chunks():
+    e = mk_eng({"thr": 7, "rls": [{"rid": "la", "rtp": "re", "w": 7, "ps": [r"select(?=\s)"], "fld": "body"}]})
+    c = TestClient(WafMiddleware(_echo, e))
+
+    def gen():
+        yield b"select 1" + b"x" * 3000
+        yield b"tail"
+
+    assert c.post("/", content=gen()).status_code == 403
+
+    def edge():  # lookahead char only in the next chunk
+        yield b"x" * 100 + b"select"
+        yield b" 1"
+
+    assert c.post("/", content=edge()).status_code == 403
+
+    def no():
+        yield b"x" * 100 + b"select"
+        yield b"ed"
+
+    assert c.post("/", content=no()).status_code == 200
+    c2 = TestClient(WafMiddleware(_echo, e, body_lim=100))
+    assert c2.post("/", content=b"select 1" + b"x" * 3000).status_code == 403
+    # chunk by chunk, as a server delivers them
+    for chs, lim, exp in (
+        ([b"select 1" + b"x" * 3000, b"tail"], 65536, {0}),
+        ([b"x" * 100 + b"select", b" 1"], 65536, {0}),
+        ([b"x" * 100 + b"select", b"ed"], 65536, set()),
+        ([b"select 1" + b"x" * 3000, b"more"], 100, {0}),
+    ):
+        bs = BodyScan(e, lim)
+        for i, ch in enumerate(chs):
+            bs.feed(ch, i < len(chs) - 1)
+        assert bs.hit == exp, chs
+    # \b and $ look past the match end too
+    for p, chs, exp in (
+        (r"union\b", [b"a union", b"s"], set()),
+        (r"union\b", [b"a union", b" select"], {0}),
+        (r"union\B", [b"a union", b" select"], set()),
+        (r"foo$", [b"foo\n", b"bar"], set()),
+        (r"foo$", [b"x foo", b"\n"], {0}),
+    ):
+        e2 = mk_eng({"thr": 7, "rls": [{"rid": "x", "rtp": "re", "w": 7, "ps": [p], "fld": "body"}]})
+        bs = BodyScan(e2, 65536)
+        for i, ch in enumerate(chs):
+            bs.feed(ch, i < len(chs) - 1)
+        assert bs.hit == exp, chs
+
+
+async def _early(scope, receive, send):  # answers after the first chunk, reads on while streaming
+    await receive()
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"a", "more_body": True})
+    while True:
+        m = await receive()
+        if m["type"] == "http.disconnect":
+            raise RuntimeError("client gone")
+        if not m.get("more_body", False):
+            break
+    await send({"type": "http.response.body", "body": b"b"})
+
+
+def _call(app, chs, mt="POST", hs=((b"transfer-encoding", b"chunked"),), out=None):
+    ms = [{"type": "http.request", "body": c, "more_body": i < len(chs) - 1} for i, c in enumerate(chs)]
+    out = [] if out is None else out
+
+    async def rcv():
+        return ms.pop(0)
+
+    async def snd(m):
+        out.append(m)
+
+    sc = {"type": "http", "method": mt, "path": "/", "query_string": b"", "headers": list(hs)}
+    asyncio.run(app(sc, rcv, snd))
+    return out
+
+
+def test_mw_body_block_after_response_start():
+    app = WafMiddleware(_early, _beng(), tm_hdr=False)
+    out = _call(app, [b"q=1 union", b" select 2"])
+    assert [m.get("status") for m in out if m["type"] == "http.response.start"] == [403]
+    assert b"b_sqli" in b"".join(m.get("body", b"") for m in out)
+    out = _call(app, [b"q=1", b" 2"])
+    assert [m.get("status") for m in out if m["type"] == "http.response.start"] == [200]
+    assert b"".join(m.get("body", b"") for m in out) == b"ab"
+
+
+def test_mw_no_body_streams():
+    out = []
+    seen = []
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        for x in (b"a", b"b"):
+            await send({"type": "http.response.body", "body": x, "more_body": True})
+            seen.append(len(out))  # already passed on to the client
+        await send({"type": "http.response.body", "body": b""})
+
+    mw = WafMiddleware(app, _beng(), tm_hdr=False)
+    _call(mw, [b""], "GET", (), out)
+    assert seen == [2, 3]
+    out.clear()
+    seen.clear()
+    _call(mw, [b""], "POST", ((b"content-length", b"0"),), out)
+    assert seen == [2, 3]
+    out.clear()
+    seen.clear()
+    _call(mw, [b"x"], "POST", ((b"content-length", b"1"),), out)  # unread body: held
+    assert seen == [0, 0] and len(out) == 4
+
+
+def test_mw_headers_cookie():
+    c = TestClient(WafMiddleware(_app, _beng()))
+    assert c.get("/", headers={"Cookie": "sid=1; admin=1"}).status_code == 403
+    assert c.get("/", headers={"Referer": "http://evil.example/"}).status_code == 403
+    assert c.get("/", headers={"Referer": "http://ok.example/"}).text == "ok"
+
+
+def _st(v):
+    return {k.strip(): float(d.split("=")[1]) for k, d in (x.split(";") for x in v.split(","))}
+
+
+def test_mw_server_timing_and_log(caplog):
+    c = TestClient(WafMiddleware(_app, _eng(), paths=("/shop",), tm_log=1.0))
+    with caplog.at_level("INFO", logger="waflite.timing"):
+        r = c.get("/shop/x?q=1")
+        b = c.get("/shop/x?q=UNION")
+    t = _st(r.headers["server-timing"])
+    assert set(t) == {"waf-rl", "waf-scr", "waf"}
+    assert 0 <= t["waf-scr"] <= t["waf"]
+    assert "server-timing" in b.headers
+    assert "server-timing" not in c.get("/other").headers
+    recs = [json.loads(x.getMessage()) for x in caplog.records]
+    assert [(x["path"], x["dec"], x["m"]) for x in recs] == [("/shop/x", "allow", []), ("/shop/x", "block", ["sqli_x"])]
+    assert recs[0]["waf_ms"] >= recs[0]["scr_ms"]
+
+    c = TestClient(WafMiddleware(_echo, _beng(), tm_hdr=False))
+    r = c.post("/x", content=b"a" * 100)
+    assert r.text == "got 100" and "server-timing" not in r.headers
+    c = TestClient(WafMiddleware(_echo, _beng()))
+    assert "waf;dur=" in c.post("/x", content=b"a" * 100).headers["server-timing"]
+    assert "waf;dur=" in c.post("/x", content=b"1 union select 2").headers["server-timing"]
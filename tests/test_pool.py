@@ -0,0 +1,140 @@
+import asyncio
+import json
+import os
+import signal
+import time
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+from waflite.api import mk_api
+from waflite.core import CfgErr
+from waflite.pool import PoolErr, ScPool
+
+DB = {
+    "thr": 7,
+    "ign_ua": ["probe"],
+    "rls": [
+        {"rid": "sqli", "rtp": "re", "w": 7, "ps": [r"union\s+select"], "fld": "req"},
+        {"rid": "trav", "rtp": "sub", "w": 4, "ps": ["../"], "fld": "req"},
+        {"rid": "xss", "rtp": "sub", "w": 5, "ps": ["<script"], "fld": "body"},
+    ],
+}
+ITEMS = [
+    {"req": "GET /?id=1 UNION SELECT 1 HTTP/1.1", "ua": "Mozilla/5.0"},
+    {"req": "GET /../../etc/passwd HTTP/1.1", "ua": "probe"},
+    {"req": "POST /c HTTP/1.1", "body": "x=<script>"},
+    {"req": "GET / HTTP/1.1"},
+]
+
+
+def _db(tmp_path: Path) -> Path:
+    p = tmp_path / "db.json"
+    p.write_text(json.dumps(DB), encoding="utf-8")
+    return p
+
+
+def test_api_procs_same_results(tmp_path: Path):
+    dbp = _db(tmp_path)
+    ref = TestClient(mk_api(dbp))
+    with TestClient(mk_api(dbp, procs=2)) as c:
+        for it in ITEMS:
+            assert c.post("/api/v1/scan", json=it).json() == ref.post("/api/v1/scan", json=it).json()
+        r = c.post("/api/v1/batch", json={"items": ITEMS * 10})
+        assert r.json() == ref.post("/api/v1/batch", json={"items": ITEMS * 10}).json()
+        assert c.get("/api/v1/stats").json()["scans"] == 4 + 40
+
+        d = dict(DB, thr=3, ign_ua=[])
+        assert c.put("/api/v1/rules", json=d).status_code == 200
+        assert c.post("/api/v1/scan", json=ITEMS[1]).json()["dec"] == "block"
+
+        d["rls"] = [{"rid": "x", "rtp": "nope", "w": 1, "ps": ["a"]}]
+        dbp.write_text(json.dumps(d), encoding="utf-8")
+        assert c.post("/api/v1/scan", json=ITEMS[0]).status_code == 400
+
+
+def test_pool_batches_under_load(tmp_path: Path):
+    p = ScPool(_db(tmp_path), 1, bn=16)
+
+    async def go():
+        return await asyncio.gather(*(p.run(dict(it)) for it in ITEMS * 50))
+
+    try:
+        rs = asyncio.run(go())
+    finally:
+        p.close()
+    assert [r["dec"] for r in rs[:4]] == ["block", "allow", "allow", "allow"]
+    assert len(rs) == 200
+    assert p.sent < 200 / 4
+
+
+def test_pool_worker_death_and_errors(tmp_path: Path):
+    dbp = _db(tmp_path)
+    p = ScPool(dbp, 1)
+
+    async def go():
+        assert (await p.run(dict(ITEMS[0])))["m"] == ["sqli"]
+        os.kill(p._ws[0].p.pid, signal.SIGKILL)
+        p._ws[0].p.join()
+        with pytest.raises(PoolErr):
+            await p.run(dict(ITEMS[0]))
+        assert (await p.run(dict(ITEMS[0])))["m"] == ["sqli"]  # restarted
+        dbp.write_text(json.dumps(dict(DB, rls=[{"rid": "x", "rtp": "nope", "w": 1}])), encoding="utf-8")
+        with pytest.raises(CfgErr):
+            await p.run(dict(ITEMS[0]))
+
+    try:
+        asyncio.run(go())
+    finally:
+        p.close()
+    with pytest.raises(PoolErr):
+        asyncio.run(p.run({}))
+
+
+def test_api_procs_auth(tmp_path: Path):
+    with TestClient(mk_api(_db(tmp_path), procs=1)) as c:
+        r = c.get("/api/v1/auth", headers={"X-Original-URI": "/?id=1 union select 1"})
+        assert r.status_code == 403
+        assert r.headers["x-waf-rules"] == "sqli"
+
+
+def test_pool_respawn_off_loop(tmp_path: Path):
+    p = ScPool(_db(tmp_path), 2)
+    slow = p._respawn
+    p._respawn = lambda w: (time.sleep(1.5), slow(w))[1]  # type: ignore[method-assign]
+
+    async def go():
+        await p.run_many([dict(x) for x in ITEMS * 4])
+        dead = p._ws[0]
+        os.kill(dead.p.pid, signal.SIGKILL)
+        dead.p.join()
+        with pytest.raises(PoolErr):
+            await p.run_many([dict(x) for x in ITEMS * 4])  # both workers busy: one batch fails
+        t = time.monotonic()
+        assert (await p.run(dict(ITEMS[0])))["m"] == ["sqli"]  # served by the live worker
+        assert time.monotonic() - t < 1.0
+        assert len(p._ws) == 1
+        for _ in range(100):
+            if len(p._ws) == 2:
+                break
+            await asyncio.sleep(0.1)
+        assert len(p._ws) == 2 and dead not in p._ws
+
+    try:
+        asyncio.run(go())
+    finally:
+        p.close()
+
+
+def test_api_procs_pool_err_503(tmp_path: Path):
+    with TestClient(mk_api(_db(tmp_path), procs=1), raise_server_exceptions=False) as c:
+        pool = c.app.state.pool
+
+        async def boom(*a):
+            raise PoolErr("scoring worker died")
+
+        pool.run = pool.run_many = boom
+        assert c.post("/api/v1/scan", json=ITEMS[0]).status_code == 503
+        assert c.post("/api/v1/batch", json={"items": ITEMS}).status_code == 503
+        assert c.get("/api/v1/auth", headers={"X-Original-URI": "/"}).status_code == 503
@@ -0,0 +1,37 @@
+import pstats
+from pathlib import Path
+
+from waflite.cli import run_cli
+from waflite.prof import STAGES, Prof
+
+LN = '10.0.0.1 - - [17/Dec/2025:10:00:01 +0000] "GET /?id=1 UNION SELECT 1 HTTP/1.1" 200 12 "-" "Mozilla/5.0"\n'
+
+
+def test_prof_rqs_and_laps(tmp_path: Path):
+    p = tmp_path / "a.log"
+    p.write_text(LN * 10, encoding="utf-8")
+    pf = Prof()
+    f = pf.wrap("score", lambda x: x * 2)
+    assert [f(1) for _ in pf.rqs(p, "nginx")] == [2] * 10
+    r = pf.rep()
+    assert r["lines"] == 10
+    assert set(r["stages"]) == set(STAGES)
+    assert abs(sum(x["wall_s"] for x in r["stages"].values()) - r["wall_s"]) < 1e-6
+    assert all(r["stages"][k]["wall_s"] > 0 for k in ("read", "parse", "normalize", "score"))
+
+
+def test_cli_profile(tmp_path: Path, capsys):
+    p = tmp_path / "a.log"
+    p.write_text(LN * 50, encoding="utf-8")
+    out = tmp_path / "o.jsonl"
+    assert run_cli(["--in", str(p), "--out", str(out)]) == 0
+    ref = out.read_bytes()
+    ps = tmp_path / "o.pstats"
+    for eng in ("row", "bulk"):
+        args = ["--in", str(p), "--out", str(out), "--eng", eng, "--profile", "--pstats", str(ps), "--tracemalloc", "3"]
+        assert run_cli(args) == 0
+        assert out.read_bytes() == ref
+        err = capsys.readouterr().err
+        assert "lines 50" in err and "peak_rss_mb" in err
+        assert "tracemalloc: peak" in err
+        assert pstats.Stats(str(ps)).total_calls > 0
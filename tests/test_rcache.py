@@ -0,0 +1,20 @@
+from waflite.rcache import RCache, inm_ok
+
+
+def test_inm_ok():
+    assert inm_ok('"a", "b"', '"b"')
+    assert inm_ok('W/"b"', '"b"')
+    assert inm_ok("*", '"b"')
+    assert not inm_ok('"a"', '"b"')
+    assert not inm_ok(None, '"b"')
+
+
+def test_rcache_lru():
+    c = RCache(n=2)
+    c.put("a", b"1", "text/plain")
+    c.put("b", b"2", "text/plain")
+    assert c.get("a") is not None
+    c.put("c", b"3", "text/plain")
+    assert c.get("b") is None
+    assert c.get("a")[1] == b"1"
+    assert c.get("a")[0] != c.get("c")[0]
@@ -0,0 +1,69 @@
+import csv
+import io
+import json
+
+import pytest
+
+from waflite.rep import mk_csv, mk_jl, wr_csv, wr_jsonl
+
+KS = ("ip", "req", "ua", "st", "scr", "dec", "m")
+VALS = [
+    "",
+    "plain",
+    "GET /?q=\"x\" HTTP/1.1",
+    "a,b",
+    "line\nbreak\r",
+    "tab\tback\\slash",
+    "юникод ✓  ",
+    "\x00\x1f\x7f",
+    0,
+    -5,
+    10**20,
+    True,
+    None,
+    1.5,
+    [1, "a"],
+]
+
+
+def _rows():
+    for i, v in enumerate(VALS):
+        r = dict.fromkeys(KS, "x")
+        r[KS[i % len(KS)]] = v
+        yield r
+
+
+def _dw(ks, r):
+    s = io.StringIO()
+    csv.DictWriter(s, fieldnames=list(ks)).writerow(r)
+    return s.getvalue()
+
+
+@pytest.mark.parametrize("r", list(_rows()))
+def test_jl_same_as_dumps(r):
+    assert mk_jl(KS)(r) == json.dumps(r, ensure_ascii=False) + "\n"
+
+
+@pytest.mark.parametrize("r", list(_rows()))
+def test_csv_same_as_dictwriter(r):
+    assert mk_csv(KS)(r) == _dw(KS, r)
+
+
+def test_other_shapes_fall_back():
+    r = {"st": 1, "ip": "a"}
+    assert mk_jl(KS)(r) == json.dumps(r, ensure_ascii=False) + "\n"
+    assert mk_csv(KS)(r) == _dw(KS, r)
+    assert mk_jl(())({}) == "{}\n"
+    assert mk_csv(("a",))({"a": ""}) == _dw(("a",), {"a": ""})
+
+
+def test_writers_unchanged(tmp_path):
+    rs = list(_rows())
+    wr_jsonl(tmp_path / "a.jsonl", rs)
+    assert (tmp_path / "a.jsonl").read_text(encoding="utf-8") == "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rs)
+    wr_csv(tmp_path / "a.csv", rs)
+    s = io.StringIO()
+    w = csv.DictWriter(s, fieldnames=list(KS))
+    w.writeheader()
+    w.writerows(rs)
+    assert (tmp_path / "a.csv").read_bytes() == s.getvalue().encode("utf-8")
@@ -0,0 +1,84 @@
+import json
+from pathlib import Path
+
+from waflite.cli import run_cli
+from waflite.core import nrq, scr, dec
+from waflite.replay import bits, replay
+from waflite.rules import ld_cfg, ld_rls
+
+REQS = [
+    "GET /?id=1 HTTP/1.1",
+    "GET /?id=1' OR 1=1 -- HTTP/1.1",
+    "GET /?q=<script>alert(1)</script> HTTP/1.1",
+    "GET /../../etc/passwd HTTP/1.1",
+    "GET /?q=union select HTTP/1.1",
+    "GET /ok HTTP/1.1",
+] * 7
+
+
+def _corpus(tmp_path: Path) -> Path:
+    p = tmp_path / "c.txt"
+    p.write_text("".join(f"1.1.1.{i}\t{r}\t{'probe' if i % 4 == 0 else 'Mozilla'}\n" for i, r in enumerate(REQS)), encoding="utf-8")
+    return p
+
+
+def _blocks(cfg, p):
+    thr, rls, ign = ld_rls(cfg)
+    n = 0
+    for ln in p.read_text(encoding="utf-8").splitlines():
+        ip, rq, ua = ln.split("\t")
+        s, _ = scr(rls, nrq({"ip": ip, "req": rq, "ua": ua}))
+        if any(x.lower() in ua.lower() for x in ign):
+            s = max(0, s - 3)
+        n += dec(s, thr) == "block"
+    return n
+
+
+def test_bits():
+    assert list(bits(bytes([0, 0b101, 0, 0x80]))) == [8, 10, 31]
+
+
+def test_replay_incremental(tmp_path: Path):
+    p = _corpus(tmp_path)
+    c1 = ld_cfg(None)
+    r = replay(p, "raw", c1, chunk=16)
+    assert r["n"] == len(REQS)
+    assert r["eval"] == len(c1["rls"]) and r["cached"] == 0
+    assert r["blocks"] == _blocks(c1, p)
+    assert r["base"] is None
+
+    c2 = dict(c1, thr=4, ign_ua=["probe"])
+    r = replay(p, "raw", c2, chunk=16)
+    assert r["eval"] == 0
+    assert r["blocks"] == _blocks(c2, p)
+    assert r["base"]["blocks"] == _blocks(c1, p)
+    assert r["base"]["new_blocks"] - r["base"]["unblocks"] == r["blocks"] - r["base"]["blocks"]
+
+    c3 = json.loads(json.dumps(c2))
+    c3["rls"][0]["ps"] = ["passwd"]
+    c3["rls"][1]["w"] = 1
+    out = tmp_path / "d.jsonl"
+    r = replay(p, "raw", c3, out=out)
+    assert r["eval"] == 1
+    assert r["blocks"] == _blocks(c3, p)
+    rows = [json.loads(x) for x in out.read_text(encoding="utf-8").splitlines()]
+    assert len(rows) == r["base"]["new_blocks"] + r["base"]["unblocks"]
+    assert all(x["dec"] != x["dec0"] and x["req"] == REQS[x["i"]] for x in rows)
+
+
+def test_replay_cache_dropped_on_corpus_change(tmp_path: Path):
+    p = _corpus(tmp_path)
+    replay(p, "raw", ld_cfg(None))
+    with p.open("a", encoding="utf-8") as f:
+        f.write("9.9.9.9\tGET /x HTTP/1.1\tz\n")
+    r = replay(p, "raw", ld_cfg(None))
+    assert r["n"] == len(REQS) + 1
+    assert r["eval"] == len(ld_cfg(None)["rls"])
+
+
+def test_cli_replay(tmp_path: Path, capsys):
+    p = _corpus(tmp_path)
+    assert run_cli(["replay", "--in", str(p), "--fmt", "raw", "--cache", str(tmp_path / "rc")]) == 0
+    r = json.loads(capsys.readouterr().out)
+    assert r["n"] == len(REQS)
+    assert (tmp_path / "rc" / "meta.json").exists()
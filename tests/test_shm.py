@@ -0,0 +1,74 @@
+import os
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+from waflite.api import mk_api
+from waflite.eng import EngC
+from waflite.shm import ShmErr, ShmSt
+
+
+@pytest.fixture
+def shm():
+    s = ShmSt.mk(nslot=4)
+    yield s
+    s.close()
+
+
+def test_shm_counts(shm):
+    w = ShmSt.att(shm.name)
+    try:
+        assert w.slot >= 0
+        w.inc(False)
+        w.inc(True)
+        shm.inc(True)
+        sc, bl, n = shm.tot()
+        assert (sc, bl) == (3, 2)
+        assert n == 1  # same pid reuses the slot
+    finally:
+        w.close()
+
+
+def test_shm_gen(shm):
+    assert shm.gen() == 0
+    assert shm.bump() == 1
+    w = ShmSt.att(shm.name)
+    try:
+        assert w.gen() == 1
+    finally:
+        w.close()
+
+
+def test_shm_missing():
+    with pytest.raises(ShmErr):
+        ShmSt.att(f"waflite_nope_{os.getpid()}")
+
+
+def test_engc_gen(tmp_path: Path, shm):
+    dbp = tmp_path / "db.json"
+    dbp.write_text('{"thr": 5, "ign_ua": [], "rls": []}', encoding="utf-8")
+    ec = EngC(dbp, gen=shm.gen, ttl=3600)
+    assert ec.get().thr == 5
+    dbp.write_text('{"thr": 9, "ign_ua": [], "rls": []}', encoding="utf-8")
+    assert ec.get().thr == 5  # same generation, ttl not expired
+    shm.bump()
+    assert ec.get().thr == 9
+
+
+def test_api_shm_stats(tmp_path: Path, shm):
+    dbp = tmp_path / "db.json"
+    dbp.write_text(
+        '{"thr": 5, "ign_ua": [], "rls": [{"rid": "x", "rtp": "sub", "w": 5, "ps": ["UNION"], "fld": "req"}]}',
+        encoding="utf-8",
+    )
+    a = TestClient(mk_api(dbp, shm))
+    b = TestClient(mk_api(dbp, shm))
+    a.post("/api/v1/scan", json={"req": "GET /?q=UNION HTTP/1.1"})
+    b.post("/api/v1/scan", json={"req": "GET / HTTP/1.1"})
+    r = b.get("/api/v1/stats").json()
+    assert (r["scans"], r["blocks"], r["workers"]) == (2, 1, 1)
+    g = shm.gen()
+    assert a.delete("/api/v1/rules/rl/x").status_code == 200
+    assert shm.gen() == g + 1
+    assert b.post("/api/v1/scan", json={"req": "GET /?q=UNION HTTP/1.1"}).json()["dec"] == "allow"
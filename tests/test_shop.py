@@ -0,0 +1,34 @@
+import pytest
+
+from waflite.shop import Cat, _itms, gen_itms
+
+
+def _ref(its, q, cat, srt):
+    q2 = (q or "").strip().lower()
+    if cat and cat != "all":
+        its = [x for x in its if x["cat"] == cat]
+    if q2:
+        its = [x for x in its if q2 in x["nm"].lower() or q2 in x["ds"].lower()]
+    if srt == "pr_asc":
+        its = sorted(its, key=lambda x: x["pr"])
+    elif srt == "pr_desc":
+        its = sorted(its, key=lambda x: -x["pr"])
+    elif srt == "rt_desc":
+        its = sorted(its, key=lambda x: (-float(x["rt"]), -int(x["rv"])))
+    return its
+
+
+@pytest.mark.parametrize("its", [_itms(), gen_itms(3000)])
+def test_cat_flt_same_as_scan(its):
+    ct = Cat(its)
+    qs = ["", "demo", "USB", "ubi", "key 1", "b rub", "  Cable  ", "-", "учебный", "kit 12", "zzz", "1"]
+    for q in qs:
+        for cat in ("all", "auth", "net", "nope", ""):
+            for srt in ("pr_asc", "pr_desc", "rt_desc", "x"):
+                assert ct.flt(q, cat, srt) == _ref(its, q, cat, srt), (q, cat, srt)
+
+
+def test_cat_get():
+    ct = Cat(_itms())
+    assert ct.get(2)["nm"].startswith("YubiKey")
+    assert ct.get(99) is None
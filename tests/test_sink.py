@@ -0,0 +1,92 @@
+import gzip
+from pathlib import Path
+
+import pytest
+
+from waflite.rep import OutErr, wr_csv, wr_jsonl
+from waflite.sink import Sink
+
+
+def _rows(n):
+    return [{"ip": f"1.1.1.{i}", "req": f"GET /{i}?q=é\"x\" HTTP/1.1", "ua": "a,b", "st": 200, "scr": i, "dec": "allow", "m": ""} for i in range(n)]
+
+
+@pytest.mark.parametrize("ofmt,wr", [("jsonl", wr_jsonl), ("csv", wr_csv)])
+def test_sink_same_as_writers(tmp_path: Path, ofmt, wr):
+    rs = _rows(1234)
+    wr(tmp_path / f"a.{ofmt}", rs)
+    with Sink(tmp_path / f"b.{ofmt}", ofmt, bn=100) as s:
+        for r in rs:
+            s.put(r)
+    assert s.n == 1234
+    assert (tmp_path / f"a.{ofmt}").read_bytes() == (tmp_path / f"b.{ofmt}").read_bytes()
+
+
+def test_sink_empty(tmp_path: Path):
+    Sink(tmp_path / "a.jsonl").close()
+    Sink(tmp_path / "a.csv", "csv").close()
+    assert (tmp_path / "a.jsonl").read_bytes() == b""
+    assert not (tmp_path / "a.csv").exists()
+
+
+def test_sink_rot_rows_gz_csv(tmp_path: Path):
+    rs = _rows(25)
+    wr_csv(tmp_path / "all.csv", rs)
+    with Sink(tmp_path / "r.csv", "csv", rot_rows=10, gz=True, bn=7) as s:
+        for r in rs:
+            s.put(r)
+    assert [p.name for p in s.ps] == ["r.00000.csv.gz", "r.00001.csv.gz", "r.00002.csv.gz"]
+    ls = [gzip.decompress(p.read_bytes()).decode().splitlines() for p in s.ps]
+    assert [len(x) for x in ls] == [11, 11, 6]
+    assert all(x[0] == ls[0][0] for x in ls)
+    assert [ls[0][0]] + [y for x in ls for y in x[1:]] == (tmp_path / "all.csv").read_text().splitlines()
+
+
+def test_sink_rot_mb(tmp_path: Path):
+    rs = _rows(3000)
+    with Sink(tmp_path / "r.jsonl", rot_mb=0.1) as s:
+        for r in rs:
+            s.put(r)
+    assert len(s.ps) > 2
+    assert all(p.stat().st_size <= 0.1 * (1 << 20) for p in s.ps)
+    assert b"".join(p.read_bytes() for p in s.ps).count(b"\n") == 3000
+
+
+def test_sink_err(tmp_path: Path):
+    (tmp_path / "d.jsonl").mkdir()
+    s = Sink(tmp_path / "d.jsonl", bn=1)
+    with pytest.raises(OutErr):
+        for r in _rows(1000):
+            s.put(r)
+        s.close()
+
+
+def test_cli_rot_gz(tmp_path: Path):
+    from waflite.cli import run_cli
+
+    ip = tmp_path / "in.txt"
+    ip.write_text("".join(f"GET /{i}?id=1' HTTP/1.1\n" for i in range(30)), encoding="utf-8")
+    assert run_cli(["--in", str(ip), "--fmt", "raw", "--out", str(tmp_path / "o" / "r.jsonl"), "--rot-rows", "20", "--gz"]) == 0
+    ps = sorted((tmp_path / "o").iterdir())
+    assert [p.name for p in ps] == ["r.00000.jsonl.gz", "r.00001.jsonl.gz"]
+    assert sum(gzip.decompress(p.read_bytes()).count(b"\n") for p in ps) == 30
+
+
+def test_cli_err_keeps_old_report(tmp_path: Path):
+    from waflite.cli import run_cli
+
+    op = tmp_path / "r.jsonl"
+    op.write_text("old\n", encoding="utf-8")
+    ip = tmp_path / "in.log"
+    ln = '1.2.3.4 - - [01/Jan/2024:00:00:00 +0000] "GET / HTTP/1.1" 200 1 "-" "ua"\n'
+    ip.write_text(ln * 600 + "garbage\n", encoding="utf-8")
+    for a in (["--in", str(ip)], ["--in", str(tmp_path / "missing.log")]):
+        with pytest.raises(SystemExit):
+            run_cli([*a, "--out", str(op)])
+        assert op.read_text(encoding="utf-8") == "old\n"
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["in.log", "r.jsonl"]
+
+    s = Sink(tmp_path / "a.jsonl", bn=1)
+    s.put(_rows(1)[0])
+    s.abort()
+    assert not (tmp_path / "a.jsonl").exists()
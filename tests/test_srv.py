@@ -0,0 +1,97 @@
+import asyncio
+import json
+import re
+from pathlib import Path
+
+from waflite import srv
+from waflite.srv import Srv
+
+DB = {
+    "thr": 7,
+    "ign_ua": ["probe"],
+    "rls": [
+        {"rid": "sqli", "rtp": "re", "w": 7, "ps": [r"union\s+select"], "fld": "req"},
+        {"rid": "trav", "rtp": "sub", "w": 4, "ps": ["../"], "fld": "req"},
+    ],
+}
+
+
+def _db(tmp_path: Path) -> Path:
+    p = tmp_path / "db.json"
+    p.write_text(json.dumps(DB), encoding="utf-8")
+    return p
+
+
+def test_uds_pipelined(tmp_path: Path):
+    dbp = _db(tmp_path)
+
+    async def go():
+        s = Srv(dbp)
+        ss = await s.start(uds=tmp_path / "w.sock")
+        r, w = await asyncio.open_unix_connection(str(tmp_path / "w.sock"))
+        w.write(
+            b"1.1.1.1\tGET /?id=1 UNION  SELECT 1 HTTP/1.1\tMozilla\n"
+            b"GET /../x HTTP/1.1\n"
+            b"1.1.1.1\tGET /../x?a=union select HTTP/1.1\tprobe\r\n"
+            b"a\tb\n"
+            b"GET / HT"
+        )
+        await w.drain()
+        out = [await r.readline() for _ in range(4)]
+        w.write(b"TP/1.1\n")
+        out.append(await r.readline())
+        assert out == [
+            b"block\t7\tsqli\n",
+            b"allow\t4\ttrav\n",
+            b"block\t8\tsqli,trav\n",
+            b"err\tbad line\n",
+            b"allow\t0\t\n",
+        ]
+        assert (s.n, s.blk) == (4, 2)
+
+        dbp.write_text(json.dumps(dict(DB, thr=3, rls=DB["rls"] + [{"rid": "x", "rtp": "bad", "w": 1}])), encoding="utf-8")
+        w.write(b"GET /../x HTTP/1.1\nGET / HTTP/1.1\n")
+        out = [await r.readline() for _ in range(2)]
+        assert all(x.startswith(b"err\t") for x in out)
+        dbp.write_text(json.dumps(dict(DB, thr=3)) + " ", encoding="utf-8")
+        w.write(b"GET /../x HTTP/1.1\n")
+        assert await r.readline() == b"block\t4\ttrav\n"
+
+        w.write(b"x" * (srv.MAX_LN + 1))
+        assert await r.readline() == b"err\tline too long\n"
+        assert await r.readline() == b""
+        w.close()
+        for x in ss:
+            x.close()
+            await x.wait_closed()
+
+    asyncio.run(go())
+
+
+def test_tcp(tmp_path: Path):
+    async def go():
+        ss = await Srv(_db(tmp_path)).start(host="127.0.0.1")
+        port = ss[0].sockets[0].getsockname()[1]
+        r, w = await asyncio.open_connection("127.0.0.1", port)
+        w.write(b"GET /?q=union select HTTP/1.1\n" * 3)
+        assert [await r.readline() for _ in range(3)] == [b"block\t7\tsqli\n"] * 3
+        w.close()
+        ss[0].close()
+        await ss[0].wait_closed()
+
+    asyncio.run(go())
+
+
+def test_ans_long_line_and_run_err(tmp_path: Path):
+    s = Srv(_db(tmp_path))
+    lns = [b"GET /" + b"x" * srv.MAX_LN, b"GET /../x HTTP/1.1"]
+    assert s.ans(lns) == b"err\tline too long\nallow\t4\ttrav\n"
+
+    class _E:
+        def run(self, d):
+            if "boom" in d["req"]:
+                raise re.error("bad pattern")
+            return {"dec": "allow", "scr": 0, "m": []}
+
+    s.ec.get = lambda: _E()
+    assert s.ans([b"boom", b"GET /"]) == b"err\tbad pattern\nallow\t0\t\n"
@@ -0,0 +1,46 @@
+"""Startup budget: `python -X importtime` for CLI and API worker boot.
+
+Budgets are generous (CI machines are slow); override with
+WAF_IMP_CLI_MS / WAF_IMP_API_MS. The forbidden-module checks are exact.
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _imp(args: list[str]) -> dict[str, int]:
+    """Run python with -X importtime, return cumulative us per module."""
+    r = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    assert r.returncode == 0, r.stderr[-2000:]
+    out: dict[str, int] = {}
+    for ln in r.stderr.splitlines():
+        if not ln.startswith("import time:") or "cumulative" in ln:
+            continue
+        _, cum, mod = ln[len("import time:") :].split("|")
+        out[mod.strip()] = int(cum)
+    return out
+
+
+def test_cli_help_imports():
+    ms = _imp(["-m", "waflite", "--help"])
+    for x in ("fastapi", "jinja2", "uvicorn", "sqlite3", "waflite.webapp", "waflite.api"):
+        assert x not in ms, x
+    assert ms["waflite"] / 1000 < float(os.environ.get("WAF_IMP_CLI_MS", "150"))
+
+
+def test_api_boot_imports():
+    ms = _imp(["-c", "import waflite.apicli, waflite.api"])
+    for x in ("jinja2", "waflite.webapp", "uvicorn"):
+        assert x not in ms, x
+    tot = ms["waflite.apicli"] + ms["waflite.api"]
+    assert tot / 1000 < float(os.environ.get("WAF_IMP_API_MS", "2000"))
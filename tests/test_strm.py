@@ -0,0 +1,74 @@
+import pytest
+
+from waflite.eng import mk_eng
+from waflite.strm import BodyScan, hdr_flds
+
+
+def _eng():
+    return mk_eng(
+        {
+            "thr": 5,
+            "ign_ua": [],
+            "rls": [
+                {"rid": "q", "rtp": "re", "w": 5, "ps": ["req"], "fld": "req"},
+                {"rid": "sqli", "rtp": "re", "w": 5, "ps": [r"union\s+select"], "fld": "body"},
+                {"rid": "xss", "rtp": "sub", "w": 5, "ps": ["<script"], "fld": "body"},
+                {"rid": "uni", "rtp": "sub", "w": 5, "ps": ["привет"], "fld": "body"},
+                {"rid": "end", "rtp": "re", "w": 5, "ps": [r"--$"], "fld": "body"},
+            ],
+        }
+    )
+
+
+def _scan(e, chunks, lim=1 << 20):
+    bs = BodyScan(e, lim=lim)
+    for i, c in enumerate(chunks):
+        bs.feed(c, i < len(chunks) - 1)
+    return {e.rls[i].rid for i in bs.hit}
+
+
+@pytest.mark.parametrize("n", [1, 2, 3, 5, 7])
+def test_body_split_anywhere(n):
+    e = _eng()
+    b = ("x=" + "a" * 3000 + " UNION  SELECT 1 <ScRiPt> привет").encode()
+    cs = [b[i : i + n] for i in range(0, len(b), n)]
+    assert _scan(e, cs) == {"sqli", "xss", "uni"}
+
+
+def test_body_end_anchor_only_at_end():
+    e = _eng()
+    assert _scan(e, [b"a--", b"b"]) == set()
+    assert _scan(e, [b"a-", b"-"]) == {"end"}
+
+
+def test_body_lim():
+    e = _eng()
+    assert _scan(e, [b"a" * 100, b"<script>"], lim=100) == set()
+    assert _scan(e, [b"a" * 100, b"<script>"], lim=200) == {"xss"}
+
+
+def test_body_same_as_full_scan():
+    e = _eng()
+    b = "id=1 union select <script> привет --"
+    bs = BodyScan(e)
+    bs.feed(b.encode()[:10])
+    bs.feed(b.encode()[10:], False)
+    assert e.run({"req": "GET / HTTP/1.1", "body": b}) == e.run({"req": "GET / HTTP/1.1"}, bs.hit)
+    assert e.run({"req": "GET / HTTP/1.1"}, set())["m"] == []
+
+
+def test_hdr_flds():
+    hs = [("Referer", "a"), ("Cookie", "x=1"), ("cookie", "y=2"), ("X-A", "1"), ("x-a", "2")]
+    assert hdr_flds(hs) == {"hdr:referer": "a", "cookie": "x=1; y=2", "hdr:cookie": "x=1, y=2", "hdr:x-a": "1, 2"}
+    assert hdr_flds(hs, {"cookie"}) == {"cookie": "x=1; y=2"}
+
+
+def test_body_form_decoded():
+    e = _eng()
+    b = b"a=1&c=%3CsCrIpT%3E&d=%D0%BF%D1%80%D0%B8%D0%B2%D0%B5%D1%82+x"
+    for n in (1, 2, 3):
+        bs = BodyScan(e, form=True)
+        cs = [b[i : i + n] for i in range(0, len(b), n)]
+        for i, c in enumerate(cs):
+            bs.feed(c, i < len(cs) - 1)
+        assert {e.rls[i].rid for i in bs.hit} == {"xss", "uni"}
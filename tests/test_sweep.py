@@ -0,0 +1,73 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from waflite.cli import run_cli
+from waflite.core import WfErr, dec, nrq, scr
+from waflite.rules import ld_cfg, ld_rls
+from waflite.sweep import OTHER, sweep
+
+REQS = [
+    ("GET /a/x?id=1 HTTP/1.1", "Mozilla"),
+    ("GET /a/y?id=1' OR 1=1 -- HTTP/1.1", "Mozilla"),
+    ("GET /b?q=<script>alert(1)</script> HTTP/1.1", "probe"),
+    ("GET /../../etc/passwd HTTP/1.1", "probe"),
+    ("GET /c?q=union select 1 HTTP/1.1", "Mozilla"),
+    ("GET /d HTTP/1.1", "probe"),
+]
+
+
+def _corpus(tmp_path: Path) -> Path:
+    p = tmp_path / "c.txt"
+    p.write_text("".join(f"1.1.1.1\t{r}\t{u}\n" for r, u in REQS * 3), encoding="utf-8")
+    return p
+
+
+def _blocks(cfg, thr):
+    _, rls, ign = ld_rls(cfg)
+    n = 0
+    for r, u in REQS * 3:
+        s, _ = scr(rls, nrq({"req": r, "ua": u}))
+        if any(x.lower() in u.lower() for x in ign):
+            s = max(0, s - 3)
+        n += dec(s, thr) == "block"
+    return n
+
+
+@pytest.mark.parametrize("eng", ["row", "bulk"])
+def test_sweep_matches_per_thr_scans(tmp_path: Path, eng):
+    cfg = dict(ld_cfg(None), ign_ua=["probe"])
+    r = sweep(_corpus(tmp_path), "raw", cfg, eng=eng)
+    assert r["n"] == 18
+    assert r["blocks"] == _blocks(cfg, r["thr"])
+    assert r["thrs"]
+    for x in r["thrs"]:
+        assert x["blocks"] == _blocks(cfg, x["thr"])
+        assert x["blocks_raw"] == _blocks(dict(cfg, ign_ua=[]), x["thr"])
+        assert x["ign"] == x["blocks_raw"] - x["blocks"]
+
+
+def test_sweep_groups(tmp_path: Path):
+    p = _corpus(tmp_path)
+    cfg = ld_cfg(None)
+    r = sweep(p, "raw", cfg, by="path")
+    assert set(r["groups"]) == {"/a", "/b", "/..", "/c", "/d"}
+    for i, x in enumerate(r["thrs"]):
+        assert sum(g["thrs"][i]["blocks"] for g in r["groups"].values()) == x["blocks"]
+    r = sweep(p, "raw", cfg, by="path", depth=2, max_grp=2)
+    assert list(r["groups"])[-1] == OTHER
+    assert sum(g["n"] for g in r["groups"].values()) == 18
+    r = sweep(p, "raw", cfg, by="rules")
+    assert r["groups"][""]["thrs"][0]["blocks"] == 0
+
+
+def test_sweep_bad_group(tmp_path: Path):
+    with pytest.raises(WfErr):
+        sweep(_corpus(tmp_path), "raw", ld_cfg(None), by="host")
+
+
+def test_cli_sweep(tmp_path: Path, capsys):
+    assert run_cli(["sweep", "--in", str(_corpus(tmp_path)), "--fmt", "raw", "--by", "rules"]) == 0
+    r = json.loads(capsys.readouterr().out)
+    assert r["n"] == 18 and r["by"] == "rules"
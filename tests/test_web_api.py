@@ -28,3 +28,43 @@ def test_api_tst_and_block(tmp_path: Path):
     r2 = c.get("/shop/search?q=1%20UNION%20SELECT%201")
     assert r2.status_code == 403
     assert "blocked by waflite" in r2.text
+
+
+def test_shop_items_etag(tmp_path: Path):
+    dbp = tmp_path / "db.json"
+    dbp.write_text('{"thr": 7, "ign_ua": [], "rls": []}', encoding="utf-8")
+    c = TestClient(mk_app(dbp))
+    r = c.get("/api/shop/items?q=demo&srt=pr_asc")
+    assert r.status_code == 200
+    assert [x["pr"] for x in r.json()["items"]] == sorted(x["pr"] for x in r.json()["items"])
+    r2 = c.get("/api/shop/items?q=demo&srt=pr_asc", headers={"If-None-Match": r.headers["etag"]})
+    assert r2.status_code == 304
+    r3 = c.get("/api/shop/items?q=demo&srt=pr_desc", headers={"If-None-Match": r.headers["etag"]})
+    assert r3.status_code == 200
+
+    r4 = c.get("/shop")
+    assert r4.status_code == 200 and "YubiKey" in r4.text
+    assert c.get("/shop", headers={"If-None-Match": r4.headers["etag"]}).status_code == 304
+
+
+def test_ui_add_set_rules(tmp_path: Path):
+    dbp = tmp_path / "db.json"
+    dbp.write_text('{"thr": 7, "ign_ua": [], "rls": []}', encoding="utf-8")
+    c = TestClient(mk_app(dbp))
+    uas = "\n".join(f"badbot-{i}" for i in range(5000))
+    r = c.post("/ui/rl/add", data={"rid": "ua_list", "rtp": "eq", "wv": 7, "fld": "ua", "ps": uas}, follow_redirects=False)
+    assert r.status_code == 303
+    c.post("/ui/rl/add", data={"rid": "paths", "rtp": "pfx", "wv": 7, "fld": "path", "ps": "/wp-admin\n/.git"})
+    assert c.post("/api/tst", json={"req": "GET / HTTP/1.1", "ua": "BadBot-4999"}).json()["dec"] == "block"
+    assert c.post("/api/tst", json={"req": "GET /.git/config HTTP/1.1"}).json()["m"] == ["paths"]
+    assert c.post("/api/tst", json={"req": "GET /git HTTP/1.1", "ua": "badbot"}).json()["dec"] == "allow"
+    assert "(+4980)" in c.get("/ui").text
+
+
+def test_ui_add_rule_t(tmp_path: Path):
+    dbp = tmp_path / "db.json"
+    dbp.write_text('{"thr": 4, "ign_ua": [], "rls": []}', encoding="utf-8")
+    c = TestClient(mk_app(dbp))
+    c.post("/ui/rl/add", data={"rid": "trav", "rtp": "sub", "wv": 4, "fld": "req", "ps": "../", "t": "urldecode, urldecode"})
+    assert c.post("/api/tst", json={"req": "GET /%252e%252e/ HTTP/1.1"}).json()["m"] == ["trav"]
+    assert "urldecode,urldecode" in c.get("/ui").text
@@ -0,0 +1,68 @@
+from pathlib import Path
+
+import pytest
+
+from waflite.cli import run_cli
+from waflite.io import InpErr, rd_rqs
+from waflite.wfc import Wfc, ingest
+
+LNS = [
+    '10.0.0.1 - - [17/Dec/2025:10:00:01 +0000] "GET /?q=тест HTTP/1.1" 200 12 "-" "Mozilla/5.0"',
+    '10.0.0.2 - - [17/Dec/2025:10:00:02 +0000] "GET /../../etc/passwd HTTP/1.1" 404 0 "-" "curl/8"',
+    '10.0.0.1 - - [17/Dec/2025:10:00:03 +0000] "GET /?id=1 HTTP/1.1" 503 5 "-" "Mozilla/5.0"',
+]
+
+
+def _log(tmp_path: Path) -> Path:
+    p = tmp_path / "a.log"
+    p.write_text("\n".join(LNS) + "\n", encoding="utf-8")
+    return p
+
+
+def test_ingest_roundtrip(tmp_path: Path):
+    p = _log(tmp_path)
+    r = ingest(p, "nginx", tmp_path / "a.wfc")
+    assert r == {"rows": 3, "ips": 2, "uas": 2, "bytes": (tmp_path / "a.wfc").stat().st_size}
+    assert list(rd_rqs(tmp_path / "a.wfc", "wfc")) == list(rd_rqs(p, "nginx"))
+    with Wfc(tmp_path / "a.wfc") as c:
+        assert len(c) == 3
+        assert c.ips == ["10.0.0.1", "10.0.0.2"]
+        assert list(c.st) == [200, 404, 503]
+        assert c.req(0) == "GET /?q=тест HTTP/1.1"
+        assert c.rq(2)["arg:id"] == "1"
+        assert c.rq(0)["ua"] is c.rq(2)["ua"]  # interned
+
+
+def test_ingest_empty(tmp_path: Path):
+    p = tmp_path / "e.log"
+    p.write_text("", encoding="utf-8")
+    ingest(p, "raw", tmp_path / "e.wfc")
+    assert list(rd_rqs(tmp_path / "e.wfc", "wfc")) == []
+
+
+def test_ingest_bad_line_keeps_no_file(tmp_path: Path):
+    p = tmp_path / "b.log"
+    p.write_text("garbage\n", encoding="utf-8")
+    with pytest.raises(InpErr):
+        ingest(p, "nginx", tmp_path / "b.wfc")
+    assert list(tmp_path.iterdir()) == [p]
+
+
+def test_bad_corpus(tmp_path: Path):
+    p = tmp_path / "x.wfc"
+    p.write_bytes(b"nope" * 100)
+    with pytest.raises(InpErr):
+        Wfc(p)
+    good = tmp_path / "g.wfc"
+    ingest(_log(tmp_path), "nginx", good)
+    p.write_bytes(good.read_bytes()[:-5])
+    with pytest.raises(InpErr):
+        Wfc(p)
+
+
+def test_cli_scan_wfc_same_report(tmp_path: Path):
+    p = _log(tmp_path)
+    assert run_cli(["ingest", "--in", str(p), "--out", str(tmp_path / "a.wfc")]) == 0
+    run_cli(["--in", str(p), "--out", str(tmp_path / "a.jsonl")])
+    run_cli(["--in", str(tmp_path / "a.wfc"), "--fmt", "wfc", "--out", str(tmp_path / "b.jsonl"), "--eng", "bulk"])
+    assert (tmp_path / "a.jsonl").read_bytes() == (tmp_path / "b.jsonl").read_bytes()
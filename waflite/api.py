@@ -3,32 +3,55 @@
 Этот модуль дает отдельный API (без UI), чтобы:
 - проверять одиночный запрос (scan)
 - проверять пачку запросов (batch)
-- управлять базой правил (get/put)
-- получать статистику (stats)
+- управлять базой правил (get/put, поштучно add/update/delete)
+- узнавать версию набора правил (ver) без загрузки всей базы
+- получать статистику (stats) и живую картину трафика за последние минуты
+  (stats/live: окна по секундам/минутам, топ IP/путей/UA по блокировкам)
+
+При запуске с несколькими воркерами (`waflite-api --workers N`) статистика
+и номер поколения правил лежат в общей памяти (см. `waflite.shm`): stats
+суммирует все воркеры, а правка правил в одном воркере сразу виден остальным.
+
+С `--procs N` скоринг scan/batch уходит в пул процессов (см. `waflite.pool`):
+regex не держат GIL процесса API, и пропускная способность растет с числом ядер.
+
+scan/batch/auth отдают заголовок `Server-Timing` (время WAF, см. `waflite.tmg`).
 
 API сделан на FastAPI, чтобы:
 - была живая документация Swagger/OpenAPI на `/docs` и `/openapi.json`
 - удобно тестировать через TestClient
 
-Формат базы правил (db json):
+Формат базы правил (db json или SQLite, см. `waflite.db`):
 - thr: int
 - ign_ua: list[str]
-- rls: list[dict] (поля: rid, rtp, w, ps, fld)
+- rls: list[dict] (поля: rid, rtp, w, ps, fld и необязательное t — цепочка
+  преобразований значения: urldecode, lower, normpath, htmlentity)
+
+fld: ip, req, ua, st, body, cookie, hdr:<имя заголовка>, а также части строки
+запроса: method, path, query, args, arg:<имя параметра>.
 """
 
 from __future__ import annotations
 
-import json
 import time
-from dataclasses import asdict
 from pathlib import Path
-from typing import Any, Iterable
+from time import perf_counter
+from typing import TYPE_CHECKING, Any
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from pydantic import BaseModel, Field
 
-from .core import nrq, scr, dec, Rl, CfgErr
-from .webapp import _ld_db, _sv_db, _mk_rl, _waf_do
+from .core import CfgErr
+from .db import DbErr, DupErr, ld_db, sv_db, db_ver, rl_get, rl_put, rl_del
+from .eng import EngC, snap_upd
+from .live import Live
+from .pool import PoolErr
+from .rcache import RCache, jb
+from .strm import hdr_flds
+from .tmg import smp, srv_tm, tlog
+
+if TYPE_CHECKING:
+    from .shm import ShmSt
 
 
 class ScanIn(BaseModel):
@@ -39,12 +62,16 @@ class ScanIn(BaseModel):
         req: Request line, e.g. "GET /?q=x HTTP/1.1".
         ua: User-Agent.
         st: HTTP status if known (0 otherwise).
+        hdrs: Other request headers (for "hdr:<name>" and "cookie" rules).
+        body: Request body text (for "body" rules).
     """
 
     ip: str = ""
     req: str = Field(..., min_length=1)
     ua: str = ""
     st: int = 0
+    hdrs: dict[str, str] = {}
+    body: str = ""
 
 
 class ScanOut(BaseModel):
@@ -85,6 +112,37 @@ class BatchOut(BaseModel):
     n: int
 
 
+class RlIn(BaseModel):
+    """Input schema for single rule.
+
+    Attributes:
+        rid: Rule id.
+        rtp: Rule type ("re", "sub", "eq", "pfx", "cidr").
+        w: Weight.
+        ps: Patterns.
+        fld: Inspected field.
+        t: Transformations before matching ("urldecode", "lower",
+            "normpath", "htmlentity").
+    """
+
+    rid: str = Field(..., min_length=1)
+    rtp: str
+    w: int
+    ps: list[str] = []
+    fld: str = "req"
+    t: list[str] = []
+
+
+class VerOut(BaseModel):
+    """Ruleset version.
+
+    Attributes:
+        ver: Version, changes on every rules db update.
+    """
+
+    ver: int
+
+
 class StatsOut(BaseModel):
     """Simple runtime stats.
 
@@ -92,18 +150,26 @@ class StatsOut(BaseModel):
         up_s: Uptime seconds.
         scans: Total scans handled.
         blocks: Total blocks decided.
+        workers: Live worker processes (1 without shared stats).
     """
 
     up_s: float
     scans: int
     blocks: int
+    workers: int = 1
 
 
-def mk_api(dbp: Path) -> FastAPI:
+def mk_api(dbp: Path, shm: ShmSt | None = None, procs: int = 0, tm_log: float = 0.0) -> FastAPI:
     """Create FastAPI WAF API application.
 
     Args:
         dbp: Path to rules database json.
+        shm: Shared stats block (multi-worker mode): fleet-wide stats and
+            rules reload on generation bump.
+        procs: Score in a pool of this many processes (0: in the server
+            threads).
+        tm_log: Fraction of scan / auth calls to log timings for (see
+            ``waflite.tmg``).
 
     Returns:
         FastAPI app.
@@ -111,12 +177,33 @@ def mk_api(dbp: Path) -> FastAPI:
     app = FastAPI(title="waflite-api", version="0.1.0")
     t0 = time.time()
     st = {"scans": 0, "blocks": 0}
+    lv = Live()
+    app.state.live = lv
+    ec = EngC(dbp, gen=shm.gen if shm is not None else None)
+    rc = RCache()
+    pool = None
+    if procs > 0:
+        from .pool import ScPool
+
+        pool = ScPool(dbp, procs)
+        app.state.pool = pool
+        app.router.add_event_handler("shutdown", pool.close)
+    try:
+        ec.get()  # warm up: picks up snapshot if there is a fresh one
+    except (CfgErr, DbErr):
+        pass
 
     def gdb() -> dict[str, Any]:
-        return _ld_db(dbp)
+        return ld_db(dbp)
 
     def sdb(d: dict[str, Any]) -> None:
-        _sv_db(dbp, d)
+        sv_db(dbp, d)
+
+    def chg() -> None:
+        snap_upd(dbp)
+        rc.clear()
+        if shm is not None:
+            shm.bump()
 
     @app.get("/api/v1/health")
     def health() -> dict[str, Any]:
@@ -128,13 +215,18 @@ def mk_api(dbp: Path) -> FastAPI:
         return {"ok": True}
 
     @app.get("/api/v1/rules")
-    def rules_get() -> dict[str, Any]:
+    def rules_get(req: Request) -> Response:
         """Get rules db.
 
+        Cached per ruleset version; supports ETag / If-None-Match (304).
+
+        Args:
+            req: Request.
+
         Returns:
-            Rules database as dict.
+            Rules database as json.
         """
-        return gdb()
+        return rc.resp(req, ("rules", db_ver(dbp)), lambda: jb(gdb()))
 
     @app.put("/api/v1/rules")
     def rules_put(d: dict[str, Any]) -> dict[str, Any]:
@@ -147,53 +239,307 @@ def mk_api(dbp: Path) -> FastAPI:
             {"ok": True}
 
         Raises:
-            HTTPException: If payload is invalid.
+            HTTPException: 400 if payload is invalid, 503 if the db is
+                busy or unreadable.
         """
         if not isinstance(d, dict):
             raise HTTPException(400, "bad json")
         if "rls" in d and not isinstance(d["rls"], list):
             raise HTTPException(400, "bad rls")
-        sdb(d)
+        try:
+            sdb(d)
+            chg()
+        except (CfgErr, TypeError, ValueError) as e:
+            raise HTTPException(400, str(e)) from e
+        except DbErr as e:
+            raise HTTPException(503, str(e)) from e
         return {"ok": True}
 
-    @app.post("/api/v1/scan", response_model=ScanOut)
-    def scan(x: ScanIn) -> ScanOut:
-        """Scan single request and return decision.
+    @app.get("/api/v1/rules/ver", response_model=VerOut)
+    def rules_ver() -> VerOut:
+        """Get ruleset version (cheap to poll).
+
+        Returns:
+            VerOut.
+        """
+        return VerOut(ver=db_ver(dbp))
+
+    @app.get("/api/v1/rules/rl/{rid}")
+    def rule_get(rid: str) -> dict[str, Any]:
+        """Get single rule.
+
+        Args:
+            rid: Rule id.
+
+        Returns:
+            Rule dict.
+
+        Raises:
+            HTTPException: 404 if rule is missing.
+        """
+        x = rl_get(dbp, rid)
+        if x is None:
+            raise HTTPException(404, "no rule")
+        return x
+
+    @app.post("/api/v1/rules/rl", response_model=VerOut, status_code=201)
+    def rule_add(x: RlIn) -> VerOut:
+        """Add single rule.
+
+        Args:
+            x: Rule.
+
+        Returns:
+            New ruleset version.
+
+        Raises:
+            HTTPException: 409 if rule exists, 400 if rule is invalid,
+                503 if the db is busy or unreadable.
+        """
+        try:
+            rl_put(dbp, x.model_dump(), add=True)
+            chg()
+        except DupErr as e:
+            raise HTTPException(409, str(e)) from e
+        except CfgErr as e:
+            raise HTTPException(400, str(e)) from e
+        except DbErr as e:
+            raise HTTPException(503, str(e)) from e
+        return VerOut(ver=db_ver(dbp))
+
+    @app.put("/api/v1/rules/rl/{rid}", response_model=VerOut)
+    def rule_put(rid: str, x: RlIn) -> VerOut:
+        """Create or update single rule.
 
         Args:
-            x: Scan input.
+            rid: Rule id (must match body).
+            x: Rule.
 
         Returns:
-            ScanOut decision.
+            New ruleset version.
 
         Raises:
-            HTTPException: If config invalid.
+            HTTPException: 400 if rule is invalid, 503 if the db is busy
+                or unreadable.
         """
-        db = gdb()
+        if x.rid != rid:
+            raise HTTPException(400, "rid mismatch")
         try:
-            r = _waf_do(db, x.model_dump())
+            rl_put(dbp, x.model_dump())
+            chg()
         except CfgErr as e:
             raise HTTPException(400, str(e)) from e
+        except DbErr as e:
+            raise HTTPException(503, str(e)) from e
+        return VerOut(ver=db_ver(dbp))
+
+    @app.delete("/api/v1/rules/rl/{rid}", response_model=VerOut)
+    def rule_del(rid: str) -> VerOut:
+        """Delete single rule.
+
+        Args:
+            rid: Rule id.
+
+        Returns:
+            New ruleset version.
 
-        st["scans"] += 1
-        if r["dec"] == "block":
-            st["blocks"] += 1
+        Raises:
+            HTTPException: 404 if rule is missing, 503 if the db is busy
+                or unreadable.
+        """
+        try:
+            if not rl_del(dbp, rid):
+                raise HTTPException(404, "no rule")
+            chg()
+        except DbErr as e:
+            raise HTTPException(503, str(e)) from e
+        return VerOut(ver=db_ver(dbp))
+
+    def sin(x: ScanIn) -> dict[str, Any]:
+        d = x.model_dump()
+        d.update(hdr_flds(d.pop("hdrs").items()))
+        return d
+
+    def cnt(r: dict[str, Any], d: dict[str, Any]) -> None:
+        lv.add(d, r)
+        if shm is not None:
+            shm.inc(r["dec"] == "block")
+        else:
+            st["scans"] += 1
+            if r["dec"] == "block":
+                st["blocks"] += 1
+
+    def sout(r: dict[str, Any], d: dict[str, Any]) -> ScanOut:
+        cnt(r, d)
         return ScanOut(scr=int(r["scr"]), dec=str(r["dec"]), thr=int(r["thr"]), m=list(r["m"]))
 
-    @app.post("/api/v1/batch", response_model=BatchOut)
-    def batch(x: BatchIn) -> BatchOut:
-        """Scan batch of requests.
+    def tmo(resp: Response, r: dict[str, Any], tm: tuple[float, float, float]) -> None:
+        resp.headers["server-timing"] = srv_tm(*tm)
+        if smp(tm_log):
+            tlog("POST", "/api/v1/scan", r, *tm)
+
+    if pool is None:
+
+        def run1(xs: list[dict[str, Any]]) -> tuple[list[dict[str, Any]], tuple[float, float, float]]:
+            t0 = perf_counter()
+            e = ec.get()
+            t1 = perf_counter()
+            rs = [e.run(d) for d in xs]
+            t2 = perf_counter()
+            return rs, (t1 - t0, t2 - t1, t2 - t0)
+
+        @app.post("/api/v1/scan", response_model=ScanOut)
+        def scan(x: ScanIn, resp: Response) -> ScanOut:
+            """Scan single request and return decision.
+
+            Args:
+                x: Scan input.
+                resp: Response (for the Server-Timing header).
+
+            Returns:
+                ScanOut decision.
+
+            Raises:
+                HTTPException: If config invalid.
+            """
+            xs = [sin(x)]
+            try:
+                rs, tm = run1(xs)
+            except CfgErr as e:
+                raise HTTPException(400, str(e)) from e
+            tmo(resp, rs[0], tm)
+            return sout(rs[0], xs[0])
+
+        @app.post("/api/v1/batch", response_model=BatchOut)
+        def batch(x: BatchIn, resp: Response) -> BatchOut:
+            """Scan batch of requests.
+
+            Args:
+                x: Batch input.
+                resp: Response (for the Server-Timing header).
+
+            Returns:
+                BatchOut with per-item decisions.
+
+            Raises:
+                HTTPException: If config invalid.
+            """
+            xs = [sin(it) for it in x.items]
+            try:
+                rs, tm = run1(xs)
+            except CfgErr as e:
+                raise HTTPException(400, str(e)) from e
+            resp.headers["server-timing"] = srv_tm(*tm)
+            out = [sout(r, d) for r, d in zip(rs, xs)]
+            return BatchOut(items=out, n=len(out))
+
+    else:
+
+        @app.post("/api/v1/scan", response_model=ScanOut)
+        async def scan(x: ScanIn, resp: Response) -> ScanOut:
+            """Scan single request and return decision (in the process pool).
+
+            Args:
+                x: Scan input.
+                resp: Response (for the Server-Timing header).
+
+            Returns:
+                ScanOut decision.
+
+            Raises:
+                HTTPException: 400 if config invalid, 503 if the worker failed.
+            """
+            t0 = perf_counter()
+            d = sin(x)
+            try:
+                r = await pool.run(d)
+            except CfgErr as e:
+                raise HTTPException(400, str(e)) from e
+            except PoolErr as e:
+                raise HTTPException(503, str(e)) from e
+            t = perf_counter() - t0
+            tmo(resp, r, (0.0, t, t))
+            return sout(r, d)
+
+        @app.post("/api/v1/batch", response_model=BatchOut)
+        async def batch(x: BatchIn, resp: Response) -> BatchOut:
+            """Scan batch of requests (in the process pool).
+
+            Args:
+                x: Batch input.
+                resp: Response (for the Server-Timing header).
+
+            Returns:
+                BatchOut with per-item decisions.
+
+            Raises:
+                HTTPException: 400 if config invalid, 503 if a worker failed.
+            """
+            t0 = perf_counter()
+            xs = [sin(it) for it in x.items]
+            try:
+                rs = await pool.run_many(xs)
+            except CfgErr as e:
+                raise HTTPException(400, str(e)) from e
+            except PoolErr as e:
+                raise HTTPException(503, str(e)) from e
+            t = perf_counter() - t0
+            resp.headers["server-timing"] = srv_tm(0.0, t, t)
+            out = [sout(r, d) for r, d in zip(rs, xs)]
+            return BatchOut(items=out, n=len(out))
+
+    @app.get("/api/v1/auth", status_code=204, responses={403: {"description": "blocked"}})
+    async def auth(req: Request) -> Response:
+        """Decision for nginx ``auth_request`` (204 allow, 403 block).
+
+        The request is rebuilt from subrequest headers: X-Original-Method,
+        X-Original-URI, X-Real-IP and User-Agent (other headers feed
+        "hdr:<name>" / "cookie" rules). No body, no pydantic models; score
+        and rules go to X-Waf-Score / X-Waf-Rules.
 
         Args:
-            x: Batch input.
+            req: Request.
 
         Returns:
-            BatchOut with per-item decisions.
+            Empty 204 or 403 response.
+
+        Raises:
+            HTTPException: 400 if X-Original-URI is missing or config invalid,
+                503 if the scoring worker failed.
         """
-        out: list[ScanOut] = []
-        for it in x.items:
-            out.append(scan(it))
-        return BatchOut(items=out, n=len(out))
+        h = req.headers
+        uri = h.get("x-original-uri")
+        if not uri:
+            raise HTTPException(400, "no X-Original-URI")
+        mt = h.get("x-original-method", "GET")
+        d = {"ip": h.get("x-real-ip", ""), "req": f"{mt} {uri} HTTP/1.1", "ua": h.get("user-agent", "")}
+        t0 = t1 = perf_counter()
+        try:
+            if pool is None:
+                e = ec.get()
+                t1 = perf_counter()
+                d.update(hdr_flds(h.items(), e.flds))
+                r = e.run(d)
+            else:
+                d.update(hdr_flds(h.items()))
+                r = await pool.run(d)
+        except CfgErr as x:
+            raise HTTPException(400, str(x)) from x
+        except PoolErr as x:
+            raise HTTPException(503, str(x)) from x
+        t2 = perf_counter()
+        cnt(r, d)
+        if smp(tm_log):
+            tlog(mt, uri.split("?", 1)[0], r, t1 - t0, t2 - t1, t2 - t0)
+        return Response(
+            status_code=403 if r["dec"] == "block" else 204,
+            headers={
+                "X-Waf-Decision": r["dec"],
+                "X-Waf-Score": str(r["scr"]),
+                "X-Waf-Rules": ",".join(r["m"]),
+                "Server-Timing": srv_tm(t1 - t0, t2 - t1, t2 - t0),
+            },
+        )
 
     @app.get("/api/v1/stats", response_model=StatsOut)
     def stats() -> StatsOut:
@@ -202,6 +548,24 @@ def mk_api(dbp: Path) -> FastAPI:
         Returns:
             StatsOut.
         """
+        if shm is not None:
+            sc, bl, w = shm.tot()
+            return StatsOut(up_s=time.time() - shm.t0(), scans=sc, blocks=bl, workers=w)
         return StatsOut(up_s=time.time() - t0, scans=int(st["scans"]), blocks=int(st["blocks"]))
 
+    @app.get("/api/v1/stats/live")
+    def stats_live(k: int = 10) -> dict[str, Any]:
+        """Get windowed stats of this worker (see ``waflite.live``).
+
+        Per-second / per-minute scans and blocks, per-rule hits and top
+        blocked ip / path / ua over the last 1, 5 and 15 minutes.
+
+        Args:
+            k: Top items per list (1..100).
+
+        Returns:
+            Live stats.
+        """
+        return lv.snap(max(1, min(k, 100)))
+
     return app
@@ -3,11 +3,9 @@
 from __future__ import annotations
 
 import argparse
+import os
 from pathlib import Path
-
-import uvicorn
-
-from .api import mk_api
+from typing import Any
 
 
 def _ap() -> argparse.ArgumentParser:
@@ -15,9 +13,29 @@ def _ap() -> argparse.ArgumentParser:
     p.add_argument("--host", default="127.0.0.1")
     p.add_argument("--port", default=8010, type=int)
     p.add_argument("--db", default="data/rules_db.json", help="rules db path (json)")
+    p.add_argument("--workers", default=1, type=int, help="worker processes (shared stats and rules reload)")
+    p.add_argument("--procs", default=0, type=int, help="scoring processes per worker (0: score in server threads)")
+    p.add_argument("--tm-log", dest="tm_log", default=0.0, type=float, help="log WAF timings for this fraction of scans")
     return p
 
 
+def _mk_env() -> Any:
+    """App factory for uvicorn workers (config from WAF_DB / WAF_SHM / WAF_PROCS / WAF_TM_LOG)."""
+    from .api import mk_api
+    from .shm import ShmSt
+    from .tmg import log_on
+
+    tl = float(os.environ.get("WAF_TM_LOG", "0"))
+    if tl > 0:
+        log_on()
+    return mk_api(
+        Path(os.environ["WAF_DB"]),
+        ShmSt.att(os.environ["WAF_SHM"]),
+        int(os.environ.get("WAF_PROCS", "0")),
+        tl,
+    )
+
+
 def run_api(argv: list[str] | None = None) -> int:
     """Run API server.
 
@@ -28,6 +46,27 @@ def run_api(argv: list[str] | None = None) -> int:
         Exit code.
     """
     a = _ap().parse_args(argv)
-    app = mk_api(Path(a.db))
+    import uvicorn
+
+    if a.workers > 1:
+        from .shm import ShmSt
+
+        shm = ShmSt.mk(nslot=max(64, 4 * a.workers))
+        os.environ["WAF_DB"] = str(Path(a.db).resolve())
+        os.environ["WAF_SHM"] = shm.name
+        os.environ["WAF_PROCS"] = str(a.procs)
+        os.environ["WAF_TM_LOG"] = str(a.tm_log)
+        try:
+            uvicorn.run("waflite.apicli:_mk_env", factory=True, workers=a.workers, host=a.host, port=a.port, log_level="info")
+        finally:
+            shm.close()
+        return 0
+
+    from .api import mk_api
+    from .tmg import log_on
+
+    if a.tm_log > 0:
+        log_on()
+    app = mk_api(Path(a.db), procs=a.procs, tm_log=a.tm_log)
     uvicorn.run(app, host=a.host, port=a.port, log_level="info")
     return 0
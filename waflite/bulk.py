@@ -0,0 +1,221 @@
+"""Joined-buffer scoring for large offline scans.
+
+``bscr`` scores a chunk of requests at once: every field column is joined
+into one newline-separated buffer and each pattern is searched over the
+whole buffer, so the search is entered about once per hit instead of
+once per row. Match offsets are mapped back to rows with ``bisect`` over
+the row start offsets; after a hit the search resumes at the next row.
+Regexes with prefilter literals (see ``eng.pf_lits``) are cheaper still:
+the literals are found with ``str.find`` over the lowercased buffer and
+the regex only runs on those rows.
+
+Results are exactly those of ``core.scr``:
+
+- a match that crosses a row boundary is re-checked on its row alone;
+- patterns whose meaning depends on the string edges or on neighbouring
+  text (``^``, ``$``, ``\\A``, ``\\Z``, lookarounds) are run per row.
+"""
+
+from __future__ import annotations
+
+import re
+from array import array
+from bisect import bisect_right
+from functools import lru_cache
+from itertools import accumulate
+from typing import Any, Callable, Mapping, Sequence
+
+from .core import TFS, Rl, _rx, mk_mt
+from .eng import _sp, _walk, pf_lits
+
+# search(buf, pos) -> (start, end) of first match at or after pos, or None
+Srch = Callable[[str, int], "tuple[int, int] | None"]
+
+
+@lru_cache(maxsize=4096)
+def _rowonly(p: str) -> bool:
+    """True if regex must run per row (anchors, lookarounds, unparsable)."""
+    try:
+        t = _sp.parse(p, re.IGNORECASE)
+    except (re.error, RecursionError):
+        return True
+    for op, av in _walk(t):
+        if op is _sp.AT and av not in (_sp.AT_BOUNDARY, _sp.AT_NON_BOUNDARY):
+            return True
+        if op in (_sp.ASSERT, _sp.ASSERT_NOT):
+            return True
+    return False
+
+
+def _re_s(p: str) -> Srch:
+    rx = _rx(p)
+
+    def f(b: str, i: int) -> tuple[int, int] | None:
+        m = rx.search(b, i)
+        return m.span() if m else None
+
+    return f
+
+
+def _sub_s(p: str) -> Srch:
+    n = len(p)
+
+    def f(b: str, i: int) -> tuple[int, int] | None:
+        j = b.find(p, i)
+        return (j, j + n) if j >= 0 else None
+
+    return f
+
+
+class _Col:
+    """Joined field column.
+
+    Args:
+        vs: Field values, one per row.
+    """
+
+    def __init__(self, vs: list[str]) -> None:
+        self.vs = vs
+        self.buf = "\n".join(vs)
+        self.st = array("q", accumulate(map((1).__add__, map(len, vs)), initial=0))
+        self.st.pop()
+        self._lc: _Col | None = None
+        self._na: list[int] | None = None
+
+    def lc(self) -> "_Col":
+        """Lowercased column (built once)."""
+        if self._lc is None:
+            self._lc = _Col([v.lower() for v in self.vs])
+        return self._lc
+
+    def na(self) -> list[int]:
+        """Rows with non-ASCII values (literal prefilter does not apply)."""
+        if self._na is None:
+            self._na = [] if self.buf.isascii() else [k for k, v in enumerate(self.vs) if not v.isascii()]
+        return self._na
+
+
+def _hits(c: _Col, f: Srch, one: Callable[[int], bool]) -> list[int]:
+    """Rows of column matched by search function.
+
+    Args:
+        c: Column.
+        f: Buffer search.
+        one: Per-row check, used when a match crosses a row boundary.
+    """
+    r: list[int] = []
+    b, st, vs = c.buf, c.st, c.vs
+    n = len(vs)
+    i = 0
+    while i < n:
+        m = f(b, st[i])
+        if m is None:
+            break
+        k = bisect_right(st, m[0]) - 1
+        if m[1] <= st[k] + len(vs[k]) or one(k):
+            r.append(k)
+        i = k + 1
+    return r
+
+
+def _re_hits(c: _Col, p: str, skip: set[int]) -> set[int]:
+    """Rows matched by regex pattern.
+
+    With prefilter literals (``eng.pf_lits``) the lowercased buffer is
+    scanned for them with ``str.find`` and the regex runs only on candidate
+    rows; otherwise the regex runs over the buffer, or per row when the
+    pattern depends on string edges.
+    """
+    rx = _rx(p)
+    vs = c.vs
+    ls = pf_lits(p)
+    if ls:
+        lc = c.lc()
+        cs = set(c.na())
+        for x in ls:
+            cs.update(_hits(lc, _sub_s(x), lambda k: True))
+        return {k for k in cs - skip if rx.search(vs[k])}
+    if not _rowonly(p):
+        return set(_hits(c, _re_s(p), lambda k: rx.search(vs[k]) is not None))
+    return {k for k in range(len(vs)) if k not in skip and rx.search(vs[k])}
+
+
+def _cv(
+    cvs: dict[tuple[str, tuple[str, ...]], list[str]],
+    rqs: Sequence[Mapping[str, Any]],
+    fld: str,
+    t: tuple[str, ...],
+) -> list[str]:
+    """Column values after transformation chain (each chain prefix built once, see ``core.tv``)."""
+    k = (fld, t)
+    xs = cvs.get(k)
+    if xs is None:
+        if t:
+            f = TFS[t[-1]]
+            xs = [f(v) for v in _cv(cvs, rqs, fld, t[:-1])]
+        else:
+            xs = [str(q.get(fld, "")) for q in rqs]
+        cvs[k] = xs
+    return xs
+
+
+def bhits(rls: Sequence[Rl], rqs: Sequence[Mapping[str, Any]]) -> list[set[int]]:
+    """Rows matched by each rule.
+
+    Args:
+        rls: Rules.
+        rqs: Normalized requests.
+
+    Returns:
+        Per rule: indexes of matched requests.
+
+    Raises:
+        CfgErr: If a rule has unsupported type.
+    """
+    out: list[set[int]] = []
+    cols: dict[tuple[str, tuple[str, ...]], _Col] = {}
+    cvs: dict[tuple[str, tuple[str, ...]], list[str]] = {}
+    for rl in rls:
+        mk_mt(rl)  # CfgErr for unsupported rtp
+        k = (rl.fld, rl.t)
+        c = cols.get(k)
+        if c is None:
+            c = cols[k] = _Col(_cv(cvs, rqs, rl.fld, rl.t))
+        hit: set[int] = set()
+        if rl.rtp not in ("re", "sub"):  # set lookups: per row, no buffer search
+            f = mk_mt(rl)
+            out.append({k for k, v in enumerate(c.vs) if f(v, v.lower())})
+            continue
+        for p in rl.ps:
+            if rl.rtp == "sub":
+                lp = p.lower()
+                lc = c.lc()
+                hit.update(_hits(lc, _sub_s(lp), lambda k: lp in lc.vs[k]))
+            else:
+                hit |= _re_hits(c, p, hit)
+        out.append(hit)
+    return out
+
+
+def bscr(rls: Sequence[Rl], rqs: Sequence[Mapping[str, Any]]) -> list[tuple[int, list[str]]]:
+    """Score many requests at once (same results as ``core.scr`` per row).
+
+    Args:
+        rls: Rules.
+        rqs: Normalized requests.
+
+    Returns:
+        Per request: (score, matched_rule_ids).
+
+    Raises:
+        CfgErr: If a rule has unsupported type.
+    """
+    n = len(rqs)
+    sc = array("q", bytes(8 * n))
+    ms: list[list[str]] = [[] for _ in range(n)]
+    for rl, hit in zip(rls, bhits(rls, rqs)):
+        w = int(rl.w)
+        for k in sorted(hit):
+            sc[k] += w
+            ms[k].append(rl.rid)
+    return [(sc[k], ms[k]) for k in range(n)]
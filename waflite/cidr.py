@@ -0,0 +1,383 @@
+"""Network prefix sets for "cidr" rules.
+
+A "cidr" rule matches when the field holds an address inside one of its
+prefixes. Patterns are prefixes or single addresses (``10.0.0.0/8``,
+``2001:db8::/32``, ``1.2.3.4``) or ``@<path>``: a list file with one
+prefix per line (``#`` comments; lines that do not parse are skipped, as
+threat-intel feeds carry junk). A field value may hold several addresses
+separated by commas or spaces (``X-Forwarded-For``); any of them matches.
+
+Prefixes are merged into sorted, disjoint ranges and looked up with
+``bisect``: O(log n) per address. A list file is compiled once into
+``<path>.cidx`` next to it::
+
+    b"WCIDX1\\0\\0", "=IIQQQQ" (0x01020304, 0, n4, n6, src size, src mtime_ns)
+    lo4 u32[n4], hi4 u32[n4], pad to 8
+    lo6 hi / lo u64[n6], hi6 hi / lo u64[n6]
+
+and mapped read-only, so all workers share one copy in the page cache
+and bisect runs directly over the mapped arrays. The index is rebuilt
+(atomically) when the list file changes; loaded lists are re-checked at
+most once per ``TTL`` seconds, so a feed update reaches running servers
+without a rules edit.
+"""
+
+from __future__ import annotations
+
+import ipaddress
+import mmap
+import os
+import socket
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+from typing import Any, Iterable, Sequence
+
+from .core import CfgErr, Mt
+
+TTL = 1.0
+MAG = b"WCIDX1\0\0"
+_HD = struct.Struct("=IIQQQQ")
+_BOM = 0x01020304
+_M64 = (1 << 64) - 1
+
+Rng = tuple[int, int]
+
+
+def prs_net(s: str) -> tuple[int, Rng]:
+    """Parse prefix or address.
+
+    Args:
+        s: E.g. "10.0.0.0/8", "2001:db8::/32", "1.2.3.4".
+
+    Returns:
+        (4 or 6, (first, last) address as int).
+
+    Raises:
+        ValueError: If s is not a prefix.
+    """
+    a, _, m = s.partition("/")
+    if ":" not in a:
+        try:
+            x = int.from_bytes(socket.inet_pton(socket.AF_INET, a), "big")
+        except OSError as e:
+            raise ValueError(f"bad prefix: {s!r}") from e
+        k = 32 - int(m) if m else 0
+        if not 0 <= k <= 32:
+            raise ValueError(f"bad prefix: {s!r}")
+        x = x >> k << k
+        return 4, (x, x | ((1 << k) - 1))
+    n = ipaddress.ip_network(s, strict=False)
+    return 6, (int(n.network_address), int(n.broadcast_address))
+
+
+def addr(s: str) -> tuple[int, int] | None:
+    """Parse address (IPv4-mapped IPv6 counts as IPv4).
+
+    Returns:
+        (4 or 6, address as int), or None if s is not an address.
+    """
+    if ":" not in s:
+        try:
+            return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, s), "big")
+        except OSError:
+            return None
+    try:
+        a = ipaddress.IPv6Address(s.strip("[]"))
+    except ValueError:
+        return None
+    if a.ipv4_mapped is not None:
+        return 4, int(a.ipv4_mapped)
+    return 6, int(a)
+
+
+def mrg(rs: list[Rng]) -> list[Rng]:
+    """Sort ranges and merge overlapping / adjacent ones."""
+    rs.sort()
+    out: list[Rng] = []
+    for lo, hi in rs:
+        if out and lo <= out[-1][1] + 1:
+            if hi > out[-1][1]:
+                out[-1] = (out[-1][0], hi)
+        else:
+            out.append((lo, hi))
+    return out
+
+
+class _U128:
+    """Read-only sequence of 128-bit ints over two u64 arrays (for bisect)."""
+
+    def __init__(self, h: Sequence[int], lo: Sequence[int]) -> None:
+        self.h = h
+        self.lo = lo
+
+    def __len__(self) -> int:
+        return len(self.h)
+
+    def __getitem__(self, i: int) -> int:
+        return self.h[i] << 64 | self.lo[i]
+
+
+class CTab:
+    """Disjoint sorted ranges (IPv4 and IPv6 kept apart).
+
+    Args:
+        lo4, hi4: IPv4 range bounds.
+        lo6, hi6: IPv6 range bounds.
+    """
+
+    def __init__(
+        self,
+        lo4: Sequence[int] = (),
+        hi4: Sequence[int] = (),
+        lo6: Sequence[int] = (),
+        hi6: Sequence[int] = (),
+    ) -> None:
+        self.t = {4: (lo4, hi4), 6: (lo6, hi6)}
+        self.n4 = len(lo4)
+        self.n6 = len(lo6)
+
+    @classmethod
+    def of(cls, r4: list[Rng], r6: list[Rng]) -> "CTab":
+        """Table from unsorted ranges."""
+        r4, r6 = mrg(r4), mrg(r6)
+        return cls([x for x, _ in r4], [y for _, y in r4], [x for x, _ in r6], [y for _, y in r6])
+
+    def has(self, v: int, x: int) -> bool:
+        """True if address x (version v) is in a range."""
+        lo, hi = self.t[v]
+        i = bisect_right(lo, x) - 1
+        return i >= 0 and x <= hi[i]
+
+
+def rd_lst(lns: Iterable[str]) -> tuple[list[Rng], list[Rng], int]:
+    """Parse list file lines.
+
+    Returns:
+        (IPv4 ranges, IPv6 ranges, lines skipped as unparsable).
+    """
+    r4: list[Rng] = []
+    r6: list[Rng] = []
+    bad = 0
+    for ln in lns:
+        s = ln.split("#", 1)[0].strip()
+        if not s:
+            continue
+        try:
+            v, r = prs_net(s.split()[0])
+        except ValueError:
+            bad += 1
+            continue
+        (r4 if v == 4 else r6).append(r)
+    return r4, r6, bad
+
+
+def idx_p(src: Path) -> Path:
+    """Index path for list file."""
+    return src.with_name(src.name + ".cidx")
+
+
+def _sig(src: Path) -> tuple[int, int]:
+    try:
+        st = src.stat()
+    except OSError as e:
+        raise CfgErr(f"нет файла списка: {src}") from e
+    return st.st_size, st.st_mtime_ns
+
+
+def _pad(b: bytearray) -> None:
+    b.extend(bytes(-len(b) % 8))
+
+
+def bld(src: Path, out: Path | None = None) -> dict[str, Any]:
+    """Compile list file into index.
+
+    Args:
+        src: List file.
+        out: Index path (default: ``<src>.cidx``).
+
+    Returns:
+        Stats: p, n4, n6 (ranges after merging), bad (skipped lines).
+
+    Raises:
+        CfgErr: If the list cannot be read.
+        OSError: If the index cannot be written.
+    """
+    op = out or idx_p(src)
+    sz, mt = _sig(src)
+    try:
+        with src.open("r", encoding="utf-8", errors="replace") as f:
+            r4, r6, bad = rd_lst(f)
+    except OSError as e:
+        raise CfgErr(f"не могу прочитать список: {src}") from e
+    r4, r6 = mrg(r4), mrg(r6)
+    b = bytearray(MAG + _HD.pack(_BOM, 0, len(r4), len(r6), sz, mt))
+    b += array("I", [x for x, _ in r4]).tobytes() + array("I", [y for _, y in r4]).tobytes()
+    _pad(b)
+    for k in (0, 1):
+        b += array("Q", [r[k] >> 64 for r in r6]).tobytes() + array("Q", [r[k] & _M64 for r in r6]).tobytes()
+    tmp = op.with_name(f"{op.name}.{os.getpid()}.tmp")
+    try:
+        tmp.write_bytes(b)
+        os.replace(tmp, op)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return {"p": str(op), "n4": len(r4), "n6": len(r6), "bad": bad}
+
+
+def ld_idx(p: Path, sig: tuple[int, int] | None = None) -> CTab | None:
+    """Map index file.
+
+    Args:
+        p: Index path.
+        sig: Expected (size, mtime_ns) of the list file.
+
+    Returns:
+        Table over the mapping, or None if the file is missing, foreign
+        or stale.
+    """
+    try:
+        with p.open("rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    o = len(MAG) + _HD.size
+    if len(mm) < o or mm[: len(MAG)] != MAG:
+        return None
+    bom, _, n4, n6, sz, mt = _HD.unpack_from(mm, len(MAG))
+    if bom != _BOM or (sig is not None and (sz, mt) != sig):
+        return None
+    o6 = o + 8 * n4 + (-(o + 8 * n4) % 8)
+    if len(mm) < o6 + 32 * n6:
+        return None
+    m = memoryview(mm)
+    lo4 = m[o : o + 4 * n4].cast("I")
+    hi4 = m[o + 4 * n4 : o + 8 * n4].cast("I")
+    q = [m[o6 + 8 * n6 * i : o6 + 8 * n6 * (i + 1)].cast("Q") for i in range(4)]
+    return CTab(lo4, hi4, _U128(q[0], q[1]), _U128(q[2], q[3]))
+
+
+class CFile:
+    """List file with its index, reloaded when the file changes.
+
+    Args:
+        src: List file.
+    """
+
+    def __init__(self, src: Path) -> None:
+        self.src = src
+        self._sig: tuple[int, int] | None = None
+        self._t = 0.0
+        self._tab = CTab()
+        self._lk = threading.Lock()
+        self.get()
+
+    def get(self) -> CTab:
+        """Current table (the file is stat'ed at most once per ``TTL``).
+
+        Raises:
+            CfgErr: If the list file is missing on first load.
+        """
+        if time.monotonic() < self._t:
+            return self._tab
+        with self._lk:
+            if time.monotonic() >= self._t:
+                try:
+                    sig = _sig(self.src)
+                except CfgErr:
+                    if self._sig is None:
+                        raise
+                    sig = self._sig  # deleted under us: keep serving the old table
+                if sig != self._sig:
+                    self._tab = self._ld(sig)
+                    self._sig = sig
+                self._t = time.monotonic() + TTL
+        return self._tab
+
+    def _ld(self, sig: tuple[int, int]) -> CTab:
+        ip = idx_p(self.src)
+        t = ld_idx(ip, sig)
+        if t is not None:
+            return t
+        try:
+            bld(self.src, ip)
+        except OSError:  # read-only dir: keep the table in memory
+            with self.src.open("r", encoding="utf-8", errors="replace") as f:
+                r4, r6, _ = rd_lst(f)
+            return CTab.of(r4, r6)
+        return ld_idx(ip) or CTab()
+
+
+_FS: dict[str, CFile] = {}
+_FLK = threading.Lock()
+
+
+def cfile(p: str) -> CFile:
+    """Shared ``CFile`` for path (one per process)."""
+    k = os.path.abspath(p)
+    f = _FS.get(k)
+    if f is None:
+        with _FLK:
+            f = _FS.get(k)
+            if f is None:
+                f = _FS[k] = CFile(Path(k))
+    return f
+
+
+def ps_sig(ps: Iterable[str]) -> list[list[Any]]:
+    """Identity of the list files of a rule: [path, size, mtime_ns] each."""
+    out = []
+    for p in ps:
+        if p.startswith("@"):
+            try:
+                out.append([p, *_sig(Path(p[1:]))])
+            except CfgErr:
+                out.append([p, -1, -1])
+    return out
+
+
+def mk_cidr(rid: str, ps: Iterable[str]) -> Mt:
+    """Build matcher for "cidr" rule.
+
+    Args:
+        rid: Rule id (for errors).
+        ps: Prefixes and ``@<path>`` list references.
+
+    Returns:
+        Callable (v, lv) -> bool.
+
+    Raises:
+        CfgErr: If a prefix is bad or a list file is missing.
+    """
+    r4: list[Rng] = []
+    r6: list[Rng] = []
+    fs: list[CFile] = []
+    for p in ps:
+        if p.startswith("@"):
+            fs.append(cfile(p[1:]))
+            continue
+        try:
+            v, r = prs_net(p.strip())
+        except ValueError as e:
+            raise CfgErr(f"bad prefix in {rid!r}: {p!r}") from e
+        (r4 if v == 4 else r6).append(r)
+    tab = CTab.of(r4, r6)
+
+    def one(s: str) -> bool:
+        a = addr(s)
+        if a is None:
+            return False
+        if tab.has(*a):
+            return True
+        return any(f.get().has(*a) for f in fs)
+
+    def f(v: str, lv: str) -> bool:
+        if "," in v or " " in v:
+            return any(one(s) for s in v.replace(",", " ").split())
+        return one(v)
+
+    return f
@@ -3,35 +3,332 @@
 from __future__ import annotations
 
 import argparse
+import json
+import sys
 from pathlib import Path
 from typing import Any
 
-from .core import nrq, scr, dec
-from .io import rdln, prs
-from .rep import wr_jsonl, wr_csv
+from .core import scr, dec
+from .io import rd_rqs
+from .sink import Sink
 from .rules import ld_cfg, ld_rls
 
 
 def _ap() -> argparse.ArgumentParser:
     """Build argparse parser."""
-    p = argparse.ArgumentParser(prog="waflite", add_help=True)
+    p = argparse.ArgumentParser(
+        prog="waflite",
+        add_help=True,
+        epilog="commands: " + ", ".join(_CMDS) + " (see `waflite <command> --help`)",
+    )
     p.add_argument("--in", dest="inp", required=True, help="input file path")
-    p.add_argument("--fmt", dest="fmt", default="nginx", choices=["nginx", "raw"])
+    p.add_argument("--fmt", dest="fmt", default="nginx", choices=["nginx", "raw", "wfc"])
     p.add_argument("--out", dest="outp", required=True, help="output file path")
     p.add_argument("--ofmt", dest="ofmt", default="jsonl", choices=["jsonl", "csv"])
     p.add_argument("--cfg", dest="cfg", default="", help="config JSON path (optional)")
+    p.add_argument(
+        "--eng",
+        dest="eng",
+        default="row",
+        choices=["row", "bulk"],
+        help="scoring: per line, or per chunk over joined buffers (same results, faster on big logs)",
+    )
+    p.add_argument("--chunk", dest="chunk", default=5000, type=int, help="lines per chunk for --eng bulk")
+    p.add_argument("--rot-mb", dest="rot_mb", default=0, type=float, help="split report into shards of N MiB (0: off)")
+    p.add_argument("--rot-rows", dest="rot_rows", default=0, type=int, help="split report into shards of N rows (0: off)")
+    p.add_argument("--gz", dest="gz", action="store_true", help="gzip report (each shard)")
+    p.add_argument("--profile", action="store_true", help="print per-stage wall/cpu time, lines/s, peak RSS to stderr")
+    p.add_argument("--pstats", default="", help="dump cProfile stats to this file")
+    p.add_argument("--tracemalloc", dest="tm", default=0, type=int, help="print top N allocation sites to stderr")
+    return p
+
+
+def _ap_cmp() -> argparse.ArgumentParser:
+    """Build argparse parser for `compile-rules`."""
+    p = argparse.ArgumentParser(prog="waflite compile-rules", add_help=True)
+    p.add_argument("--db", default="data/rules_db.json", help="rules db path (json or sqlite)")
+    p.add_argument("--out", dest="outp", default="", help="snapshot path (default: <db>.snap)")
+    return p
+
+
+def run_cmp(argv: list[str] | None = None) -> int:
+    """Compile rules db into snapshot (`waflite compile-rules`).
+
+    Args:
+        argv: Arguments list without program name and command.
+
+    Returns:
+        Exit code.
+    """
+    from .core import WfErr
+    from .eng import sv_snap
+
+    a = _ap_cmp().parse_args(argv)
+    try:
+        r = sv_snap(Path(a.db), Path(a.outp) if a.outp else None)
+    except WfErr as e:
+        raise SystemExit(f"err: {e}") from e
+    print(json.dumps(r, ensure_ascii=False))
+    return 0
+
+
+def _ap_rpl() -> argparse.ArgumentParser:
+    """Build argparse parser for `replay`."""
+    p = argparse.ArgumentParser(prog="waflite replay", add_help=True)
+    p.add_argument("--in", dest="inp", required=True, help="input file path (corpus)")
+    p.add_argument("--fmt", dest="fmt", default="nginx", choices=["nginx", "raw", "wfc"])
+    p.add_argument("--cfg", dest="cfg", default="", help="config JSON path (optional)")
+    p.add_argument("--base", dest="base", default="", help="baseline config (default: config of previous replay)")
+    p.add_argument("--cache", dest="cache", default="", help="bitmap cache dir (default: <in>.replay)")
+    p.add_argument("--out", dest="outp", default="", help="write changed decisions as JSONL (optional)")
+    p.add_argument("--chunk", dest="chunk", default=5000, type=int, help="lines per evaluation chunk")
+    return p
+
+
+def run_rpl(argv: list[str] | None = None) -> int:
+    """Replay rules over corpus from cached match bitmaps (`waflite replay`).
+
+    Args:
+        argv: Arguments list without program name and command.
+
+    Returns:
+        Exit code.
+    """
+    from .core import WfErr
+    from .replay import replay
+
+    a = _ap_rpl().parse_args(argv)
+    try:
+        r = replay(
+            Path(a.inp),
+            a.fmt,
+            ld_cfg(Path(a.cfg) if a.cfg.strip() else None),
+            ld_cfg(Path(a.base)) if a.base.strip() else None,
+            Path(a.cache) if a.cache else None,
+            Path(a.outp) if a.outp else None,
+            a.chunk,
+        )
+    except (WfErr, OSError) as e:
+        raise SystemExit(f"err: {e}") from e
+    print(json.dumps(r, ensure_ascii=False))
+    return 0
+
+
+def _ap_ing() -> argparse.ArgumentParser:
+    """Build argparse parser for `ingest`."""
+    p = argparse.ArgumentParser(prog="waflite ingest", add_help=True)
+    p.add_argument("--in", dest="inp", required=True, help="input log path")
+    p.add_argument("--fmt", dest="fmt", default="nginx", choices=["nginx", "raw"])
+    p.add_argument("--out", dest="outp", required=True, help="corpus path (.wfc)")
     return p
 
 
+def run_ing(argv: list[str] | None = None) -> int:
+    """Convert log into ingested corpus (`waflite ingest`).
+
+    Args:
+        argv: Arguments list without program name and command.
+
+    Returns:
+        Exit code.
+    """
+    from .core import WfErr
+    from .wfc import ingest
+
+    a = _ap_ing().parse_args(argv)
+    try:
+        r = ingest(Path(a.inp), a.fmt, Path(a.outp))
+    except (WfErr, OSError) as e:
+        raise SystemExit(f"err: {e}") from e
+    print(json.dumps(r, ensure_ascii=False))
+    return 0
+
+
+def _ap_cidr() -> argparse.ArgumentParser:
+    """Build argparse parser for `cidr`."""
+    p = argparse.ArgumentParser(prog="waflite cidr", add_help=True)
+    p.add_argument("--in", dest="inp", required=True, help="prefix list path (one per line)")
+    p.add_argument("--out", dest="outp", default="", help="index path (default: <in>.cidx)")
+    return p
+
+
+def run_cidr(argv: list[str] | None = None) -> int:
+    """Compile prefix list into index for "cidr" rules (`waflite cidr`).
+
+    Args:
+        argv: Arguments list without program name and command.
+
+    Returns:
+        Exit code.
+    """
+    from .cidr import bld
+    from .core import WfErr
+
+    a = _ap_cidr().parse_args(argv)
+    try:
+        r = bld(Path(a.inp), Path(a.outp) if a.outp else None)
+    except (WfErr, OSError) as e:
+        raise SystemExit(f"err: {e}") from e
+    print(json.dumps(r, ensure_ascii=False))
+    return 0
+
+
+def _ap_swp() -> argparse.ArgumentParser:
+    """Build argparse parser for `sweep`."""
+    p = argparse.ArgumentParser(prog="waflite sweep", add_help=True)
+    p.add_argument("--in", dest="inp", required=True, help="input file path")
+    p.add_argument("--fmt", dest="fmt", default="nginx", choices=["nginx", "raw", "wfc"])
+    p.add_argument("--cfg", dest="cfg", default="", help="config JSON path (optional)")
+    p.add_argument("--by", dest="by", default="none", choices=["none", "path", "rules"], help="histogram per group")
+    p.add_argument("--depth", dest="depth", default=1, type=int, help="path segments per group for --by path")
+    p.add_argument("--max-groups", dest="max_grp", default=100, type=int, help="max groups (rest go to \"(other)\")")
+    p.add_argument("--eng", dest="eng", default="row", choices=["row", "bulk"])
+    p.add_argument("--chunk", dest="chunk", default=5000, type=int, help="lines per chunk for --eng bulk")
+    return p
+
+
+def run_swp(argv: list[str] | None = None) -> int:
+    """Score log once and print blocks for every threshold (`waflite sweep`).
+
+    Args:
+        argv: Arguments list without program name and command.
+
+    Returns:
+        Exit code.
+    """
+    from .core import WfErr
+    from .sweep import sweep
+
+    a = _ap_swp().parse_args(argv)
+    try:
+        r = sweep(
+            Path(a.inp),
+            a.fmt,
+            ld_cfg(Path(a.cfg) if a.cfg.strip() else None),
+            a.by,
+            a.depth,
+            a.max_grp,
+            a.eng,
+            a.chunk,
+        )
+    except (WfErr, OSError) as e:
+        raise SystemExit(f"err: {e}") from e
+    print(json.dumps(r, ensure_ascii=False))
+    return 0
+
+
+def _ap_srv() -> argparse.ArgumentParser:
+    """Build argparse parser for `serve`."""
+    p = argparse.ArgumentParser(prog="waflite serve", add_help=True)
+    p.add_argument("--db", default="data/rules_db.json", help="rules db path (json or sqlite)")
+    p.add_argument("--uds", default="", help="unix socket path")
+    p.add_argument("--host", default="", help="tcp host (optional)")
+    p.add_argument("--port", default=0, type=int, help="tcp port (optional)")
+    return p
+
+
+def run_srv(argv: list[str] | None = None) -> int:
+    """Run line-protocol decision server (`waflite serve`).
+
+    Args:
+        argv: Arguments list without program name and command.
+
+    Returns:
+        Exit code.
+    """
+    from .srv import serve
+
+    a = _ap_srv().parse_args(argv)
+    if not a.uds and not (a.host or a.port):
+        raise SystemExit("err: need --uds and/or --host/--port")
+    try:
+        serve(Path(a.db), Path(a.uds) if a.uds else None, a.host, a.port)
+    except OSError as e:
+        raise SystemExit(f"err: {e}") from e
+    return 0
+
+
+def _ap_ld() -> argparse.ArgumentParser:
+    """Build argparse parser for `loadtest`."""
+    p = argparse.ArgumentParser(prog="waflite loadtest", add_help=True)
+    p.add_argument("--url", required=True, help="target base url, e.g. http://127.0.0.1:8010")
+    p.add_argument("--in", dest="inp", required=True, help="input file path")
+    p.add_argument("--fmt", dest="fmt", default="nginx", choices=["nginx", "raw", "wfc"])
+    p.add_argument("--mode", default="scan", choices=["scan", "batch", "shop"])
+    p.add_argument("--conc", default=32, type=int, help="requests in flight")
+    p.add_argument("--conns", default=0, type=int, help="keep-alive connections (0: --conc)")
+    p.add_argument("--rate", default=0, type=float, help="target requests/s (0: max)")
+    p.add_argument("--n", default=0, type=int, help="requests to send (0: each line once)")
+    p.add_argument("--dur", default=0, type=float, help="stop after N seconds (0: off)")
+    p.add_argument("--bn", default=50, type=int, help="lines per call for --mode batch")
+    p.add_argument("--lim", default=100_000, type=int, help="max log lines to load")
+    p.add_argument("--timeout", dest="tmo", default=10.0, type=float, help="per-request timeout, s")
+    return p
+
+
+def run_ld(argv: list[str] | None = None) -> int:
+    """Replay log against a running server and print stats (`waflite loadtest`).
+
+    Args:
+        argv: Arguments list without program name and command.
+
+    Returns:
+        Exit code (1 if any request failed).
+    """
+    from .core import WfErr
+    from .load import loadtest
+
+    a = _ap_ld().parse_args(argv)
+    try:
+        r = loadtest(
+            a.url,
+            Path(a.inp),
+            a.fmt,
+            a.mode,
+            a.lim,
+            a.bn,
+            n=a.n,
+            conc=a.conc,
+            conns=a.conns,
+            rate=a.rate,
+            dur=a.dur,
+            tmo=a.tmo,
+        )
+    except (WfErr, OSError) as e:
+        raise SystemExit(f"err: {e}") from e
+    print(json.dumps(r, ensure_ascii=False))
+    return 1 if r["errors"] else 0
+
+
+_CMDS = {
+    "compile-rules": run_cmp,
+    "replay": run_rpl,
+    "ingest": run_ing,
+    "cidr": run_cidr,
+    "sweep": run_swp,
+    "serve": run_srv,
+    "loadtest": run_ld,
+}
+
+
 def run_cli(argv: list[str] | None = None) -> int:
     """Run CLI.
 
+    The first argument may name a subcommand from `_CMDS`
+    (`compile-rules`, `replay`, `ingest`, `cidr`, `sweep`,
+    `serve`, `loadtest`); the rest of the arguments go to it.
+    Otherwise the arguments are for the log scanner.
+
     Args:
         argv: Arguments list without program name.
 
     Returns:
         Exit code (0 ok, 2 on handled error).
     """
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] in _CMDS:
+        return _CMDS[argv[0]](argv[1:])
     a = _ap().parse_args(argv)
     ip = Path(a.inp)
     op = Path(a.outp)
@@ -40,33 +337,80 @@ def run_cli(argv: list[str] | None = None) -> int:
     cfg = ld_cfg(cp)
     thr, rls, ign_ua = ld_rls(cfg)
 
-    rows: list[dict[str, Any]] = []
+    pf = None
+    rqs = rd_rqs(ip, a.fmt)
+    score, bscore = scr, None
+    if a.profile:
+        from .prof import Prof
+
+        pf = Prof()
+        rqs = pf.rqs(ip, a.fmt)
+        score = pf.wrap("score", scr)
+    if a.eng == "bulk":
+        from .bulk import bscr
+
+        bscore = bscr if pf is None else pf.wrap("score", bscr)
+    cpr = None
+    if a.pstats:
+        import cProfile
+
+        cpr = cProfile.Profile()
+    tm = None
+    if a.tm:
+        from .prof import TmPk
+
+        tm = TmPk()
+        rqs = tm.it(rqs)
+
+    sk = Sink(op, a.ofmt, rot_mb=a.rot_mb, rot_rows=a.rot_rows, gz=a.gz)  # in place only on success
+    put, close = sk.put, sk.close
+    if pf is not None:
+        put, close = pf.wrap("write", sk.put), pf.wrap("write", sk.close)
+
+    def add(rq: dict[str, Any], s: int, ms: list[str]) -> None:
+        ua = rq.get("ua", "")
+        if any(x.lower() in ua.lower() for x in ign_ua):
+            s = max(0, s - 3)
+
+        put(
+            {
+                "ip": rq.get("ip", ""),
+                "req": rq.get("req", ""),
+                "ua": rq.get("ua", ""),
+                "st": rq.get("st", 0),
+                "scr": s,
+                "dec": dec(s, thr),
+                "m": ",".join(ms),
+            }
+        )
+
     try:
-        for ln in rdln(ip):
-            pr = prs(a.fmt, ln).asd()
-            rq = nrq(pr)
-
-            s, ms = scr(rls, rq)
-            ua = rq.get("ua", "")
-            if any(x.lower() in ua.lower() for x in ign_ua):
-                s = max(0, s - 3)
-
-            rows.append(
-                {
-                    "ip": rq.get("ip", ""),
-                    "req": rq.get("req", ""),
-                    "ua": rq.get("ua", ""),
-                    "st": rq.get("st", 0),
-                    "scr": s,
-                    "dec": dec(s, thr),
-                    "m": ",".join(ms),
-                }
-            )
+        if cpr is not None:
+            cpr.enable()
+        if bscore is not None:
+            ch: list[dict[str, Any]] = []
+            for rq in rqs:
+                ch.append(rq)
+                if len(ch) >= a.chunk:
+                    for rq, (s, ms) in zip(ch, bscore(rls, ch)):
+                        add(rq, s, ms)
+                    ch = []
+            for rq, (s, ms) in zip(ch, bscore(rls, ch)):
+                add(rq, s, ms)
+        else:
+            for rq in rqs:
+                s, ms = score(rls, rq)
+                add(rq, s, ms)
+        close()
+        if cpr is not None:
+            cpr.disable()
+        if pf is not None:
+            pf.prn()
+        if tm is not None:
+            tm.prn(a.tm)
+        if cpr is not None:
+            cpr.dump_stats(a.pstats)
     except Exception as e:
+        sk.abort()
         raise SystemExit(f"err: {e}") from e
-
-    if a.ofmt == "jsonl":
-        wr_jsonl(op, rows)
-    else:
-        wr_csv(op, rows)
     return 0
@@ -5,8 +5,13 @@ The module contains scoring rules and request normalization utilities.
 
 from __future__ import annotations
 
+import html
+import re
+from bisect import bisect_right
 from dataclasses import dataclass
-from typing import Iterable, Mapping, Any
+from functools import lru_cache
+from typing import Callable, Iterable, Mapping, Any
+from urllib.parse import parse_qsl, unquote, unquote_plus
 
 
 class WfErr(Exception):
@@ -23,10 +28,17 @@ class Rl:
 
     Args:
         rid: Rule identifier.
-        rtp: Rule type (e.g. "re", "sub").
+        rtp: Rule type: "re" (regex), "sub" (substring), "eq" (whole
+            value, stripped, case-insensitive), "pfx" (value prefix,
+            case-insensitive) or "cidr" (network prefixes, see
+            ``waflite.cidr``).
         w: Rule weight (score add).
         ps: Patterns (regexes or substrings depending on type).
-        fld: Field name in request dict to inspect.
+        fld: Field name in request dict to inspect: "ip", "req", "ua",
+            "st", "body", "cookie", "hdr:<name>" (lowercase header name)
+            or a field derived from "req" (see ``Rq``).
+        t: Transformations applied to the field value before matching, in
+            order (names from ``TFS``, e.g. ("urldecode", "lower")).
     """
 
     rid: str
@@ -34,23 +46,210 @@ class Rl:
     w: int
     ps: tuple[str, ...]
     fld: str = "req"
+    t: tuple[str, ...] = ()
 
+    def __hash__(self) -> int:
+        # matchers are cached by rule (``_mt``): keep hashing O(1) for
+        # "eq" / "pfx" / "cidr" rules with huge pattern lists
+        return hash((self.rid, self.rtp, self.w, self.fld, self.t, len(self.ps), self.ps[:4]))
 
-def nrq(d: Mapping[str, Any]) -> dict[str, Any]:
+
+_DRV = frozenset(("method", "path", "query", "args"))
+
+
+class Rq(dict):
+    """Normalized request with lazily derived fields.
+
+    Fields derived from the request line are computed on first access
+    (``rq[k]`` or ``rq.get(k)``), all at once, URL-decoded once and stored
+    in the dict, so rules on them cost nothing unless some rule uses them:
+
+    - ``method``: e.g. "GET"
+    - ``path``: URL-decoded path, without query
+    - ``query``: decoded query string (``+`` is a space)
+    - ``args``: all decoded query values, joined with "\n"
+    - ``arg:<name>``: decoded values of one query parameter, joined with "\n"
+    """
+
+    def __missing__(self, k: str) -> Any:
+        if k not in _DRV and not (isinstance(k, str) and k.startswith("arg:")):
+            raise KeyError(k)
+        if "method" not in self:
+            self._prs()
+        return self.setdefault(k, "")
+
+    def get(self, k: str, d: Any = None) -> Any:
+        try:
+            return self[k]
+        except KeyError:
+            return d
+
+    def _prs(self) -> None:
+        """Split request line into derived fields."""
+        ln = str(dict.get(self, "req", ""))
+        m, _, t = ln.partition(" ")
+        h = t.rfind(" HTTP/")
+        if h >= 0:
+            t = t[:h]
+        p, _, q = t.partition("?")
+        av: dict[str, list[str]] = {}
+        for n, v in parse_qsl(q, keep_blank_values=True):
+            av.setdefault(n, []).append(v)
+        self["method"] = m
+        self["path"] = unquote(p)
+        self["query"] = unquote_plus(q)
+        self["args"] = "\n".join(v for vs in av.values() for v in vs)
+        for n, vs in av.items():
+            self.setdefault("arg:" + n, "\n".join(vs))
+
+
+def nrq(d: Mapping[str, Any]) -> Rq:
     """Normalize request dict.
 
     Args:
         d: Request mapping (may be partial).
 
     Returns:
-        New dict with stable keys: ip, req, ua, st.
+        New ``Rq`` with stable keys: ip, req, ua, st; "body", "cookie" and
+        "hdr:<name>" are kept (as str) when present.
     """
-    return {
+    r = Rq({
         "ip": str(d.get("ip", "")),
         "req": str(d.get("req", "")),
         "ua": str(d.get("ua", "")),
         "st": int(d.get("st", 0)) if str(d.get("st", "")).isdigit() else 0,
-    }
+    })
+    for k, v in d.items():
+        if k in ("body", "cookie") or k.startswith("hdr:"):
+            r[k] = str(v)
+    return r
+
+
+_SL = re.compile(r"/{2,}")
+_DOT = re.compile(r"/\.(?=[/?#\s]|$)")
+_UP = re.compile(r"/(?!\.\.(?:[/?#\s]|$))[^/?#\s]+/\.\.(?=([/?#\s]|$))")
+
+
+def npath(s: str) -> str:
+    """Normalize paths in value: "\\" to "/", collapse "//", drop "/." and
+    resolve "dir/.." (a leading "/.." stays, so traversal remains visible).
+    """
+    s = _DOT.sub("", _SL.sub("/", s.replace("\\", "/")))
+    while True:
+        s2 = _UP.sub(lambda m: "" if m.group(1) == "/" else "/", s)
+        if s2 == s:
+            return s
+        s = s2
+
+
+TFS: dict[str, Callable[[str], str]] = {
+    "urldecode": unquote_plus,
+    "lower": str.lower,
+    "normpath": npath,
+    "htmlentity": lambda s: html.unescape(s) if "&" in s else s,
+}
+
+
+def tv(rq: Mapping[str, Any], fld: str, t: tuple[str, ...], vs: dict[tuple[str, tuple[str, ...]], str]) -> str:
+    """Field value after transformation chain.
+
+    Every chain prefix is computed once per ``vs``: rules with chains
+    ("urldecode",) and ("urldecode", "lower") on one field decode it once.
+
+    Args:
+        rq: Request mapping.
+        fld: Field name.
+        t: Transformation names (see ``TFS``).
+        vs: Per-request memo, keyed by (fld, chain prefix).
+
+    Returns:
+        Transformed value.
+    """
+    k = (fld, t)
+    v = vs.get(k)
+    if v is None:
+        v = vs[k] = TFS[t[-1]](tv(rq, fld, t[:-1], vs)) if t else str(rq.get(fld, ""))
+    return v
+
+
+@lru_cache(maxsize=None)
+def _rx(p: str) -> re.Pattern[str]:
+    """Compile rule regex (case-insensitive), once per pattern."""
+    return re.compile(p, re.IGNORECASE)
+
+
+Mt = Callable[[str, str], bool]
+
+
+def pfx_tab(ps: Iterable[str]) -> tuple[str, ...]:
+    """Sorted lowercase prefixes, without those that extend another one.
+
+    In such a table only the greatest entry <= a value can be its prefix,
+    so a "pfx" match is one ``bisect``.
+    """
+    out: list[str] = []
+    for p in sorted({p.lower() for p in ps}):
+        if not out or not p.startswith(out[-1]):
+            out.append(p)
+    return tuple(out)
+
+
+def mk_mt(rl: Rl, pf: tuple[tuple[str, ...], ...] | None = None) -> Mt:
+    """Build matcher for rule.
+
+    The matcher takes the field value and its lowercased form, so callers
+    can lowercase each field once per request.
+
+    Args:
+        rl: Rule.
+        pf: Optional prefilter for "re" rules: per pattern, lowercase
+            literals of which at least one must occur in the value
+            (empty tuple = no prefilter). Only used for ASCII values.
+
+    Returns:
+        Callable (v, lv) -> bool.
+
+    Raises:
+        CfgErr: If rule has unsupported type or transformation.
+    """
+    for x in rl.t:
+        if x not in TFS:
+            raise CfgErr(f"bad t: {x!r} for {rl.rid!r}")
+    if rl.rtp == "sub":
+        lps = tuple(p.lower() for p in rl.ps)
+        return lambda v, lv: any(p in lv for p in lps)
+    if rl.rtp == "re":
+        xs = tuple(zip(rl.ps, pf if pf is not None else ((),) * len(rl.ps)))
+
+        def f(v: str, lv: str) -> bool:
+            asc = v.isascii()
+            for p, ls in xs:
+                if ls and asc and not any(x in lv for x in ls):
+                    continue
+                if _rx(p).search(v):
+                    return True
+            return False
+
+        return f
+    if rl.rtp == "eq":
+        st = frozenset(p.strip().lower() for p in rl.ps)
+        return lambda v, lv: lv.strip() in st
+    if rl.rtp == "pfx":
+        ps = pfx_tab(rl.ps)
+
+        def g(v: str, lv: str) -> bool:
+            i = bisect_right(ps, lv) - 1
+            return i >= 0 and lv.startswith(ps[i])
+
+        return g
+    if rl.rtp == "cidr":
+        from .cidr import mk_cidr
+
+        return mk_cidr(rl.rid, rl.ps)
+    raise CfgErr(f"bad rtp: {rl.rtp!r} for {rl.rid!r}")
+
+
+_mt = lru_cache(maxsize=4096)(mk_mt)
 
 
 def mtch(rl: Rl, rq: Mapping[str, Any]) -> bool:
@@ -66,18 +265,9 @@ def mtch(rl: Rl, rq: Mapping[str, Any]) -> bool:
     Raises:
         CfgErr: If rule has unsupported type.
     """
-    v = str(rq.get(rl.fld, ""))
-    if rl.rtp == "sub":
-        lv = v.lower()
-        return any(p.lower() in lv for p in rl.ps)
-    if rl.rtp == "re":
-        import re
-
-        for p in rl.ps:
-            if re.search(p, v, flags=re.IGNORECASE):
-                return True
-        return False
-    raise CfgErr(f"bad rtp: {rl.rtp!r} for {rl.rid!r}")
+    f = _mt(rl)
+    v = tv(rq, rl.fld, rl.t, {})
+    return f(v, v.lower())
 
 
 def scr(rls: Iterable[Rl], rq: Mapping[str, Any]) -> tuple[int, list[str]]:
@@ -92,8 +282,11 @@ def scr(rls: Iterable[Rl], rq: Mapping[str, Any]) -> tuple[int, list[str]]:
     """
     s = 0
     ms: list[str] = []
+    vs: dict[tuple[str, tuple[str, ...]], str] = {}
     for r in rls:
-        if mtch(r, rq):
+        f = _mt(r)
+        v = tv(rq, r.fld, r.t, vs)
+        if f(v, v.lower()):
             s += int(r.w)
             ms.append(r.rid)
     return s, ms
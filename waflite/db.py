@@ -0,0 +1,458 @@
+"""Rules db storage.
+
+Two backends share one dict shape (thr, ign_ua, rls):
+
+- json file (default, `*.json`): whole document, written atomically
+  (temp file + ``os.replace``) under a file lock;
+- SQLite (`*.sqlite`, `*.sqlite3`, `*.db`): one row per rule, every change
+  is a single transaction that also bumps the ruleset version.
+
+``db_ver`` is a cheap way to notice changes without loading the rules.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator
+
+from .core import CfgErr, WfErr
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - windows
+    fcntl = None  # type: ignore[assignment]
+
+
+SQ_SFX = (".sqlite", ".sqlite3", ".db")
+
+
+class DbErr(WfErr):
+    """Ошибка хранилища правил."""
+
+
+class DupErr(DbErr):
+    """Rule with this rid already exists."""
+
+
+def is_sq(p: Path) -> bool:
+    """Check if path points to a SQLite rules db (by suffix)."""
+    return Path(p).suffix.lower() in SQ_SFX
+
+
+def rl_nrm(x: Any) -> dict[str, Any]:
+    """Validate and normalize rule dict.
+
+    Args:
+        x: Rule mapping (rid, rtp, w, ps, fld, optional t).
+
+    Returns:
+        New dict with stable keys and types ("t" only if not empty).
+
+    Raises:
+        CfgErr: If rule is malformed.
+    """
+    if not isinstance(x, dict):
+        raise CfgErr("rule must be object")
+    t = x.get("t") or []
+    if not isinstance(t, (list, tuple)):
+        raise CfgErr("t must be list")
+    try:
+        r = {
+            "rid": str(x["rid"]),
+            "rtp": str(x["rtp"]),
+            "w": int(x["w"]),
+            "ps": [str(p) for p in x.get("ps", ())],
+            "fld": str(x.get("fld", "req")),
+        }
+    except KeyError as e:
+        raise CfgErr(f"нет поля: {e}") from e
+    except (TypeError, ValueError) as e:
+        raise CfgErr(f"bad rule: {e}") from e
+    if t:
+        r["t"] = [str(y) for y in t]
+    return r
+
+
+def _rl_cols(x: dict[str, Any]) -> tuple[Any, ...]:
+    """Column values (rtp, w, ps, fld, t) of normalized rule."""
+    return x["rtp"], x["w"], json.dumps(x["ps"], ensure_ascii=False), x["fld"], json.dumps(x.get("t", []))
+
+
+def _rl_row(rid: str, rtp: str, w: int, ps: str, fld: str, t: str) -> dict[str, Any]:
+    """Rule dict from table row."""
+    r = {"rid": rid, "rtp": rtp, "w": int(w), "ps": json.loads(ps), "fld": fld}
+    tt = json.loads(t)
+    if tt:
+        r["t"] = tt
+    return r
+
+
+_SCH = """
+CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v NOT NULL);
+CREATE TABLE IF NOT EXISTS rls (
+  rid TEXT PRIMARY KEY,
+  pos INTEGER NOT NULL,
+  rtp TEXT NOT NULL,
+  w INTEGER NOT NULL,
+  ps TEXT NOT NULL,
+  fld TEXT NOT NULL,
+  t TEXT NOT NULL DEFAULT '[]'
+);
+CREATE INDEX IF NOT EXISTS rls_pos ON rls (pos);
+INSERT OR IGNORE INTO meta (k, v) VALUES ('ver', 0), ('thr', 7), ('ign_ua', '[]');
+"""
+
+
+class SqDb:
+    """SQLite rules store.
+
+    Connections are kept per thread (FastAPI runs sync handlers in a
+    threadpool). The db runs in WAL mode, so readers never see a partial
+    write and do not block the writer.
+
+    Args:
+        p: Path to SQLite file (created on first use).
+    """
+
+    def __init__(self, p: Path) -> None:
+        self.p = Path(p)
+        self._tl = threading.local()
+
+    def _cn(self) -> sqlite3.Connection:
+        cn = getattr(self._tl, "cn", None)
+        if cn is None:
+            try:
+                self.p.parent.mkdir(parents=True, exist_ok=True)
+                cn = sqlite3.connect(str(self.p), timeout=10.0, isolation_level=None)
+                cn.execute("PRAGMA journal_mode=WAL")
+                cn.execute("PRAGMA synchronous=NORMAL")
+                cn.executescript(_SCH)
+                if "t" not in {r[1] for r in cn.execute("PRAGMA table_info(rls)")}:
+                    cn.execute("ALTER TABLE rls ADD COLUMN t TEXT NOT NULL DEFAULT '[]'")  # dbs before "t"
+            except (OSError, sqlite3.Error) as e:
+                raise DbErr(f"не могу открыть db: {self.p}") from e
+            self._tl.cn = cn
+        return cn
+
+    @contextmanager
+    def _tx(self) -> Iterator[sqlite3.Connection]:
+        """Write transaction that bumps ruleset version on success."""
+        cn = self._cn()
+        try:
+            cn.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error as e:
+            raise DbErr(f"db занята: {self.p}") from e
+        try:
+            yield cn
+            cn.execute("UPDATE meta SET v = v + 1 WHERE k = 'ver'")
+            cn.execute("COMMIT")
+        except BaseException:
+            cn.execute("ROLLBACK")
+            raise
+
+    def ver(self) -> int:
+        """Current ruleset version (grows by one on every change)."""
+        try:
+            r = self._cn().execute("SELECT v FROM meta WHERE k = 'ver'").fetchone()
+        except sqlite3.Error as e:
+            raise DbErr(f"не могу прочитать db: {self.p}") from e
+        return int(r[0]) if r else 0
+
+    def ld(self) -> dict[str, Any]:
+        """Load the whole db as dict (thr, ign_ua, rls)."""
+        cn = self._cn()
+        try:
+            # one read transaction: meta and rules come from the same snapshot
+            cn.execute("BEGIN")
+            mt = dict(cn.execute("SELECT k, v FROM meta").fetchall())
+            rows = cn.execute("SELECT rid, rtp, w, ps, fld, t FROM rls ORDER BY pos").fetchall()
+            cn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if cn.in_transaction:
+                cn.execute("ROLLBACK")
+            raise DbErr(f"не могу прочитать db: {self.p}") from e
+        return {
+            "thr": int(mt.get("thr", 7)),
+            "ign_ua": json.loads(mt.get("ign_ua", "[]")),
+            "rls": [_rl_row(*r) for r in rows],
+        }
+
+    def sv(self, d: dict[str, Any]) -> int:
+        """Replace the whole db in one transaction.
+
+        Args:
+            d: Dict with thr, ign_ua, rls.
+
+        Returns:
+            New version.
+        """
+        rls = [rl_nrm(x) for x in d.get("rls", [])]
+        with self._tx() as cn:
+            cn.execute("DELETE FROM rls")
+            cn.executemany(
+                "INSERT OR REPLACE INTO rls (rid, pos, rtp, w, ps, fld, t) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(x["rid"], i, *_rl_cols(x)) for i, x in enumerate(rls)],
+            )
+            self._mt_put(cn, thr=d.get("thr", 7), ign_ua=d.get("ign_ua", []))
+        return self.ver()
+
+    @staticmethod
+    def _mt_put(cn: sqlite3.Connection, **kw: Any) -> None:
+        for k, v in kw.items():
+            v2 = int(v) if k == "thr" else json.dumps(list(v), ensure_ascii=False)
+            cn.execute("INSERT OR REPLACE INTO meta (k, v) VALUES (?, ?)", (k, v2))
+
+    def mt_put(self, **kw: Any) -> int:
+        """Update db settings (thr, ign_ua).
+
+        Returns:
+            New version.
+        """
+        with self._tx() as cn:
+            self._mt_put(cn, **kw)
+        return self.ver()
+
+    def rl_get(self, rid: str) -> dict[str, Any] | None:
+        """Get single rule by id (None if missing)."""
+        r = self._cn().execute("SELECT rid, rtp, w, ps, fld, t FROM rls WHERE rid = ?", (rid,)).fetchone()
+        if r is None:
+            return None
+        return _rl_row(*r)
+
+    def rl_put(self, x: dict[str, Any], add: bool = False) -> int:
+        """Insert or update one rule (keeps position on update).
+
+        Args:
+            x: Rule dict.
+            add: Fail with DupErr if rule exists.
+
+        Returns:
+            New version.
+        """
+        x = rl_nrm(x)
+        with self._tx() as cn:
+            if add and cn.execute("SELECT 1 FROM rls WHERE rid = ?", (x["rid"],)).fetchone():
+                raise DupErr(f"правило уже есть: {x['rid']}")
+            cn.execute(
+                "INSERT INTO rls (rid, pos, rtp, w, ps, fld, t) "
+                "VALUES (?, (SELECT COALESCE(MAX(pos), -1) + 1 FROM rls), ?, ?, ?, ?, ?) "
+                "ON CONFLICT (rid) DO UPDATE SET rtp = excluded.rtp, w = excluded.w, "
+                "ps = excluded.ps, fld = excluded.fld, t = excluded.t",
+                (x["rid"], *_rl_cols(x)),
+            )
+        return self.ver()
+
+    def rl_del(self, rid: str) -> bool:
+        """Delete one rule.
+
+        Returns:
+            True if rule existed (version bumped), else False.
+        """
+        cn = self._cn()
+        try:
+            cn.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error as e:
+            raise DbErr(f"db занята: {self.p}") from e
+        try:
+            n = cn.execute("DELETE FROM rls WHERE rid = ?", (rid,)).rowcount
+            if n:
+                cn.execute("UPDATE meta SET v = v + 1 WHERE k = 'ver'")
+            cn.execute("COMMIT")
+        except BaseException:
+            cn.execute("ROLLBACK")
+            raise
+        return bool(n)
+
+
+_SQ: dict[str, SqDb] = {}
+_SQ_LK = threading.Lock()
+
+
+def sq_db(p: Path) -> SqDb:
+    """Shared SqDb instance for path (one per process)."""
+    k = str(Path(p).resolve())
+    with _SQ_LK:
+        db = _SQ.get(k)
+        if db is None:
+            db = _SQ[k] = SqDb(Path(p))
+    return db
+
+
+# --- json backend
+
+_JLK: dict[str, threading.Lock] = {}
+
+
+@contextmanager
+def _jlk(p: Path) -> Iterator[None]:
+    """Exclusive lock for json db read-modify-write (threads + processes)."""
+    k = str(Path(p).resolve())
+    with _SQ_LK:
+        lk = _JLK.setdefault(k, threading.Lock())
+    with lk:
+        if fcntl is None:
+            yield
+            return
+        try:
+            p.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(str(p) + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError as e:
+            raise DbErr(f"не могу заблокировать db: {p}") from e
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+
+def _ld_json(p: Path) -> dict[str, Any]:
+    if not p.exists():
+        return {"thr": 7, "ign_ua": [], "rls": []}
+    try:
+        d = json.loads(p.read_text(encoding="utf-8"))
+    except OSError as e:
+        raise DbErr(f"не могу прочитать db: {p}") from e
+    except json.JSONDecodeError as e:
+        raise DbErr("db должен быть json") from e
+    if not isinstance(d, dict):
+        raise DbErr("db root должен быть object")
+    d.setdefault("thr", 7)
+    d.setdefault("ign_ua", [])
+    d.setdefault("rls", [])
+    return d
+
+
+def _sv_json(p: Path, d: dict[str, Any]) -> None:
+    import tempfile
+
+    tmp = ""
+    try:
+        p.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=p.name + ".", suffix=".tmp", dir=str(p.parent))
+        os.chmod(tmp, os.stat(p).st_mode & 0o777 if p.exists() else 0o644)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(json.dumps(d, ensure_ascii=False, indent=2) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, p)
+    except OSError as e:
+        if tmp and os.path.exists(tmp):
+            os.unlink(tmp)
+        raise DbErr(f"не могу записать db: {p}") from e
+
+
+# --- backend-agnostic api
+
+
+def ld_db(p: Path) -> dict[str, Any]:
+    """Load rules db.
+
+    Args:
+        p: Path to db (json or SQLite).
+
+    Returns:
+        Dict with keys: thr, ign_ua, rls.
+    """
+    if is_sq(p):
+        return sq_db(p).ld()
+    return _ld_json(p)
+
+
+def sv_db(p: Path, d: dict[str, Any]) -> None:
+    """Replace rules db.
+
+    Args:
+        p: Path.
+        d: Dict to save.
+    """
+    if is_sq(p):
+        sq_db(p).sv(d)
+        return
+    with _jlk(p):
+        _sv_json(p, d)
+
+
+def db_ver(p: Path) -> int:
+    """Ruleset version without loading the rules.
+
+    For SQLite this is the monotonic version counter. For json it is
+    derived from inode, mtime and size (every save replaces the file, so
+    the inode changes even within one mtime tick); 0 if file is missing.
+    """
+    if is_sq(p):
+        return sq_db(p).ver()
+    try:
+        st = os.stat(p)
+    except OSError:
+        return 0
+    return hash((st.st_ino, st.st_mtime_ns, st.st_size)) & 0x7FFFFFFFFFFFFFFF
+
+
+def db_set(p: Path, **kw: Any) -> None:
+    """Update db settings (thr, ign_ua) without touching rules."""
+    if is_sq(p):
+        sq_db(p).mt_put(**kw)
+        return
+    with _jlk(p):
+        d = _ld_json(p)
+        d.update(kw)
+        _sv_json(p, d)
+
+
+def rl_get(p: Path, rid: str) -> dict[str, Any] | None:
+    """Get one rule by id (None if missing)."""
+    if is_sq(p):
+        return sq_db(p).rl_get(rid)
+    return next((x for x in _ld_json(p)["rls"] if str(x.get("rid")) == rid), None)
+
+
+def rl_put(p: Path, x: dict[str, Any], add: bool = False) -> None:
+    """Insert or update one rule.
+
+    Args:
+        p: Db path.
+        x: Rule dict.
+        add: Raise DupErr if rule already exists.
+
+    Raises:
+        CfgErr: If rule is malformed.
+        DupErr: If add and rule exists.
+    """
+    if is_sq(p):
+        sq_db(p).rl_put(x, add=add)
+        return
+    x = rl_nrm(x)
+    with _jlk(p):
+        d = _ld_json(p)
+        rls = d["rls"]
+        i = next((i for i, y in enumerate(rls) if str(y.get("rid")) == x["rid"]), -1)
+        if i >= 0 and add:
+            raise DupErr(f"правило уже есть: {x['rid']}")
+        if i >= 0:
+            rls[i] = x
+        else:
+            rls.append(x)
+        _sv_json(p, d)
+
+
+def rl_del(p: Path, rid: str) -> bool:
+    """Delete one rule.
+
+    Returns:
+        True if rule existed.
+    """
+    if is_sq(p):
+        return sq_db(p).rl_del(rid)
+    with _jlk(p):
+        d = _ld_json(p)
+        n = len(d["rls"])
+        d["rls"] = [x for x in d["rls"] if str(x.get("rid")) != rid]
+        if len(d["rls"]) == n:
+            return False
+        _sv_json(p, d)
+    return True
@@ -0,0 +1,401 @@
+"""Compiled ruleset engine and ruleset snapshots.
+
+``Eng`` is a validated ruleset with prefilter tables: for every regex
+pattern a set of literals of which at least one must occur in the value.
+Most benign requests fail the prefilter, so the regex is neither run nor
+even compiled.
+
+``waflite compile-rules`` stores an ``Eng`` next to the db
+(``<db>.snap``) together with what identifies the db content (a checksum
+of the json file; the version counter of a SQLite db), so workers start
+with one read and unpickle instead of rebuilding rules and prefilters.
+A snapshot that does not match the db is ignored.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import pickle
+import re
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Iterator, Mapping
+
+from .core import Rl, CfgErr, Mt, nrq, dec, mk_mt, tv, _rx
+from .db import DbErr, is_sq, ld_db, db_ver
+
+try:
+    from re import _parser as _sp
+except ImportError:  # pragma: no cover - python 3.10
+    import sre_parse as _sp  # type: ignore[no-redef]
+
+
+SNAP_V = 3
+STRM_RTP = frozenset(("re", "sub"))  # rule types usable on the streamed body
+
+_RPT = tuple(x for x in (_sp.MAX_REPEAT, _sp.MIN_REPEAT, getattr(_sp, "POSSESSIVE_REPEAT", None)) if x is not None)
+
+
+def _bst(a: tuple[str, ...] | None, b: tuple[str, ...] | None) -> tuple[str, ...] | None:
+    """Pick more selective requirement (longer shortest literal, fewer alternatives)."""
+    if not b:
+        return a
+    if not a:
+        return b
+    ka = (min(map(len, a)), -len(a))
+    kb = (min(map(len, b)), -len(b))
+    return b if kb > ka else a
+
+
+def _req(items: Any) -> tuple[str, ...] | None:
+    """Literals of which one must occur in any match of parsed sequence."""
+    best: tuple[str, ...] | None = None
+    run: list[str] = []
+    for op, av in list(items) + [(None, None)]:
+        if op is _sp.LITERAL and av < 128:
+            run.append(chr(av).lower())
+            continue
+        if run:
+            best = _bst(best, ("".join(run),))
+            run = []
+        sub: tuple[str, ...] | None = None
+        if op is _sp.SUBPATTERN:
+            sub = _req(av[-1])
+        elif op is getattr(_sp, "ATOMIC_GROUP", None):
+            sub = _req(av)
+        elif op is _sp.BRANCH:
+            alts = [_req(x) for x in av[1]]
+            if all(alts):
+                sub = tuple(dict.fromkeys(x for a in alts for x in a))  # type: ignore[union-attr]
+        elif op in _RPT and av[0] >= 1:
+            sub = _req(av[2])
+        elif op is _sp.IN and av and all(o is _sp.LITERAL and a < 128 for o, a in av):
+            sub = tuple(dict.fromkeys(chr(a).lower() for _, a in av))
+        best = _bst(best, sub)
+    return best
+
+
+def _walk(items: Any) -> Iterator[tuple[Any, Any]]:
+    """All (op, av) nodes of parsed regex, nested groups included."""
+    for op, av in items:
+        yield op, av
+        for x in av if isinstance(av, (tuple, list)) else (av,):
+            if isinstance(x, _sp.SubPattern):
+                yield from _walk(x)
+            elif isinstance(x, list):
+                for y in x:
+                    if isinstance(y, _sp.SubPattern):
+                        yield from _walk(y)
+
+
+@lru_cache(maxsize=65536)
+def pf_lits(p: str) -> tuple[str, ...]:
+    """Prefilter literals for regex pattern.
+
+    Args:
+        p: Regex (matched case-insensitively).
+
+    Returns:
+        Lowercase ASCII literals of which at least one occurs in every
+        match, or empty tuple if none can be derived.
+    """
+    try:
+        return _req(_sp.parse(p, re.IGNORECASE)) or ()
+    except (re.error, RecursionError):
+        return ()
+
+
+def _mk_rl(x: dict[str, Any]) -> Rl:
+    """Make rule from dict."""
+    try:
+        return Rl(
+            rid=str(x["rid"]),
+            rtp=str(x["rtp"]),
+            w=int(x["w"]),
+            ps=tuple(map(str, x.get("ps", ()))),
+            fld=str(x.get("fld", "req")),
+            t=tuple(map(str, x.get("t") or ())),
+        )
+    except KeyError as e:
+        raise CfgErr(f"нет поля: {e}") from e
+
+
+class Eng:
+    """Compiled ruleset.
+
+    Args:
+        thr: Block threshold.
+        ign: User-agent substrings that lower the score by 3.
+        rls: Rules.
+        pf: Per rule, per pattern prefilter literals (see ``pf_lits``).
+    """
+
+    def __init__(
+        self,
+        thr: int,
+        ign: tuple[str, ...],
+        rls: tuple[Rl, ...],
+        pf: tuple[tuple[tuple[str, ...], ...], ...],
+    ) -> None:
+        self.thr = int(thr)
+        self.ign = tuple(x.lower() for x in ign)
+        self.rls = rls
+        self.pf = pf
+        self.flds = frozenset(r.fld for r in rls)
+        self.ks = tuple((r.fld, r.t) for r in rls)
+        self._mts: list[Mt] | None = None
+
+    def __getstate__(self) -> dict[str, Any]:
+        d = self.__dict__.copy()
+        d["_mts"] = None
+        return d
+
+    def mts(self) -> list[Mt]:
+        """Per-rule matchers (built on first use)."""
+        if self._mts is None:
+            self._mts = [mk_mt(r, p) for r, p in zip(self.rls, self.pf)]
+        return self._mts
+
+    def scr(self, rq: Mapping[str, Any], hit: set[int] | None = None) -> tuple[int, list[str]]:
+        """Compute total score and matched rule ids (same as ``core.scr``).
+
+        Args:
+            rq: Normalized request mapping.
+            hit: Indexes of "body" rules matched by a streaming scan
+                (``strm.BodyScan``); when given, "body" rules are not
+                matched against ``rq``.
+
+        Returns:
+            (score, matched_rule_ids)
+        """
+        s = 0
+        ms: list[str] = []
+        xs: dict[tuple[str, tuple[str, ...]], tuple[str, str]] = {}
+        vs: dict[tuple[str, tuple[str, ...]], str] = {}
+        for i, (r, f, k) in enumerate(zip(self.rls, self.mts(), self.ks)):
+            if hit is not None and r.fld == "body":
+                if i in hit:
+                    s += r.w
+                    ms.append(r.rid)
+                continue
+            x = xs.get(k)
+            if x is None:
+                v = tv(rq, r.fld, r.t, vs) if r.t else str(rq.get(r.fld, ""))
+                x = xs[k] = (v, v.lower())
+            if f(*x):
+                s += r.w
+                ms.append(r.rid)
+        return s, ms
+
+    def run(self, rq: Mapping[str, Any], hit: set[int] | None = None) -> dict[str, Any]:
+        """Run scoring and decision.
+
+        Args:
+            rq: Request dict (ip, req, ua, st and optional extra fields).
+            hit: Streamed "body" rule hits (see ``scr``).
+
+        Returns:
+            Result dict with scr, dec, m, thr.
+        """
+        nr = nrq(rq)
+        s, ms = self.scr(nr, hit)
+        if self.ign:
+            ua = nr["ua"].lower()
+            if any(x in ua for x in self.ign):
+                s = max(0, s - 3)
+        return {"scr": s, "dec": dec(s, self.thr), "m": ms, "thr": self.thr}
+
+
+def mk_eng(db: dict[str, Any], chk: bool = False) -> Eng:
+    """Compile rules db into engine.
+
+    Args:
+        db: db dict (thr, ign_ua, rls).
+        chk: Also compile every regex to validate it.
+
+    Returns:
+        Eng.
+
+    Raises:
+        CfgErr: If a rule is malformed.
+    """
+    rls = tuple(_mk_rl(x) for x in db.get("rls", []))
+    for r in rls:
+        if r.fld == "body" and (r.rtp not in STRM_RTP or r.t):
+            raise CfgErr(f"для fld body только re/sub без t: {r.rid!r}")
+        mk_mt(r)
+        if chk and r.rtp == "re":
+            for p in r.ps:
+                try:
+                    _rx(p)
+                except re.error as e:
+                    raise CfgErr(f"bad regex in {r.rid!r}: {e}") from e
+    pf = tuple(tuple(pf_lits(p) for p in r.ps) if r.rtp == "re" else () for r in rls)
+    return Eng(int(db.get("thr", 7)), tuple(map(str, db.get("ign_ua", []))), rls, pf)
+
+
+def _waf_do(db: dict[str, Any], rq: dict[str, Any]) -> dict[str, Any]:
+    """Run WAF scoring and decision.
+
+    Args:
+        db: db dict (thr, ign_ua, rls).
+        rq: request dict (ip, req, ua, st).
+
+    Returns:
+        Result dict with scr, dec, m.
+    """
+    return mk_eng(db).run(rq)
+
+
+# --- snapshots
+
+
+def snap_p(dbp: Path) -> Path:
+    """Snapshot path for db."""
+    return dbp.with_name(dbp.name + ".snap")
+
+
+def db_sum(dbp: Path) -> str:
+    """Checksum of rules db content.
+
+    Snapshots of SQLite dbs are checked by version (``db_ver``) instead,
+    which needs no full read.
+
+    Args:
+        dbp: Db path.
+
+    Returns:
+        sha256 hex of the json file, or of the canonical dump for SQLite.
+    """
+    if is_sq(dbp):
+        b = json.dumps(ld_db(dbp), sort_keys=True, ensure_ascii=False).encode("utf-8")
+    else:
+        try:
+            b = dbp.read_bytes()
+        except OSError as e:
+            raise DbErr(f"не могу прочитать db: {dbp}") from e
+    return hashlib.sha256(b).hexdigest()
+
+
+def sv_snap(dbp: Path, out: Path | None = None) -> dict[str, Any]:
+    """Compile db and write snapshot.
+
+    Args:
+        dbp: Db path.
+        out: Snapshot path (default: ``<db>.snap``).
+
+    Returns:
+        Snapshot metadata (p, ver, sum, n); sum is None for SQLite.
+
+    Raises:
+        CfgErr: If rules are invalid.
+        DbErr: If db cannot be read or snapshot cannot be written.
+    """
+    op = out or snap_p(dbp)
+    ver = db_ver(dbp)  # read before the rules: a concurrent edit only makes the snapshot look stale
+    sm = None if is_sq(dbp) else db_sum(dbp)
+    e = mk_eng(ld_db(dbp), chk=True)
+    b = pickle.dumps({"v": SNAP_V, "ver": ver, "sum": sm, "eng": e}, protocol=pickle.HIGHEST_PROTOCOL)
+    tmp = op.with_name(f"{op.name}.{os.getpid()}.tmp")
+    try:
+        tmp.write_bytes(b)
+        os.replace(tmp, op)
+    except OSError as e2:
+        raise DbErr(f"не могу записать snapshot: {op}") from e2
+    return {"p": str(op), "ver": ver, "sum": sm, "n": len(e.rls)}
+
+
+def ld_snap(dbp: Path, p: Path | None = None) -> Eng | None:
+    """Load snapshot if it exists and matches db.
+
+    Snapshots are pickles: load only files you produced yourself.
+
+    Args:
+        dbp: Db path.
+        p: Snapshot path (default: ``<db>.snap``).
+
+    Returns:
+        Eng or None if snapshot is missing, of other format, or stale.
+    """
+    sp = p or snap_p(dbp)
+    try:
+        d = pickle.loads(sp.read_bytes())
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+    if not isinstance(d, dict) or d.get("v") != SNAP_V or not isinstance(d.get("eng"), Eng):
+        return None
+    try:
+        if is_sq(dbp):
+            if d.get("ver") != db_ver(dbp):
+                return None
+        elif d.get("sum") != db_sum(dbp):
+            return None
+    except DbErr:
+        return None
+    return d["eng"]
+
+
+def snap_upd(dbp: Path) -> None:
+    """Refresh snapshot after db change (only if snapshot is in use).
+
+    If the new rules do not compile, the old snapshot stays on disk and
+    is ignored by its checksum.
+    """
+    if snap_p(dbp).exists():
+        try:
+            sv_snap(dbp)
+        except CfgErr:
+            pass
+
+
+class EngC:
+    """Engine cache for db path.
+
+    Reloads when ``db_ver`` changes: from the snapshot if it is fresh,
+    otherwise by compiling the db.
+
+    With ``gen`` (e.g. ``ShmSt.gen`` shared by all workers) the db is not
+    stat'ed on every call: the engine is reused while the generation stays
+    the same, and ``db_ver`` is re-checked only every ``ttl`` seconds to
+    catch edits made outside the servers.
+
+    Args:
+        dbp: Db path.
+        gen: Optional rules generation getter.
+        ttl: Max seconds between ``db_ver`` checks in generation mode.
+    """
+
+    def __init__(self, dbp: Path, gen: Callable[[], int] | None = None, ttl: float = 1.0) -> None:
+        self.dbp = dbp
+        self.gen = gen
+        self.ttl = ttl
+        self._e: Eng | None = None
+        self._v: int | None = None
+        self._g: int | None = None
+        self._t = 0.0
+        self._lk = threading.Lock()
+
+    def get(self) -> Eng:
+        """Current engine.
+
+        Raises:
+            CfgErr: If rules are invalid.
+            DbErr: If db cannot be read.
+        """
+        g = self.gen() if self.gen is not None else None
+        e = self._e
+        if e is not None and g is not None and g == self._g and time.monotonic() < self._t:
+            return e
+        v = db_ver(self.dbp)
+        if e is None or v != self._v:
+            with self._lk:
+                if self._e is None or self._v != v:
+                    self._e = ld_snap(self.dbp) or mk_eng(ld_db(self.dbp))
+                    self._v = v
+                e = self._e
+        self._g, self._t = g, time.monotonic() + self.ttl
+        return e
@@ -3,21 +3,28 @@
 Supports:
 - nginx combined access log lines
 - raw request lines
+- ingested ``.wfc`` corpora (see ``waflite.wfc``), via ``rd_rqs``
 """
 
 from __future__ import annotations
 
+import re
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Iterator, Any
 
-from .core import WfErr
+from .core import Rq, WfErr, nrq
 
 
 class InpErr(WfErr):
     """Raised when input cannot be parsed."""
 
 
+_NG_RE = re.compile(
+    r'^(?P<ip>\S+)\s+\S+\s+\S+\s+\[[^\]]+\]\s+"(?P<req>[^"]+)"\s+(?P<st>\d{3})\s+\S+\s+"[^"]*"\s+"(?P<ua>[^"]*)"$'
+)
+
+
 @dataclass(frozen=True)
 class PrsRes:
     """Parsed request record.
@@ -98,12 +105,7 @@ def prs_ng(ln: str) -> PrsRes:
     Raises:
         InpErr: If line does not look like combined log.
     """
-    import re
-
-    m = re.match(
-        r'^(?P<ip>\S+)\s+\S+\s+\S+\s+\[[^\]]+\]\s+"(?P<req>[^"]+)"\s+(?P<st>\d{3})\s+\S+\s+"[^"]*"\s+"(?P<ua>[^"]*)"$',
-        ln,
-    )
+    m = _NG_RE.match(ln)
     if not m:
         raise InpErr("bad nginx line")
     return PrsRes(
@@ -133,3 +135,25 @@ def prs(fmt: str, ln: str) -> PrsRes:
     if f == "raw":
         return prs_raw(ln)
     raise InpErr(f"bad fmt: {fmt!r}")
+
+
+def rd_rqs(p: Path, fmt: str) -> Iterator[Rq]:
+    """Read and parse input file.
+
+    Args:
+        p: Input path.
+        fmt: "nginx", "raw" or "wfc" (ingested corpus, no parsing).
+
+    Yields:
+        Normalized requests, in file order.
+
+    Raises:
+        InpErr: If file cannot be read or a line cannot be parsed.
+    """
+    if (fmt or "").lower().strip() == "wfc":
+        from .wfc import rd_wfc
+
+        yield from rd_wfc(p)
+        return
+    for ln in rdln(p):
+        yield nrq(prs(fmt, ln).asd())
@@ -0,0 +1,187 @@
+"""Live windowed traffic stats (``GET /api/v1/stats/live``).
+
+``Live`` keeps, per process and in fixed memory:
+
+- per-second and per-minute rings of scan / block counts (``secs`` and
+  ``mins`` slots; a slot is reset when its time comes round again);
+- per-minute hit counts of every rule;
+- per-minute top-K sketches of blocked IPs, paths and user agents
+  (SpaceSaving over a stream-summary, see ``SpSv``); a window of W
+  minutes is answered by merging the last W sketches.
+
+``add`` is O(1) in the traffic (plus one step per matched rule), so the
+tracker can stay always on. With several server workers each one keeps
+its own view; ``/api/v1/stats`` remains the fleet-wide total.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import Counter
+from typing import Any, Hashable, Iterable, Mapping
+
+WINS = (1, 5, 15)  # top-K windows, minutes
+
+
+class SpSv:
+    """SpaceSaving top-K sketch with O(1) updates.
+
+    Keeps at most ``cap`` items. An unseen item replaces one with the
+    minimal count and inherits that count as its error bound, so counts
+    are over-estimates by at most ``err`` and every item with a true
+    count above N / cap is present.
+
+    Args:
+        cap: Max tracked items.
+    """
+
+    def __init__(self, cap: int) -> None:
+        self.cap = cap
+        self.c: dict[Hashable, int] = {}
+        self.e: dict[Hashable, int] = {}
+        self._b: dict[int, dict[Hashable, None]] = {}  # count -> items
+        self._mn = 0
+
+    def add(self, x: Hashable) -> None:
+        """Count one occurrence."""
+        c = self.c.get(x)
+        if c is None:
+            if len(self.c) < self.cap:
+                c, self.e[x] = 0, 0
+            else:
+                c = self._mn
+                y, _ = self._b[c].popitem()
+                del self.c[y], self.e[y]
+                if not self._b[c]:
+                    del self._b[c]
+                self.e[x] = c
+        else:
+            b = self._b[c]
+            del b[x]
+            if not b:
+                del self._b[c]
+        self.c[x] = c + 1
+        self._b.setdefault(c + 1, {})[x] = None
+        if c == 0:
+            self._mn = 1
+        elif c == self._mn and c not in self._b:
+            self._mn = c + 1
+
+    def top(self, k: int) -> list[tuple[Hashable, int, int]]:
+        """Top k as (item, count, error bound)."""
+        return [(x, n, self.e[x]) for x, n in sorted(self.c.items(), key=lambda t: -t[1])[:k]]
+
+
+def _merge(ss: Iterable[SpSv], k: int) -> list[list[Any]]:
+    c: Counter[Hashable] = Counter()
+    e: Counter[Hashable] = Counter()
+    for s in ss:
+        c.update(s.c)
+        e.update(s.e)
+    return [[x, n, e[x]] for x, n in c.most_common(k)]
+
+
+def _path(req: str) -> str:
+    ps = req.split(" ")
+    p = ps[1] if len(ps) > 1 else ps[0]
+    return p.split("?", 1)[0]
+
+
+class Live:
+    """Windowed counters and heavy hitters.
+
+    Args:
+        secs: Per-second slots.
+        mins: Per-minute slots (at least the longest top-K window).
+        cap: Items per top-K sketch.
+    """
+
+    def __init__(self, secs: int = 60, mins: int = 60, cap: int = 64) -> None:
+        self.secs = secs
+        self.mins = max(mins, max(WINS))
+        self.cap = cap
+        self._lk = threading.Lock()
+        self._st = [-1] * secs  # slot -> second it holds
+        self._sn = [0] * secs
+        self._sb = [0] * secs
+        self._mt = [-1] * self.mins  # slot -> minute it holds
+        self._mn = [0] * self.mins
+        self._mb = [0] * self.mins
+        self._rh: dict[str, list[int]] = {}
+        self._tk: list[dict[str, SpSv]] = [self._sk() for _ in range(self.mins)]
+
+    def _sk(self) -> dict[str, SpSv]:
+        return {"ip": SpSv(self.cap), "path": SpSv(self.cap), "ua": SpSv(self.cap)}
+
+    def _slots(self, t: float) -> tuple[int, int]:
+        s = int(t)
+        i = s % self.secs
+        if self._st[i] != s:
+            self._st[i], self._sn[i], self._sb[i] = s, 0, 0
+        m = s // 60
+        j = m % self.mins
+        if self._mt[j] != m:
+            self._mt[j], self._mn[j], self._mb[j] = m, 0, 0
+            for v in self._rh.values():
+                v[j] = 0
+            self._tk[j] = self._sk()
+        return i, j
+
+    def add(self, rq: Mapping[str, Any], r: Mapping[str, Any], t: float | None = None) -> None:
+        """Count one scan.
+
+        Args:
+            rq: Request (ip, req, ua).
+            r: Result (dec, m).
+            t: Unix time (default: now).
+        """
+        blk = r["dec"] == "block"
+        with self._lk:
+            i, j = self._slots(time.time() if t is None else t)
+            self._sn[i] += 1
+            self._mn[j] += 1
+            for rid in r["m"]:
+                v = self._rh.get(rid)
+                if v is None:
+                    v = self._rh[rid] = [0] * self.mins
+                v[j] += 1
+            if blk:
+                self._sb[i] += 1
+                self._mb[j] += 1
+                tk = self._tk[j]
+                tk["ip"].add(str(rq.get("ip", "")))
+                tk["path"].add(_path(str(rq.get("req", ""))))
+                tk["ua"].add(str(rq.get("ua", "")))
+
+    def snap(self, k: int = 10, t: float | None = None) -> dict[str, Any]:
+        """Current view.
+
+        Args:
+            k: Top items per dimension and window.
+            t: Unix time (default: now).
+
+        Returns:
+            "sec" / "min": scans and blocks per slot, oldest first (current
+            slot last, still filling); "rules": hits per window; "top":
+            per window, blocked ip / path / ua as [item, count, error].
+        """
+        with self._lk:
+            s = int(time.time() if t is None else t)
+            m = s // 60
+            sec = [s - self.secs + 1 + x for x in range(self.secs)]
+            mn = [m - self.mins + 1 + x for x in range(self.mins)]
+            si = [(x % self.secs, self._st[x % self.secs] == x) for x in sec]
+            mi = [(x % self.mins, self._mt[x % self.mins] == x) for x in mn]
+            r: dict[str, Any] = {
+                "t": s,
+                "sec": {"scans": [self._sn[i] if ok else 0 for i, ok in si], "blocks": [self._sb[i] if ok else 0 for i, ok in si]},
+                "min": {"scans": [self._mn[j] if ok else 0 for j, ok in mi], "blocks": [self._mb[j] if ok else 0 for j, ok in mi]},
+            }
+            r["rules"] = {
+                rid: {f"{w}m": sum(v[j] for j, ok in mi[-w:] if ok) for w in WINS} for rid, v in sorted(self._rh.items())
+            }
+            r["top"] = {
+                f"{w}m": {d: _merge((self._tk[j][d] for j, ok in mi[-w:] if ok), k) for d in ("ip", "path", "ua")} for w in WINS
+            }
+        return r
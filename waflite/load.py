@@ -0,0 +1,286 @@
+"""Async HTTP load generator (``waflite loadtest``).
+
+Replays requests from a log against a running server and reports
+throughput, latency percentiles and errors. Only the standard library is
+used (asyncio streams, a minimal HTTP/1.1 client with keep-alive), so it
+runs anywhere the package does, e.g. against a local instance in CI::
+
+    python -m waflite loadtest --url http://127.0.0.1:8010 --in reqs.txt --fmt raw \\
+        --mode scan --conc 64 --n 20000
+
+Modes:
+
+- ``scan``: one ``POST /api/v1/scan`` per log line;
+- ``batch``: ``POST /api/v1/batch`` with ``bn`` lines per call;
+- ``shop``: the logged request itself (method + path) against the site,
+  i.e. through ``WafMiddleware``; 4xx (WAF 403, unknown paths) count as
+  answers, only 5xx as errors.
+
+With ``rate`` the requests are started on a fixed schedule and latency is
+measured from the scheduled time, so a stalled server shows up in the
+percentiles instead of silently lowering the send rate.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import ssl
+import time
+from collections import Counter
+from itertools import islice
+from pathlib import Path
+from typing import Any, Iterator
+from urllib.parse import quote, urlsplit
+
+from .core import WfErr
+from .io import rd_rqs
+
+MODES = ("scan", "batch", "shop")
+_SAFE = "/?&=%:+,;@!$'()*[]~#-._"
+
+
+class LdErr(WfErr):
+    """Raised on bad load test settings."""
+
+
+def _body(mt: str, path: str, host: str, body: bytes = b"", ua: str = "waflite-loadtest") -> bytes:
+    h = f"{mt} {path} HTTP/1.1\r\nHost: {host}\r\nUser-Agent: {ua}\r\n"
+    if body:
+        h += f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+    return (h + "\r\n").encode("latin-1", "replace") + body
+
+
+def mk_reqs(rqs: Iterator[dict[str, Any]], mode: str, host: str, base: str = "", bn: int = 50) -> list[tuple[bytes, int]]:
+    """Build raw HTTP requests.
+
+    Args:
+        rqs: Normalized requests (``io.rd_rqs``).
+        mode: "scan", "batch" or "shop".
+        host: Host header value.
+        base: Path prefix of the target URL.
+        bn: Items per batch call.
+
+    Returns:
+        (request bytes, log lines it carries).
+
+    Raises:
+        LdErr: If mode is unknown.
+    """
+    if mode not in MODES:
+        raise LdErr(f"bad mode: {mode!r}")
+    out: list[tuple[bytes, int]] = []
+    if mode == "shop":
+        for q in rqs:
+            ps = q["req"].strip().split(" ")
+            if len(ps) > 2 and ps[-1].upper().startswith("HTTP/"):
+                ps.pop()
+            if len(ps) < 2:
+                continue
+            p = quote(" ".join(ps[1:]), safe=_SAFE)
+            out.append((_body(ps[0].upper(), base + (p if p.startswith("/") else "/" + p), host, ua=q["ua"] or "-"), 1))
+        return out
+    its = ({"ip": q["ip"], "req": q["req"], "ua": q["ua"], "st": q["st"]} for q in rqs)
+    if mode == "scan":
+        for x in its:
+            out.append((_body("POST", base + "/api/v1/scan", host, json.dumps(x).encode("utf-8")), 1))
+        return out
+    while True:
+        ch = list(islice(its, bn))
+        if not ch:
+            return out
+        out.append((_body("POST", base + "/api/v1/batch", host, json.dumps({"items": ch}).encode("utf-8")), len(ch)))
+
+
+async def _resp(r: asyncio.StreamReader, mt: str = "GET") -> tuple[int, bool]:
+    """Read one response.
+
+    Args:
+        r: Connection reader.
+        mt: Request method (a HEAD response has no body).
+
+    Returns:
+        (status, server keeps connection open)
+    """
+    hd = await r.readuntil(b"\r\n\r\n")
+    ls = hd.decode("latin-1").split("\r\n")
+    st = int(ls[0].split(" ", 2)[1])
+    h = {}
+    for ln in ls[1:]:
+        k, _, v = ln.partition(":")
+        h[k.strip().lower()] = v.strip().lower()
+    if mt == "HEAD" or st < 200 or st in (204, 304):
+        pass  # no body, whatever the headers say
+    elif "chunked" in h.get("transfer-encoding", ""):
+        while True:
+            n = int((await r.readuntil(b"\r\n")).split(b";")[0], 16)
+            await r.readexactly(n + 2)
+            if n == 0:
+                break
+    elif "content-length" in h:
+        await r.readexactly(int(h["content-length"]))
+    else:
+        await r.read()  # body until close
+        return st, False
+    return st, h.get("connection") != "close"
+
+
+def _pct(xs: list[float], p: float) -> float:
+    if not xs:
+        return 0.0
+    return xs[min(len(xs) - 1, int(p / 100 * len(xs)))]
+
+
+async def run_load(
+    url: str,
+    reqs: list[tuple[bytes, int]],
+    n: int = 0,
+    conc: int = 32,
+    conns: int = 0,
+    rate: float = 0,
+    dur: float = 0,
+    tmo: float = 10.0,
+    emin: int = 400,
+) -> dict[str, Any]:
+    """Send requests and collect stats.
+
+    Args:
+        url: Base URL (http or https).
+        reqs: Prepared requests (``mk_reqs``); reused in a loop.
+        n: Requests to send (0: each once, unless ``dur`` is set).
+        conc: Concurrent requests in flight.
+        conns: Keep-alive connections (0: same as ``conc``).
+        rate: Target requests per second (0: as fast as possible).
+        dur: Stop after this many seconds (0: no limit).
+        tmo: Per-request timeout, seconds.
+        emin: Lowest HTTP status counted as error.
+
+    Returns:
+        Summary: sent, ok, errors, statuses, lines, elapsed, rps, lines/s and
+        latency p50 / p90 / p99 / max in ms.
+
+    Raises:
+        LdErr: If URL or settings are bad.
+    """
+    u = urlsplit(url)
+    if u.scheme not in ("http", "https") or not u.hostname:
+        raise LdErr(f"bad url: {url!r}")
+    if not reqs:
+        raise LdErr("no requests to send")
+    port = u.port or (443 if u.scheme == "https" else 80)
+    sc = ssl.create_default_context() if u.scheme == "https" else None
+    tot = n or (0 if dur else len(reqs))
+    pool: asyncio.LifoQueue[tuple[asyncio.StreamReader, asyncio.StreamWriter] | None] = asyncio.LifoQueue()
+    for _ in range(conns or conc):
+        pool.put_nowait(None)  # opened lazily
+    lat: list[float] = []
+    sts: Counter[int] = Counter()
+    ers: Counter[str] = Counter()
+    lines = 0
+    nxt = 0
+    t0 = time.perf_counter()
+    end = t0 + dur if dur else 0.0
+
+    async def one(rq: bytes) -> int:
+        c = await pool.get()
+        while True:
+            old = c is not None  # kept-alive conn may have been closed by the server
+            try:
+                if c is None:
+                    c = await asyncio.open_connection(u.hostname, port, ssl=sc)
+                c[1].write(rq)
+                st, ka = await _resp(c[0], rq[: rq.find(b" ")].decode("latin-1"))
+                break
+            except (ConnectionError, asyncio.IncompleteReadError):
+                if c is not None:
+                    c[1].close()
+                c = None
+                if old:
+                    continue
+                pool.put_nowait(None)
+                raise
+            except BaseException:
+                if c is not None:
+                    c[1].close()
+                pool.put_nowait(None)
+                raise
+        if not ka:
+            c[1].close()
+            c = None
+        pool.put_nowait(c)
+        return st
+
+    async def wk() -> None:
+        nonlocal nxt, lines
+        while True:
+            i = nxt
+            if (tot and i >= tot) or (end and (t0 + i / rate if rate else time.perf_counter()) >= end):
+                return
+            nxt += 1
+            rq, k = reqs[i % len(reqs)]
+            ts = time.perf_counter()
+            if rate:
+                ts = t0 + i / rate
+                if ts > time.perf_counter():
+                    await asyncio.sleep(ts - time.perf_counter())
+            try:
+                st = await asyncio.wait_for(one(rq), tmo)
+            except asyncio.TimeoutError:
+                ers["timeout"] += 1
+                continue
+            except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError, IndexError) as e:
+                ers[type(e).__name__] += 1
+                continue
+            lat.append(time.perf_counter() - ts)
+            sts[st] += 1
+            lines += k
+
+    await asyncio.gather(*(wk() for _ in range(max(1, conc))))
+    el = time.perf_counter() - t0
+    while not pool.empty():
+        c = pool.get_nowait()
+        if c is not None:
+            c[1].close()
+    lat.sort()
+    ok = sum(v for s, v in sts.items() if s < emin)
+    return {
+        "sent": nxt,
+        "ok": ok,
+        "errors": sum(ers.values()) + sum(sts.values()) - ok,
+        "err_kinds": dict(ers),
+        "status": {str(k): v for k, v in sorted(sts.items())},
+        "lines": lines,
+        "elapsed_s": round(el, 3),
+        "rps": round(len(lat) / el, 1) if el else 0.0,
+        "lines_s": round(lines / el, 1) if el else 0.0,
+        "lat_ms": {k: round(_pct(lat, p) * 1000, 3) for k, p in (("p50", 50), ("p90", 90), ("p99", 99))}
+        | {"max": round(lat[-1] * 1000, 3) if lat else 0.0},
+    }
+
+
+def loadtest(
+    url: str,
+    src: Path,
+    fmt: str,
+    mode: str = "scan",
+    lim: int = 100_000,
+    bn: int = 50,
+    **kw: Any,
+) -> dict[str, Any]:
+    """Replay log against server (see ``run_load`` for ``kw``).
+
+    Args:
+        url: Base URL.
+        src: Log path.
+        fmt: "nginx", "raw" or "wfc".
+        mode: "scan", "batch" or "shop".
+        lim: Max log lines loaded.
+        bn: Items per batch call.
+
+    Returns:
+        Summary (``run_load``) with "mode".
+    """
+    u = urlsplit(url)
+    reqs = mk_reqs(islice(rd_rqs(src, fmt), lim), mode, u.netloc, u.path.rstrip("/"), bn)
+    kw.setdefault("emin", 500 if mode == "shop" else 400)
+    return {"mode": mode} | asyncio.run(run_load(url, reqs, **kw))
@@ -0,0 +1,198 @@
+"""Pure ASGI WAF middleware.
+
+Works in front of any ASGI app (FastAPI, Starlette, plain ASGI callables)::
+
+    from waflite.eng import EngC
+    from waflite.mw import WafMiddleware
+
+    app = WafMiddleware(app, EngC(Path("data/rules_db.json")), paths=("/shop",))
+
+The middleware scores the request line, headers and cookies from ``scope``
+and answers 403 itself; such requests never reach the wrapped app.
+
+When the ruleset has "body" rules, the body is inspected chunk by chunk
+as the app reads it (``strm.BodyScan``). If a chunk tips the score over
+the threshold, the app gets ``http.disconnect`` instead of that chunk,
+its response is dropped and the client gets the 403. Only the first
+``body_lim`` bytes are inspected. Response messages the app sends before
+the body is fully inspected are held back until it is (or until the app
+returns), so a late body match still turns the answer into a 403.
+Requests without a body (no ``Content-Length`` / ``Transfer-Encoding``)
+skip all this, so their responses stream as usual.
+
+Protected responses get a ``Server-Timing`` header with the WAF's own
+time (``tm_hdr``), and a ``tm_log`` fraction of them a timing log record
+(see ``waflite.tmg``).
+"""
+
+from __future__ import annotations
+
+from time import perf_counter
+from typing import Any, Awaitable, Callable, MutableMapping
+
+from .eng import Eng, EngC
+from .strm import BodyScan, hdr_flds
+from .tmg import smp, srv_tm, tlog
+
+Scope = MutableMapping[str, Any]
+Msg = MutableMapping[str, Any]
+Rcv = Callable[[], Awaitable[Msg]]
+Snd = Callable[[Msg], Awaitable[None]]
+Asgi = Callable[[Scope, Rcv, Snd], Awaitable[None]]
+
+
+class WafMiddleware:
+    """ASGI middleware that scores protected requests and blocks them.
+
+    Args:
+        app: Wrapped ASGI app.
+        ruleset: Engine, engine cache (reloads on db change) or a callable
+            returning the current engine.
+        paths: Path prefixes to protect (default: everything).
+        body_lim: Max body bytes to inspect per request.
+        tm_hdr: Add ``Server-Timing`` to protected responses.
+        tm_log: Fraction of protected requests to log timings for.
+    """
+
+    def __init__(
+        self,
+        app: Asgi,
+        ruleset: Eng | EngC | Callable[[], Eng],
+        paths: tuple[str, ...] | list[str] = ("/",),
+        body_lim: int = 64 * 1024,
+        tm_hdr: bool = True,
+        tm_log: float = 0.0,
+    ) -> None:
+        self.app = app
+        if isinstance(ruleset, Eng):
+            self._eng: Callable[[], Eng] = lambda: ruleset
+        elif isinstance(ruleset, EngC):
+            self._eng = ruleset.get
+        else:
+            self._eng = ruleset
+        self.paths = tuple(paths)
+        self.body_lim = body_lim
+        self.tm_hdr = tm_hdr
+        self.tm_log = tm_log
+
+    async def __call__(self, scope: Scope, receive: Rcv, send: Snd) -> None:
+        if scope["type"] != "http" or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+        t0 = perf_counter()
+        e = self._eng()
+        t1 = perf_counter()
+        fs = e.flds
+        ua = ""
+        for k, v in scope["headers"]:
+            if k == b"user-agent":
+                ua = v.decode("latin-1")
+                break
+        qs = scope.get("query_string", b"")
+        line = scope["method"] + " " + scope["path"] + ("?" + qs.decode("latin-1") if qs else "") + " HTTP/1.1"
+        cl = scope.get("client")
+        rq: dict[str, Any] = {"ip": cl[0] if cl else "", "req": line, "ua": ua, "st": 0}
+        if any(f == "cookie" or f.startswith("hdr:") for f in fs):
+            rq.update(hdr_flds(((k.decode("latin-1"), v.decode("latin-1")) for k, v in scope["headers"]), fs))
+        bd = "body" in fs and _has_body(scope)
+        t2 = perf_counter()
+        r = e.run(rq, set() if "body" in fs else None)
+        t3 = perf_counter()
+        tm = [t1 - t0, t3 - t2, t3 - t0]  # rules load, scoring, all WAF work (s)
+        lg = smp(self.tm_log)
+        if r["dec"] == "block" or not bd:
+            if lg:
+                tlog(scope["method"], scope["path"], r, *tm)
+            if r["dec"] == "block":
+                await _deny(send, r, srv_tm(*tm) if self.tm_hdr else None)
+            else:
+                await self.app(scope, receive, _tm_snd(send, tm) if self.tm_hdr else send)
+            return
+
+        ct = next((v for k, v in scope["headers"] if k == b"content-type"), b"")
+        bs = BodyScan(e, self.body_lim, form=ct.startswith(b"application/x-www-form-urlencoded"))
+        blk: dict[str, Any] | None = None
+        held: list[Msg] = []  # response messages sent before the body was fully inspected
+
+        async def flush() -> None:
+            for m in held:
+                if m["type"] == "http.response.start" and self.tm_hdr:
+                    m = _tm_start(m, tm)
+                await send(m)
+            held.clear()
+
+        async def rcv() -> Msg:
+            nonlocal blk, r
+            if blk is not None:
+                return {"type": "http.disconnect"}
+            m = await receive()
+            if m["type"] == "http.request":
+                t = perf_counter()
+                if bs.feed(m.get("body", b""), m.get("more_body", False)):
+                    r = e.run(rq, bs.hit)
+                    if r["dec"] == "block":
+                        blk = r
+                dt = perf_counter() - t
+                tm[1] += dt
+                tm[2] += dt
+                if blk is not None:
+                    return {"type": "http.disconnect"}
+                if bs.done and held:
+                    await flush()
+            return m
+
+        async def snd(m: Msg) -> None:
+            if blk is None:
+                held.append(m)
+                if bs.done:
+                    await flush()
+
+        try:
+            await self.app(scope, rcv, snd)
+        except Exception:
+            if blk is None:
+                raise
+        if lg:
+            tlog(scope["method"], scope["path"], r, *tm)
+        if blk is not None:
+            await _deny(send, blk, srv_tm(*tm) if self.tm_hdr else None)
+        elif held:  # the app answered without reading the whole body
+            await flush()
+
+
+def _has_body(scope: Scope) -> bool:
+    """True if the request may carry a body (body rules are skipped otherwise).
+
+    HTTP/1.x: ``Transfer-Encoding`` or a non-zero ``Content-Length``. HTTP/2
+    and 3 need no length header, so there anything but GET / HEAD counts.
+    """
+    for k, v in scope["headers"]:
+        if k == b"transfer-encoding":
+            return True
+        if k == b"content-length":
+            return v.strip() != b"0"
+    return not scope.get("http_version", "1.1").startswith("1") and scope["method"] not in ("GET", "HEAD")
+
+
+def _tm_start(m: Msg, tm: list[float]) -> Msg:
+    """Response start message with ``Server-Timing`` added."""
+    return {**m, "headers": [*m.get("headers", ()), (b"server-timing", srv_tm(*tm).encode("latin-1"))]}
+
+
+def _tm_snd(send: Snd, tm: list[float]) -> Snd:
+    """Send wrapper adding ``Server-Timing`` to the response start."""
+
+    async def snd(m: Msg) -> None:
+        await send(_tm_start(m, tm) if m["type"] == "http.response.start" else m)
+
+    return snd
+
+
+async def _deny(send: Snd, r: dict[str, Any], tm: str | None = None) -> None:
+    """Send 403 with decision details (and ``Server-Timing`` value tm)."""
+    b = f"blocked by waflite (scr={r['scr']}, thr={r['thr']}, m={','.join(r['m'])})".encode("utf-8")
+    hs = [(b"content-type", b"text/plain; charset=utf-8"), (b"content-length", str(len(b)).encode())]
+    if tm is not None:
+        hs.append((b"server-timing", tm.encode("latin-1")))
+    await send({"type": "http.response.start", "status": 403, "headers": hs})
+    await send({"type": "http.response.body", "body": b})
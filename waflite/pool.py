@@ -0,0 +1,238 @@
+"""Process pool for request scoring.
+
+Regex scoring holds the GIL, so threads of one API process do not scale
+with cores. ``ScPool`` keeps ``n`` worker processes, each with its own
+engine cache (``eng.EngC``, reloaded when the rules db version changes),
+and talks to them over pipes from the event loop:
+
+- a request is queued and sent as soon as a worker is idle;
+- while all workers are busy, queued requests pile up and the next idle
+  worker takes up to ``bn`` of them in one message, so batching grows
+  with load and costs no latency when idle;
+- replies are read with ``loop.add_reader``, no helper threads.
+
+Workers are started with "spawn" (safe from a threaded server) when the
+pool is created and restarted if they die (off the event loop); requests
+in flight on a dead worker fail with ``PoolErr``. Needs a selector event loop (POSIX).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import multiprocessing as mp
+import pickle
+import signal
+from collections import deque
+from pathlib import Path
+from typing import Any, Iterable
+
+from .core import CfgErr, WfErr
+
+_P = pickle.HIGHEST_PROTOCOL
+
+
+class PoolErr(WfErr):
+    """Raised when a scoring worker fails."""
+
+
+def _wmain(dbp: Path, conn: Any) -> None:
+    """Worker loop: batch of request dicts in, batch of results out."""
+    from .eng import EngC
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # parent handles Ctrl-C
+    ec = EngC(dbp)
+    while True:
+        try:
+            ds = pickle.loads(conn.recv_bytes())
+        except (EOFError, OSError):
+            return
+        try:
+            e = ec.get()
+            r: Any = [e.run(d) for d in ds]
+        except CfgErr as x:
+            r = ("cfg", str(x))
+        except Exception as x:  # noqa: BLE001 - sent to parent
+            r = ("err", f"{type(x).__name__}: {x}")
+        conn.send_bytes(pickle.dumps(r, _P))
+
+
+class _W:
+    """Worker process with its pipe and in-flight batch."""
+
+    def __init__(self, ctx: Any, dbp: Path) -> None:
+        self.conn, c = ctx.Pipe()
+        self.p = ctx.Process(target=_wmain, args=(dbp, c), name="waflite-scr", daemon=True)
+        self.p.start()
+        c.close()
+        self.fs: list[asyncio.Future[dict[str, Any]]] | None = None
+
+
+class ScPool:
+    """Pool of scoring processes.
+
+    Args:
+        dbp: Rules db path.
+        n: Worker processes.
+        bn: Max requests per message to a worker.
+
+    Attributes:
+        sent: Messages sent (``sent`` vs requests shows the batching).
+    """
+
+    def __init__(self, dbp: Path, n: int, bn: int = 64) -> None:
+        self.dbp = dbp
+        self.bn = bn
+        self.sent = 0
+        self._ctx = mp.get_context("spawn")
+        self._ws = [_W(self._ctx, dbp) for _ in range(max(1, n))]
+        self._q: deque[tuple[dict[str, Any], asyncio.Future[dict[str, Any]]]] = deque()
+        self._lp: asyncio.AbstractEventLoop | None = None
+        self._closed = False
+
+    def _att(self) -> None:
+        """Register pipe readers with the running loop."""
+        lp = asyncio.get_running_loop()
+        if lp is self._lp:
+            return
+        if self._lp is not None and not self._lp.is_closed():
+            for w in self._ws:
+                self._lp.remove_reader(w.conn.fileno())
+        self._lp = lp
+        for w in self._ws:
+            lp.add_reader(w.conn.fileno(), self._rd, w)
+
+    async def run(self, d: dict[str, Any]) -> dict[str, Any]:
+        """Score one request (same result as ``Eng.run``).
+
+        Raises:
+            CfgErr: If rules are invalid.
+            PoolErr: If the worker failed.
+        """
+        return (await self.run_many([d]))[0]
+
+    async def run_many(self, ds: Iterable[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Score requests (results in input order).
+
+        Raises:
+            CfgErr: If rules are invalid.
+            PoolErr: If a worker failed.
+        """
+        if self._closed:
+            raise PoolErr("pool is closed")
+        self._att()
+        assert self._lp is not None
+        fs = []
+        for d in ds:
+            f = self._lp.create_future()
+            self._q.append((d, f))
+            fs.append(f)
+        self._kick()
+        return list(await asyncio.gather(*fs))
+
+    def _kick(self) -> None:
+        for w in self._ws:
+            if not self._q:
+                return
+            if w.fs is not None:
+                continue
+            ds, fs = [], []
+            while self._q and len(ds) < self.bn:
+                d, f = self._q.popleft()
+                if not f.done():  # cancelled by client disconnect
+                    ds.append(d)
+                    fs.append(f)
+            if not ds:
+                continue
+            w.fs = fs
+            try:
+                w.conn.send_bytes(pickle.dumps(ds, _P))
+            except OSError:
+                self._dead(w)
+                continue
+            self.sent += 1
+
+    def _rd(self, w: _W) -> None:
+        try:
+            r = pickle.loads(w.conn.recv_bytes())
+        except (EOFError, OSError):
+            self._dead(w)
+            self._kick()
+            return
+        fs, w.fs = w.fs or [], None
+        if isinstance(r, tuple):
+            e: WfErr = CfgErr(r[1]) if r[0] == "cfg" else PoolErr(r[1])
+            for f in fs:
+                if not f.done():
+                    f.set_exception(e)
+        else:
+            for f, x in zip(fs, r):
+                if not f.done():
+                    f.set_result(x)
+        self._kick()
+
+    def _dead(self, w: _W) -> None:
+        """Fail in-flight batch of dead worker and replace it.
+
+        Reaping the old process and spawning the new one take a while, so
+        they run in the loop's executor; meanwhile the other workers go on.
+        """
+        if w not in self._ws:
+            return
+        self._ws.remove(w)
+        for f in w.fs or []:
+            if not f.done():
+                f.set_exception(PoolErr("scoring worker died"))
+        if self._lp is not None:
+            self._lp.remove_reader(w.conn.fileno())
+        w.conn.close()
+        if self._lp is None:
+            self._respawn(w)
+            return
+        self._lp.run_in_executor(None, self._respawn, w).add_done_callback(self._add)
+
+    def _respawn(self, w: _W) -> _W | None:
+        """Reap dead worker and start a replacement (off the event loop)."""
+        w.p.join(timeout=1)
+        if self._closed:
+            return None
+        nw = _W(self._ctx, self.dbp)
+        if self._closed:  # closed while spawning
+            nw.conn.close()
+            nw.p.join(timeout=2)
+            return None
+        return nw
+
+    def _add(self, fut: asyncio.Future[_W | None]) -> None:
+        """Put replacement worker into service (on the loop)."""
+        nw = None if fut.cancelled() or fut.exception() is not None else fut.result()
+        if nw is None:
+            return
+        if self._closed:
+            nw.conn.close()
+            return
+        self._ws.append(nw)
+        if self._lp is not None and not self._lp.is_closed():
+            self._lp.add_reader(nw.conn.fileno(), self._rd, nw)
+        self._kick()
+
+    def close(self) -> None:
+        """Stop workers (queued requests fail with ``PoolErr``)."""
+        if self._closed:
+            return
+        self._closed = True
+        while self._q:
+            _, f = self._q.popleft()
+            if not f.done():
+                f.set_exception(PoolErr("pool is closed"))
+        for w in self._ws:
+            if self._lp is not None and not self._lp.is_closed():
+                self._lp.remove_reader(w.conn.fileno())
+            for f in w.fs or []:
+                if not f.done():
+                    f.set_exception(PoolErr("pool is closed"))
+            w.conn.close()  # worker sees EOF and exits
+        for w in self._ws:
+            w.p.join(timeout=2)
+            if w.p.is_alive():
+                w.p.terminate()
+                w.p.join()
@@ -0,0 +1,187 @@
+"""Per-stage timing for CLI scans (``waflite --profile``).
+
+``Prof`` splits the main thread's wall and CPU time into stages with
+laps: ``lap(k)`` charges the time since the previous lap to stage ``k``.
+The scan loop is instrumented only when profiling is on (``rqs`` replaces
+``io.rd_rqs`` and ``wrap`` wraps the score / write calls), so a normal
+run executes exactly the same code as without this module.
+
+Stages: read, parse, normalize, score, write (queueing rows to the report
+sink, plus the final flush) and other (glue in the loop).
+"""
+
+from __future__ import annotations
+
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Iterator, TextIO, TypeVar
+
+from .core import Rq, nrq
+from .io import prs, rdln
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - windows
+    resource = None  # type: ignore[assignment]
+
+STAGES = ("read", "parse", "normalize", "score", "write", "other")
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+_ns = time.perf_counter_ns
+_cns = time.thread_time_ns
+
+
+def peak_rss_mb() -> float | None:
+    """Peak resident set size of this process in MiB (None if unknown)."""
+    if resource is None:
+        return None
+    r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return r / (1 << 20) if sys.platform == "darwin" else r / 1024
+
+
+class Prof:
+    """Stage timer for one scan.
+
+    Attributes:
+        n: Lines read.
+    """
+
+    def __init__(self) -> None:
+        self.w = dict.fromkeys(STAGES, 0)
+        self.c = dict.fromkeys(STAGES, 0)
+        self.n = 0
+        self._t0 = self._t = _ns()
+        self._c0 = self._c = _cns()
+
+    def lap(self, k: str) -> None:
+        """Charge time since the previous lap to stage k."""
+        t, c = _ns(), _cns()
+        self.w[k] += t - self._t
+        self.c[k] += c - self._c
+        self._t, self._c = t, c
+
+    def wrap(self, k: str, f: F) -> F:
+        """Wrap call so its time goes to stage k (time before it to "other")."""
+
+        def g(*a: Any) -> Any:
+            self.lap("other")
+            r = f(*a)
+            self.lap(k)
+            return r
+
+        return g  # type: ignore[return-value]
+
+    def rqs(self, p: Path, fmt: str) -> Iterator[Rq]:
+        """Instrumented ``io.rd_rqs``."""
+        if (fmt or "").lower().strip() == "wfc":
+            from .wfc import rd_wfc
+
+            it = rd_wfc(p)
+            while True:
+                self.lap("other")
+                try:
+                    rq = next(it)
+                except StopIteration:
+                    self.lap("read")
+                    return
+                self.n += 1
+                self.lap("read")
+                yield rq
+        it2 = rdln(p)
+        while True:
+            self.lap("other")
+            try:
+                ln = next(it2)
+            except StopIteration:
+                self.lap("read")
+                return
+            self.n += 1
+            self.lap("read")
+            d = prs(fmt, ln).asd()
+            self.lap("parse")
+            rq = nrq(d)
+            self.lap("normalize")
+            yield rq
+
+    def rep(self) -> dict[str, Any]:
+        """Summary: per-stage wall / cpu seconds, lines/s, peak RSS."""
+        self.lap("other")
+        tw = self._t - self._t0
+        tc = self._c - self._c0
+        return {
+            "stages": {
+                k: {"wall_s": self.w[k] / 1e9, "cpu_s": self.c[k] / 1e9, "pct": 100 * self.w[k] / tw if tw else 0.0}
+                for k in STAGES
+            },
+            "wall_s": tw / 1e9,
+            "cpu_s": tc / 1e9,
+            "lines": self.n,
+            "lines_s": self.n * 1e9 / tw if tw else 0.0,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+    def prn(self, f: TextIO | None = None) -> dict[str, Any]:
+        """Print summary table (to stderr by default) and return it."""
+        f = f or sys.stderr
+        r = self.rep()
+        print(f"{'stage':<10} {'wall_s':>9} {'cpu_s':>9} {'wall%':>6}", file=f)
+        for k, x in r["stages"].items():
+            print(f"{k:<10} {x['wall_s']:9.3f} {x['cpu_s']:9.3f} {x['pct']:6.1f}", file=f)
+        print(f"{'total':<10} {r['wall_s']:9.3f} {r['cpu_s']:9.3f}", file=f)
+        rss = "?" if r["peak_rss_mb"] is None else f"{r['peak_rss_mb']:.1f}"
+        print(f"lines {r['lines']}  lines/s {r['lines_s']:.0f}  peak_rss_mb {rss}", file=f)
+        return r
+
+
+class TmPk:
+    """Allocation sites near the peak of traced memory (``--tracemalloc``).
+
+    A streaming scan frees almost everything by its end, so a final
+    snapshot says little. ``it`` wraps the request iterator and, every
+    ``every`` items, takes a snapshot when traced memory is at a new high.
+
+    Args:
+        every: Items between checks.
+    """
+
+    def __init__(self, every: int = 4096) -> None:
+        import tracemalloc
+
+        self.every = every
+        self.pk = 0
+        self.sn: Any = None
+        tracemalloc.start()
+
+    def chk(self) -> None:
+        """Take snapshot if traced memory is at a new high."""
+        import tracemalloc
+
+        cur = tracemalloc.get_traced_memory()[0]
+        if cur > self.pk:
+            self.pk = cur
+            self.sn = tracemalloc.take_snapshot()
+
+    def it(self, xs: Iterator[Rq]) -> Iterator[Rq]:
+        """Pass items through, checking memory every ``every`` items."""
+        for i, x in enumerate(xs, 1):
+            if i % self.every == 0:
+                self.chk()
+            yield x
+
+    def prn(self, n: int, f: TextIO | None = None) -> None:
+        """Print top n allocation sites of the peak snapshot and stop tracing."""
+        import tracemalloc
+
+        f = f or sys.stderr
+        self.chk()
+        pk = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"tracemalloc: peak {pk / (1 << 20):.1f} MiB; top sites at {self.pk / (1 << 20):.1f} MiB:", file=f)
+        sn = self.sn.filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen *>"))
+        )
+        for s in sn.statistics("lineno")[:n]:
+            fr = s.traceback[0]
+            print(f"{s.size / 1024:10.1f} KiB {s.count:8d}  {fr.filename}:{fr.lineno}", file=f)
@@ -0,0 +1,102 @@
+"""In-process response cache with strong ETags.
+
+Responses are cached by key (route, query params, data version). The data
+version is part of the key, so a rules or catalog change simply stops
+old entries from being hit; writers may also ``clear()`` to free memory.
+Clients that send ``If-None-Match`` with the current ETag get a bare 304.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+Ent = tuple[str, bytes, str]
+
+
+def jb(x: Any) -> tuple[bytes, str]:
+    """Encode JSON body the same way as ``JSONResponse``."""
+    b = json.dumps(x, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+    return b, "application/json"
+
+
+def etag(b: bytes) -> str:
+    """Strong ETag for body bytes."""
+    return '"' + hashlib.blake2b(b, digest_size=16).hexdigest() + '"'
+
+
+def inm_ok(inm: str | None, tag: str) -> bool:
+    """Check ``If-None-Match`` header against ETag (weak comparison, RFC 9110)."""
+    if not inm:
+        return False
+    if inm.strip() == "*":
+        return True
+    t = tag.removeprefix("W/")
+    return any(x.strip().removeprefix("W/") == t for x in inm.split(","))
+
+
+class RCache:
+    """Bounded LRU cache of encoded responses.
+
+    Args:
+        n: Max entries.
+    """
+
+    def __init__(self, n: int = 256) -> None:
+        self.n = n
+        self._d: OrderedDict[Hashable, Ent] = OrderedDict()
+        self._lk = threading.Lock()
+        self.hits = 0
+        self.miss = 0
+
+    def get(self, k: Hashable) -> Ent | None:
+        """Cached (etag, body, media_type) or None."""
+        with self._lk:
+            e = self._d.get(k)
+            if e is None:
+                self.miss += 1
+                return None
+            self._d.move_to_end(k)
+            self.hits += 1
+            return e
+
+    def put(self, k: Hashable, body: bytes, mt: str) -> Ent:
+        """Store body and return entry."""
+        e = (etag(body), body, mt)
+        with self._lk:
+            self._d[k] = e
+            self._d.move_to_end(k)
+            while len(self._d) > self.n:
+                self._d.popitem(last=False)
+        return e
+
+    def clear(self) -> None:
+        """Drop all entries."""
+        with self._lk:
+            self._d.clear()
+
+    def resp(self, req: Request, k: Hashable, mk: Callable[[], tuple[bytes, str]]) -> Response:
+        """Cached response for key, 304 if client already has it.
+
+        Args:
+            req: Request (for ``If-None-Match``).
+            k: Cache key; must include the data version.
+            mk: Builds (body, media_type) on miss.
+
+        Returns:
+            Response with ETag.
+        """
+        e = self.get(k)
+        if e is None:
+            e = self.put(k, *mk())
+        tag, body, mt = e
+        h = {"ETag": tag, "Cache-Control": "no-cache"}
+        if inm_ok(req.headers.get("if-none-match"), tag):
+            return Response(status_code=304, headers=h)
+        return Response(body, media_type=mt, headers=h)
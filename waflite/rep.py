@@ -1,19 +1,108 @@
-"""Reporting utilities."""
+"""Reporting utilities.
+
+``mk_jl`` / ``mk_csv`` generate a row encoder once per schema (tuple of
+keys, in order): key fragments are precomputed, strings go through the C
+JSON escaper, ints are formatted directly. Rows of another shape or with
+values of other types fall back to ``json.dumps`` / ``csv.DictWriter``,
+so output is always byte-identical to the generic writers.
+"""
 
 from __future__ import annotations
 
 import csv
+import io
 import json
+from functools import lru_cache
+from json.encoder import encode_basestring
 from pathlib import Path
-from typing import Iterable, Mapping, Any
+from typing import Callable, Iterable, Mapping, Any
 
 from .core import WfErr
 
+Enc = Callable[[Mapping[str, Any]], str]
+
 
 class OutErr(WfErr):
     """Raised when report cannot be written."""
 
 
+def _jl_slow(r: Mapping[str, Any]) -> str:
+    return json.dumps(dict(r), ensure_ascii=False) + "\n"
+
+
+def _jv(v: Any) -> str:
+    return json.dumps(v, ensure_ascii=False)
+
+
+def _gen(src: list[str], ns: dict[str, Any]) -> Enc:
+    exec(compile("\n".join(src), "<waflite.rep>", "exec"), ns)
+    return ns["enc"]
+
+
+@lru_cache(maxsize=64)
+def mk_jl(ks: tuple[str, ...]) -> Enc:
+    """JSON Lines encoder for rows with keys ``ks``.
+
+    Args:
+        ks: Keys in row order.
+
+    Returns:
+        Callable row -> line (with "\\n"), same as
+        ``json.dumps(dict(r), ensure_ascii=False) + "\\n"``.
+    """
+    src = ["def enc(r):", "    if r.__class__ is not dict or tuple(r) != KS:", "        return SLOW(r)"]
+    xs = []
+    for i, k in enumerate(ks):
+        src.append(f"    v{i} = r[{k!r}]")
+        pre = ("{" if i == 0 else ", ") + encode_basestring(k) + ": "
+        xs.append(f"{pre!r} + (E(v{i}) if v{i}.__class__ is str else I(v{i}) if v{i}.__class__ is int else V(v{i}))")
+    src.append("    return " + " + ".join(xs or ["'{'"]) + " + '}\\n'")
+    return _gen(src, {"KS": ks, "SLOW": _jl_slow, "E": encode_basestring, "I": int.__repr__, "V": _jv})
+
+
+def _cq(v: str) -> str:
+    return '"' + v + '"' if "," in v else v
+
+
+@lru_cache(maxsize=64)
+def mk_csv(ks: tuple[str, ...]) -> Enc:
+    """CSV row encoder for field names ``ks``.
+
+    Args:
+        ks: Field names (header order).
+
+    Returns:
+        Callable row -> line (with "\\r\\n"), same as
+        ``csv.DictWriter(f, fieldnames=list(ks)).writerow(r)``.
+    """
+    def slow(r: Mapping[str, Any]) -> str:
+        s = io.StringIO()
+        csv.DictWriter(s, fieldnames=list(ks)).writerow(r)
+        return s.getvalue()
+
+    if len(ks) < 2:
+        return slow
+    # field order comes from ks, so any dict with exactly these keys will do
+    src = ["def enc(r):", f"    if r.__class__ is not dict or len(r) != {len(ks)}:", "        return SLOW(r)", "    try:"]
+    for i, k in enumerate(ks):
+        src.append(f"        v{i} = r[{k!r}]")
+    src += ["    except KeyError:", "        return SLOW(r)"]
+    for i in range(len(ks)):
+        src.append(f"    if v{i}.__class__ is int:")
+        src.append(f"        v{i} = I(v{i})")
+        src.append(f"    elif v{i}.__class__ is not str:")
+        src.append("        return SLOW(r)")
+    # quote / line break / NUL: leave to csv; comma inside a field: quote it
+    vs = ", ".join(f"v{i}" for i in range(len(ks)))
+    src.append("    s = " + " + ',' + ".join(f"v{i}" for i in range(len(ks))))
+    src.append("    if '\"' in s or '\\n' in s or '\\r' in s or '\\x00' in s:")
+    src.append("        return SLOW(r)")
+    src.append(f"    if s.count(',') != {len(ks) - 1}:")
+    src.append(f"        s = ','.join([Q(v) for v in ({vs})])")
+    src.append("    return s + '\\r\\n'")
+    return _gen(src, {"SLOW": slow, "I": int.__repr__, "Q": _cq})
+
+
 def wr_jsonl(p: Path, rows: Iterable[Mapping[str, Any]]) -> None:
     """Write report as JSON Lines.
 
@@ -27,8 +116,11 @@ def wr_jsonl(p: Path, rows: Iterable[Mapping[str, Any]]) -> None:
     try:
         p.parent.mkdir(parents=True, exist_ok=True)
         with p.open("w", encoding="utf-8") as f:
+            enc: Enc | None = None
             for r in rows:
-                f.write(json.dumps(dict(r), ensure_ascii=False) + "\n")
+                if enc is None:
+                    enc = mk_jl(tuple(r))
+                f.write(enc(r))
     except OSError as e:
         raise OutErr(f"cannot write: {p}") from e
 
@@ -49,8 +141,8 @@ def wr_csv(p: Path, rows: Iterable[Mapping[str, Any]]) -> None:
     try:
         p.parent.mkdir(parents=True, exist_ok=True)
         with p.open("w", encoding="utf-8", newline="") as f:
-            w = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
-            w.writeheader()
-            w.writerows(rows)
+            ks = tuple(rows[0].keys())
+            csv.DictWriter(f, fieldnames=list(ks)).writeheader()
+            f.write("".join(map(mk_csv(ks), rows)))
     except OSError as e:
         raise OutErr(f"cannot write: {p}") from e
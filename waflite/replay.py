@@ -0,0 +1,299 @@
+"""What-if rule replay over a fixed corpus.
+
+``waflite replay`` keeps one match bitmap per rule next to the corpus
+(bit i set = the rule matched request i). Bitmaps are keyed by a hash of
+what decides matching (everything in ``Rl`` except ``rid`` and ``w``, plus
+size and mtime of "cidr" list files), so after a rules edit only new or
+changed rules are evaluated; scores and decisions are rebuilt from
+bitmaps and weights. Changing ``thr`` or a
+weight needs no regex work at all. The ``ign_ua`` list is cached the same
+way.
+
+Cache layout (``<corpus>.replay/`` by default)::
+
+    meta.json       corpus identity (size, mtime, fmt) and request count
+    bm/<key>.bin    bitmap, ceil(n / 8) bytes, bit i = byte i // 8, bit i % 8
+    last.json       config of the previous replay (default baseline)
+
+The cache is dropped when the corpus file changes (size or mtime).
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import json
+import os
+import re
+import shutil
+from array import array
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Sequence
+
+from .cidr import ps_sig
+from .core import Rl, dec
+from .io import rd_rqs
+from .rules import ld_rls
+
+_NZ = re.compile(rb"[^\x00]+")
+
+
+def rl_key(rl: Rl) -> str:
+    """Cache key of rule: hash of all fields that affect matching."""
+    d = dataclasses.asdict(rl)
+    del d["rid"], d["w"]
+    if rl.rtp == "cidr":
+        d["src"] = ps_sig(rl.ps)  # list file contents change matching too
+    return hashlib.sha256(json.dumps(d, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:32]
+
+
+def ign_key(ign: Iterable[str]) -> str:
+    """Cache key of ``ign_ua`` list."""
+    xs = sorted({x.lower() for x in ign})
+    return "ign-" + hashlib.sha256(json.dumps(xs, ensure_ascii=False).encode("utf-8")).hexdigest()[:27]
+
+
+def bits(b: bytes) -> Iterator[int]:
+    """Indexes of set bits (zero bytes are skipped in C)."""
+    for m in _NZ.finditer(b):
+        for j in range(m.start(), m.end()):
+            x = b[j]
+            o = j << 3
+            while x:
+                lo = x & -x
+                yield o + lo.bit_length() - 1
+                x ^= lo
+
+
+def cnt(b: bytes) -> int:
+    """Number of set bits."""
+    return int.from_bytes(b, "little").bit_count()
+
+
+def _sv(p: Path, b: bytes) -> None:
+    tmp = p.with_name(f"{p.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(b)
+    os.replace(tmp, p)
+
+
+class BmC:
+    """Bitmap cache for one corpus.
+
+    Args:
+        d: Cache dir.
+        src: Corpus path.
+        fmt: Corpus format.
+    """
+
+    def __init__(self, d: Path, src: Path, fmt: str) -> None:
+        self.d = d
+        st = src.stat()
+        self.key = [st.st_size, st.st_mtime_ns, fmt]
+        self.n: int | None = None
+        try:
+            m = json.loads((d / "meta.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            m = {}
+        if m.get("key") == self.key:
+            self.n = int(m["n"])
+        elif (d / "bm").exists():
+            shutil.rmtree(d / "bm")
+        (d / "bm").mkdir(parents=True, exist_ok=True)
+
+    def get(self, k: str) -> bytes | None:
+        """Cached bitmap or None."""
+        if self.n is None:
+            return None
+        try:
+            return (self.d / "bm" / f"{k}.bin").read_bytes()
+        except OSError:
+            return None
+
+    def put(self, k: str, b: bytes, n: int) -> None:
+        """Store bitmap for corpus of n requests."""
+        if self.n != n:
+            self.n = n
+            _sv(self.d / "meta.json", json.dumps({"key": self.key, "n": n}).encode("utf-8"))
+        _sv(self.d / "bm" / f"{k}.bin", b)
+
+    def last(self) -> dict[str, Any] | None:
+        """Config of previous replay."""
+        try:
+            return json.loads((self.d / "last.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def sv_last(self, cfg: dict[str, Any]) -> None:
+        _sv(self.d / "last.json", json.dumps(cfg, ensure_ascii=False).encode("utf-8"))
+
+
+def _fill(
+    c: BmC, src: Path, fmt: str, rls: dict[str, Rl], igns: dict[str, Sequence[str]], chunk: int
+) -> dict[str, bytes]:
+    """Evaluate rules and ign_ua lists over corpus and cache their bitmaps.
+
+    Returns:
+        New bitmaps by key.
+    """
+    from .bulk import bhits
+
+    chunk = max(8, chunk - chunk % 8)  # whole bytes per chunk
+    rl = list(rls.values())
+    bms = {k: bytearray() for k in [*rls, *igns]}
+    lig = {k: [x.lower() for x in v] for k, v in igns.items()}
+    n = 0
+
+    def flush(ch: list[Any]) -> None:
+        nb = (len(ch) + 7) >> 3
+        for b in bms.values():
+            b.extend(bytes(nb))
+        hs = dict(zip(rls, bhits(rl, ch)))
+        for k, xs in lig.items():
+            hs[k] = {i for i, q in enumerate(ch) if any(x in q.get("ua", "").lower() for x in xs)}
+        for k, h in hs.items():
+            b = bms[k]
+            for i in h:
+                b[(n + i) >> 3] |= 1 << ((n + i) & 7)
+
+    ch: list[Any] = []
+    for rq in rd_rqs(src, fmt):
+        ch.append(rq)
+        if len(ch) >= chunk:
+            flush(ch)
+            n += len(ch)
+            ch = []
+    flush(ch)
+    n += len(ch)
+    out = {k: bytes(b) for k, b in bms.items()}
+    for k, b in out.items():
+        c.put(k, b, n)
+    return out
+
+
+def _scores(n: int, rls: Sequence[Rl], bm: dict[str, bytes], ign: Sequence[str]) -> array:
+    sc = array("q", bytes(8 * n))
+    for rl in rls:
+        w = int(rl.w)
+        for i in bits(bm[rl_key(rl)]):
+            sc[i] += w
+    if ign:
+        for i in bits(bm[ign_key(ign)]):
+            sc[i] = max(0, sc[i] - 3)
+    return sc
+
+
+def replay(
+    src: Path,
+    fmt: str,
+    cfg: dict[str, Any],
+    base: dict[str, Any] | None = None,
+    cache: Path | None = None,
+    out: Path | None = None,
+    chunk: int = 5000,
+) -> dict[str, Any]:
+    """Replay config over corpus using cached bitmaps.
+
+    Args:
+        src: Corpus (log file or ingested ``.wfc``).
+        fmt: "nginx", "raw" or "wfc".
+        cfg: Config dict (see ``rules.ld_cfg``).
+        base: Baseline config (default: config of the previous replay).
+        cache: Cache dir (default: ``<src>.replay``).
+        out: Write changed decisions here (JSONL), if given.
+        chunk: Requests per evaluation chunk.
+
+    Returns:
+        Summary: request count, evaluated / cached rules, blocks per rule
+        set, decision changes vs baseline and per-rule hit counts.
+
+    Raises:
+        CfgErr: If a config is invalid.
+        InpErr: If corpus cannot be parsed.
+    """
+    c = BmC(cache or src.with_name(src.name + ".replay"), src, fmt)
+    if base is None:
+        base = c.last()
+    cfgs = [cfg] + ([base] if base is not None else [])
+    sets = [ld_rls(x) for x in cfgs]
+
+    need: dict[str, Rl] = {}
+    igns: dict[str, Sequence[str]] = {}
+    bm: dict[str, bytes] = {}
+    for _, rls, ign in sets:
+        for rl in rls:
+            k = rl_key(rl)
+            if k not in bm and k not in need:
+                b = c.get(k)
+                if b is None:
+                    need[k] = rl
+                else:
+                    bm[k] = b
+        if ign:
+            k = ign_key(ign)
+            b = c.get(k)
+            if b is None:
+                igns[k] = ign
+            else:
+                bm[k] = b
+    if need or igns:
+        bm.update(_fill(c, src, fmt, need, igns, chunk))
+    n = c.n or 0
+
+    thr, rls, ign = sets[0]
+    sc = _scores(n, rls, bm, ign)
+    r: dict[str, Any] = {
+        "n": n,
+        "eval": len(need),
+        "cached": len({rl_key(x) for s in sets for x in s[1]}) - len(need),
+        "thr": thr,
+        "blocks": sum(1 for x in sc if x >= thr),
+        "hits": {rl.rid: cnt(bm[rl_key(rl)]) for rl in rls},
+        "base": None,
+    }
+    if len(sets) > 1:
+        bthr, brls, bign = sets[1]
+        bsc = _scores(n, brls, bm, bign)
+        ch = [i for i in range(n) if (sc[i] >= thr) != (bsc[i] >= bthr)]
+        up = sum(1 for i in ch if sc[i] >= thr)
+        r["base"] = {"thr": bthr, "blocks": sum(1 for x in bsc if x >= bthr), "new_blocks": up, "unblocks": len(ch) - up}
+        if out is not None:
+            _wr_diff(out, src, fmt, ch, (thr, rls, sc), (bthr, brls, bsc), bm)
+    c.sv_last(cfg)
+    return r
+
+
+def _wr_diff(
+    out: Path,
+    src: Path,
+    fmt: str,
+    ch: list[int],
+    new: tuple[int, Sequence[Rl], array],
+    old: tuple[int, Sequence[Rl], array],
+    bm: dict[str, bytes],
+) -> None:
+    """Write changed decisions (one JSON object per request)."""
+    from .sink import Sink
+
+    def ms(rls: Sequence[Rl], i: int) -> str:
+        return ",".join(rl.rid for rl in rls if bm[rl_key(rl)][i >> 3] >> (i & 7) & 1)
+
+    chs = set(ch)
+    with Sink(out) as sk:
+        if not chs:
+            return
+        for i, rq in enumerate(rd_rqs(src, fmt)):
+            if i in chs:
+                sk.put(
+                    {
+                        "i": i,
+                        "ip": rq.get("ip", ""),
+                        "req": rq.get("req", ""),
+                        "ua": rq.get("ua", ""),
+                        "scr0": old[2][i],
+                        "dec0": dec(old[2][i], old[0]),
+                        "m0": ms(old[1], i),
+                        "scr": new[2][i],
+                        "dec": dec(new[2][i], new[0]),
+                        "m": ms(new[1], i),
+                    }
+                )
@@ -13,19 +13,22 @@ def dfl_rls() -> list[Rl]:
     """Default ruleset.
 
     Returns:
-        List of rules with simple patterns for common web attacks.
+        List of rules with simple patterns for common web attacks. Request
+        line rules match the URL-decoded line (trav_1 decodes twice), so
+        encoded variants need no patterns of their own.
     """
     return [
-        Rl("sqli_1", "re", 5, (r"(\%27)|(\')|(\-\-)|(\%23)|(#)",), "req"),
-        Rl("sqli_2", "re", 6, (r"\b(UNION|SELECT|INSERT|UPDATE|DELETE|DROP)\b",), "req"),
-        Rl("xss_1", "re", 5, (r"<\s*script\b", r"onerror\s*=", r"onload\s*="), "req"),
-        Rl("trav_1", "sub", 4, ("../", "..\\", "%2e%2e%2f", "%2e%2e%5c"), "req"),
+        Rl("sqli_1", "re", 5, (r"'|--|#",), "req", ("urldecode",)),
+        Rl("sqli_2", "re", 6, (r"\b(UNION|SELECT|INSERT|UPDATE|DELETE|DROP)\b",), "req", ("urldecode",)),
+        Rl("xss_1", "re", 5, (r"<\s*script\b", r"onerror\s*=", r"onload\s*="), "req", ("urldecode", "htmlentity")),
+        Rl("trav_1", "sub", 4, ("../", "..\\"), "req", ("urldecode", "urldecode")),
         Rl(
             "cmd_1",
             "re",
             6,
             (r"[;&|`]\s*(bash|sh|cmd|powershell)\b", r"\b(wget|curl)\b\s+https?://"),
             "req",
+            ("urldecode",),
         ),
         Rl("ua_1", "re", 3, (r"\b(sqlmap|nikto|nmap|acunetix|masscan)\b",), "ua"),
     ]
@@ -88,6 +91,7 @@ def ld_rls(d: dict[str, Any]) -> tuple[int, list[Rl], list[str]]:
                     w=int(x["w"]),
                     ps=tuple(map(str, x.get("ps", ()))),
                     fld=str(x.get("fld", "req")),
+                    t=tuple(map(str, x.get("t") or ())),
                 )
             )
         except KeyError as e:
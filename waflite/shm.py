@@ -0,0 +1,196 @@
+"""Shared-memory stats and rules generation for multi-worker servers.
+
+The parent process creates one block (``ShmSt.mk``) before starting
+uvicorn workers; every worker attaches by name (``ShmSt.att``) and claims
+its own slot. A worker only ever writes its own slot, so counting needs
+no locks; readers sum all slots.
+
+The header also holds a rules generation number: after a rules update the
+writer bumps it, and each worker compares it with the generation of its
+engine on every request (one memory read) and reloads when it differs.
+
+Layout (int64 words)::
+
+    0 magic | 1 gen | 2 nslot | 3 t0 (ms) | 4..7 reserved
+    8 + i*4: pid | scans | blocks | reserved
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import Iterator
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - windows
+    fcntl = None  # type: ignore[assignment]
+
+from .core import WfErr
+
+_MAGIC = 0x5741464C53484D31  # "WAFLSHM1"
+_HDR = 8
+_SW = 4
+
+
+class ShmErr(WfErr):
+    """Raised when shared block is missing or malformed."""
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ShmSt:
+    """Shared counters block.
+
+    Use ``mk`` (creator) or ``att`` (worker) instead of the constructor.
+
+    Args:
+        shm: Attached shared memory.
+        own: True for the creating process (it unlinks the block).
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, own: bool = False) -> None:
+        self.shm = shm
+        self.own = own
+        self.mv = shm.buf.cast("q")
+        if self.mv[0] != _MAGIC:
+            self.mv.release()
+            raise ShmErr(f"not a waflite shm block: {shm.name}")
+        self.n = int(self.mv[2])
+        self.slot = -1
+
+    @property
+    def name(self) -> str:
+        """Block name (pass it to workers)."""
+        return self.shm.name
+
+    @classmethod
+    def mk(cls, nslot: int = 64) -> "ShmSt":
+        """Create new block.
+
+        Args:
+            nslot: Max number of worker slots (dead workers' slots are reused).
+        """
+        shm = shared_memory.SharedMemory(create=True, size=(_HDR + nslot * _SW) * 8)
+        mv = shm.buf.cast("q")
+        mv[0] = _MAGIC
+        mv[2] = nslot
+        mv[3] = int(time.time() * 1000)
+        mv.release()
+        return cls(shm, own=True)
+
+    @classmethod
+    def att(cls, name: str) -> "ShmSt":
+        """Attach to existing block and claim a slot for this process.
+
+        Raises:
+            ShmErr: If block does not exist or has no free slot.
+        """
+        kw = {"track": False} if sys.version_info >= (3, 13) else {}
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=False, **kw)
+        except FileNotFoundError as e:
+            raise ShmErr(f"no shm block: {name}") from e
+        st = cls(shm)
+        st.claim()
+        return st
+
+    def _lkp(self) -> str:
+        return os.path.join(tempfile.gettempdir(), f"{self.name.lstrip('/')}.lock")
+
+    @contextmanager
+    def _lk(self) -> Iterator[None]:
+        """Cross-process lock for rare operations (slot claim, gen bump)."""
+        if fcntl is None:
+            yield
+            return
+        fd = os.open(self._lkp(), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def claim(self) -> int:
+        """Claim slot for current process (free or owned by a dead process).
+
+        Counters of a reclaimed slot are kept, so fleet totals never drop.
+        """
+        pid = os.getpid()
+        with self._lk():
+            for i in range(self.n):
+                o = _HDR + i * _SW
+                p = int(self.mv[o])
+                if p == pid or p == 0 or not _alive(p):
+                    self.mv[o] = pid
+                    self.slot = o
+                    return i
+        raise ShmErr("no free shm slot")
+
+    def inc(self, blk: bool) -> None:
+        """Count one scan (and a block) in own slot."""
+        o = self.slot
+        if o < 0:
+            self.claim()
+            o = self.slot
+        self.mv[o + 1] += 1
+        if blk:
+            self.mv[o + 2] += 1
+
+    def tot(self) -> tuple[int, int, int]:
+        """Fleet-wide totals.
+
+        Returns:
+            (scans, blocks, live_workers)
+        """
+        s = b = w = 0
+        mv = self.mv
+        for i in range(self.n):
+            o = _HDR + i * _SW
+            s += mv[o + 1]
+            b += mv[o + 2]
+            p = mv[o]
+            if p and _alive(p):
+                w += 1
+        return s, b, w
+
+    def t0(self) -> float:
+        """Creation time (unix seconds)."""
+        return self.mv[3] / 1000
+
+    def gen(self) -> int:
+        """Current rules generation."""
+        return self.mv[1]
+
+    def bump(self) -> int:
+        """Signal rules change to all workers.
+
+        Returns:
+            New generation.
+        """
+        with self._lk():
+            self.mv[1] += 1
+            return int(self.mv[1])
+
+    def close(self) -> None:
+        """Detach (and unlink if this process created the block)."""
+        self.mv.release()
+        self.shm.close()
+        if self.own:
+            self.shm.unlink()
+            try:
+                os.unlink(self._lkp())
+            except OSError:
+                pass
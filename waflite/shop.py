@@ -0,0 +1,237 @@
+"""Demo shop catalog.
+
+``Cat`` indexes the catalog once: id index, per-category lists,
+presorted orderings for every ``srt`` value and a token inverted index
+for search. ``flt`` returns exactly what a linear scan would (substring
+match in ``nm``/``ds``, stable sort), but without touching every item.
+"""
+
+from __future__ import annotations
+
+import itertools
+import random
+import re
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable
+
+_TOK = re.compile(r"\w+")
+_VER = itertools.count(1)
+
+# srt value -> sort key; anything else keeps catalog order
+SRTS: dict[str, Callable[[dict[str, Any]], Any]] = {
+    "pr_asc": lambda x: x["pr"],
+    "pr_desc": lambda x: -x["pr"],
+    "rt_desc": lambda x: (-float(x["rt"]), -int(x["rv"])),
+}
+
+
+def _itms() -> list[dict[str, Any]]:
+    return [
+        {
+            "id": 1,
+            "nm": "USB Rubber Ducky (demo)",
+            "pr": 1999,
+            "cat": "pentest",
+            "stk": 17,
+            "ds": "HID-инъекция. Учебный товар.",
+            "rt": 4.7,
+            "rv": 128,
+        },
+        {
+            "id": 2,
+            "nm": "YubiKey (demo)",
+            "pr": 5999,
+            "cat": "auth",
+            "stk": 42,
+            "ds": "2FA ключ. Учебный товар.",
+            "rt": 4.9,
+            "rv": 981,
+        },
+        {
+            "id": 3,
+            "nm": "Wi‑Fi Adapter (demo)",
+            "pr": 1299,
+            "cat": "net",
+            "stk": 9,
+            "ds": "Адаптер для лабораторных работ.",
+            "rt": 4.2,
+            "rv": 77,
+        },
+        {
+            "id": 4,
+            "nm": "RFID Reader (demo)",
+            "pr": 2499,
+            "cat": "rf",
+            "stk": 6,
+            "ds": "Ридер для тестового стенда.",
+            "rt": 4.3,
+            "rv": 54,
+        },
+        {
+            "id": 5,
+            "nm": "Cable Set (demo)",
+            "pr": 499,
+            "cat": "misc",
+            "stk": 120,
+            "ds": "Набор кабелей.",
+            "rt": 4.1,
+            "rv": 210,
+        },
+    ]
+
+
+def _cats() -> list[dict[str, str]]:
+    return [
+        {"id": "all", "nm": "Все"},
+        {"id": "auth", "nm": "Auth"},
+        {"id": "net", "nm": "Network"},
+        {"id": "pentest", "nm": "Pentest"},
+        {"id": "rf", "nm": "RF"},
+        {"id": "misc", "nm": "Misc"},
+    ]
+
+
+def gen_itms(n: int, seed: int = 1) -> list[dict[str, Any]]:
+    """Synthetic catalog for load tests.
+
+    Args:
+        n: Number of items.
+        seed: Random seed (same seed, same catalog).
+
+    Returns:
+        Items in the same shape as the demo catalog.
+    """
+    rnd = random.Random(seed)
+    cats = [c["id"] for c in _cats() if c["id"] != "all"]
+    ws = ["usb", "key", "adapter", "reader", "cable", "antenna", "board", "probe", "token", "lab", "kit", "pro"]
+    out: list[dict[str, Any]] = []
+    for i in range(1, n + 1):
+        nm = " ".join(rnd.sample(ws, 2)).title() + f" {i} (demo)"
+        out.append(
+            {
+                "id": i,
+                "nm": nm,
+                "pr": rnd.randrange(99, 99999),
+                "cat": rnd.choice(cats),
+                "stk": rnd.randrange(0, 200),
+                "ds": f"{rnd.choice(ws)} {rnd.choice(ws)}. Учебный товар #{i}.",
+                "rt": round(rnd.uniform(1, 5), 1),
+                "rv": rnd.randrange(0, 5000),
+            }
+        )
+    return out
+
+
+class Cat:
+    """Indexed catalog.
+
+    Args:
+        its: Items (dicts with id, nm, ds, cat, pr, rt, rv, ...).
+            Items are shared with callers and must not be mutated.
+
+    Attributes:
+        ver: Catalog version, unique per instance (for response caches).
+    """
+
+    def __init__(self, its: list[dict[str, Any]]) -> None:
+        self.ver = next(_VER)
+        self.its = list(its)
+        self.by_id = {x["id"]: x for x in self.its}
+        self._hs = [(x["nm"].lower(), x["ds"].lower()) for x in self.its]
+
+        n = len(self.its)
+        self._od: dict[str, list[int]] = {"": list(range(n))}
+        for k, f in SRTS.items():
+            self._od[k] = sorted(range(n), key=lambda i, f=f: f(self.its[i]))
+        self._rk: dict[str, list[int]] = {}
+        for k, o in self._od.items():
+            rk = [0] * n
+            for r, i in enumerate(o):
+                rk[i] = r
+            self._rk[k] = rk
+
+        # (cat, srt) -> presorted items; "all" is the whole catalog
+        self._ls: dict[tuple[str, str], list[dict[str, Any]]] = {}
+        self._cs: dict[str, set[int]] = {}
+        for i, x in enumerate(self.its):
+            self._cs.setdefault(x["cat"], set()).add(i)
+        for k, o in self._od.items():
+            self._ls[("all", k)] = [self.its[i] for i in o]
+            for i in o:
+                c = self.its[i]["cat"]
+                self._ls.setdefault((c, k), []).append(self.its[i])
+
+        # token -> positions (ascending)
+        self._ix: dict[str, list[int]] = {}
+        for i, (a, b) in enumerate(self._hs):
+            for t in set(_TOK.findall(a)) | set(_TOK.findall(b)):
+                self._ix.setdefault(t, []).append(i)
+        self._tc: OrderedDict[str, set[int]] = OrderedDict()
+
+    def get(self, iid: int) -> dict[str, Any] | None:
+        """Item by id."""
+        return self.by_id.get(iid)
+
+    def _tok_pos(self, w: str) -> set[int]:
+        """Positions of items with a token containing ``w`` (cached)."""
+        r = self._tc.get(w)
+        if r is not None:
+            self._tc.move_to_end(w)
+            return r
+        r = set()
+        for t, ps in self._ix.items():
+            if w in t:
+                r.update(ps)
+        self._tc[w] = r
+        if len(self._tc) > 1024:
+            self._tc.popitem(last=False)
+        return r
+
+    def _cand(self, q: str) -> set[int] | None:
+        """Candidate positions for substring query (None = all items).
+
+        Every maximal word run of ``q`` lies inside one token of a matching
+        item, so the rarest run's token matches are a superset of hits.
+        """
+        ws = _TOK.findall(q)
+        if not ws:
+            return None
+        best: set[int] | None = None
+        for w in sorted(set(ws), key=len, reverse=True):
+            ps = self._tok_pos(w)
+            best = ps if best is None else best & ps
+            if not best:
+                break
+        return best
+
+    def flt(self, q: str, cat: str, srt: str) -> list[dict[str, Any]]:
+        """Filter and sort catalog.
+
+        Args:
+            q: Search substring (case-insensitive, in name or description).
+            cat: Category id or "all".
+            srt: "pr_asc", "pr_desc", "rt_desc" (anything else: catalog order).
+
+        Returns:
+            Items.
+        """
+        q2 = (q or "").strip().lower()
+        k = srt if srt in SRTS else ""
+        c = cat if cat else "all"
+        if not q2:
+            return list(self._ls.get((c, k), []))
+        cs = self._cand(q2)
+        if cs is None:
+            cs = set(range(len(self.its)))
+        if c != "all":
+            cs = cs & self._cs.get(c, set())
+        hs = self._hs
+        ps = sorted((i for i in cs if q2 in hs[i][0] or q2 in hs[i][1]), key=self._rk[k].__getitem__)
+        return [self.its[i] for i in ps]
+
+
+@lru_cache(maxsize=1)
+def dfl_cat() -> Cat:
+    """Demo catalog (built once per process)."""
+    return Cat(_itms())
@@ -0,0 +1,246 @@
+"""Background report writer.
+
+``Sink`` takes report rows from the scanning thread through a bounded
+queue (in batches, so the queue is cheap) and encodes and writes them on
+a writer thread, so disk stalls do not stop scoring. Output can be split
+into numbered shards by size or row count and gzip-compressed on the fly::
+
+    with Sink(Path("out/rep.jsonl"), rot_rows=1_000_000, gz=True) as s:
+        for r in rows:
+            s.put(r)
+    # out/rep.00000.jsonl.gz, out/rep.00001.jsonl.gz, ...
+
+Without rotation and compression the file is byte-identical to
+``rep.wr_jsonl`` / ``rep.wr_csv``. Shards are written to temp files and
+renamed into place by a successful ``close``; on errors (or ``abort``)
+they are removed, so a failed run leaves the previous report intact.
+"""
+
+from __future__ import annotations
+
+import csv
+import gzip
+import io
+import os
+import queue
+import threading
+from pathlib import Path
+from typing import Any, BinaryIO, Mapping
+
+from .rep import Enc, OutErr, mk_csv, mk_jl
+
+Row = Mapping[str, Any]
+
+_MB = 1 << 20
+
+
+class Sink:
+    """Threaded report writer with rotation and compression.
+
+    Args:
+        p: Output path (shards get ``.NNNNN`` before the suffix).
+        ofmt: "jsonl" or "csv".
+        rot_mb: Start new shard after this many MiB (uncompressed); 0 = off.
+        rot_rows: Start new shard after this many rows; 0 = off.
+        gz: Gzip each shard (adds ".gz").
+        qn: Max queued batches (producer blocks when writer lags).
+        bn: Rows per batch.
+        buf: Write buffer size in bytes.
+
+    Attributes:
+        ps: Output files, in order (in place after ``close``).
+        n: Rows written.
+    """
+
+    def __init__(
+        self,
+        p: Path,
+        ofmt: str = "jsonl",
+        rot_mb: float = 0,
+        rot_rows: int = 0,
+        gz: bool = False,
+        qn: int = 64,
+        bn: int = 512,
+        buf: int = _MB,
+    ) -> None:
+        if ofmt not in ("jsonl", "csv"):
+            raise OutErr(f"bad ofmt: {ofmt!r}")
+        self.p = p
+        self.ofmt = ofmt
+        self.rot_b = int(rot_mb * _MB)
+        self.rot_rows = rot_rows
+        self.gz = gz
+        self.bn = bn
+        self.buf = buf
+        self.ps: list[Path] = []
+        self._tp: list[Path] = []  # temp file of each shard
+        self.n = 0
+        self._b: list[Row] = []
+        self._q: queue.Queue[list[Row] | None] = queue.Queue(maxsize=qn)
+        self._err: BaseException | None = None
+        self._f: BinaryIO | None = None
+        self._raw: BinaryIO | None = None
+        self._fb = 0  # bytes in current shard
+        self._fr = 0  # rows in current shard
+        self._hdr: list[str] | None = None  # csv field names
+        self._enc: Enc | None = None
+        self._t = threading.Thread(target=self._run, name="waflite-sink", daemon=True)
+        self._t.start()
+
+    def __enter__(self) -> "Sink":
+        return self
+
+    def __exit__(self, et: Any, ev: Any, tb: Any) -> None:
+        if et is None:
+            self.close()
+        else:
+            self.abort()
+
+    def put(self, r: Row) -> None:
+        """Queue one row.
+
+        Raises:
+            OutErr: If the writer has failed.
+        """
+        self._b.append(r)
+        if len(self._b) >= self.bn:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._err is not None:
+            raise OutErr(f"cannot write: {self.p}") from self._err
+        if self._b:
+            self._q.put(self._b)
+            self._b = []
+
+    def close(self) -> None:
+        """Write queued rows, close files and move them into place.
+
+        Raises:
+            OutErr: On write errors (temp files are removed).
+        """
+        if self._t.is_alive():
+            try:
+                self._flush()
+            except OutErr:
+                pass  # self._err is set, reported below
+            finally:
+                self._q.put(None)
+                self._t.join()
+        if self._err is None:
+            try:
+                for t, p in zip(self._tp, self.ps):
+                    os.replace(t, p)
+            except OSError as e:
+                self._err = e
+            else:
+                self._tp = []
+        if self._err is not None:
+            self._rm()
+            raise OutErr(f"cannot write: {self.p}") from self._err
+
+    def abort(self) -> None:
+        """Drop queued rows, stop writer and remove temp files."""
+        self._b = []
+        if self._t.is_alive():
+            self._q.put(None)
+            self._t.join()
+        self._rm()
+
+    def _rm(self) -> None:
+        for t in self._tp:
+            if t.exists():
+                t.unlink()
+        self._tp = []
+
+    # --- writer thread
+
+    def _run(self) -> None:
+        try:
+            if self.ofmt == "jsonl":
+                self._open()  # like wr_jsonl: empty report is an empty file
+            while True:
+                b = self._q.get()
+                if b is None:
+                    break
+                self._wr(b)
+        except BaseException as e:  # noqa: BLE001 - reported by close()
+            self._err = e
+            while self._q.get() is not None:  # unblock producer
+                pass
+        finally:
+            try:
+                self._close_f()
+            except OSError as e:
+                self._err = self._err or e
+
+    def _path(self) -> Path:
+        p = self.p
+        if self.rot_b or self.rot_rows:
+            p = p.with_name(f"{p.stem}.{len(self.ps):05d}{p.suffix}")
+        if self.gz:
+            p = p.with_name(p.name + ".gz")
+        return p
+
+    def _open(self) -> None:
+        p = self._path()
+        p.parent.mkdir(parents=True, exist_ok=True)
+        t = p.with_name(f"{p.name}.{os.getpid()}.tmp")
+        raw = open(t, "wb", buffering=self.buf)
+        self._f = gzip.GzipFile(filename="", mode="wb", fileobj=raw, mtime=0) if self.gz else raw  # type: ignore[assignment]
+        self._raw = raw
+        self.ps.append(p)
+        self._tp.append(t)
+        self._fb = self._fr = 0
+        if self._hdr is not None:
+            self._wb(self._csv([], hdr=True))
+
+    def _close_f(self) -> None:
+        if self._f is None:
+            return
+        f, self._f = self._f, None
+        f.close()
+        if self._raw is not None and f is not self._raw:
+            self._raw.close()
+
+    def _wb(self, b: bytes) -> None:
+        assert self._f is not None
+        self._f.write(b)
+        self._fb += len(b)
+
+    def _csv(self, rs: list[Row], hdr: bool = False) -> bytes:
+        s = io.StringIO()
+        w = csv.DictWriter(s, fieldnames=self._hdr or [])
+        if hdr:
+            w.writeheader()
+        w.writerows(rs)
+        return s.getvalue().encode("utf-8")
+
+    def _wr(self, rs: list[Row]) -> None:
+        if self._enc is None:
+            ks = tuple(rs[0].keys())
+            if self.ofmt == "csv":
+                self._hdr = list(ks)
+            self._enc = mk_csv(ks) if self.ofmt == "csv" else mk_jl(ks)
+        enc = self._enc
+        rot = self.rot_b or self.rot_rows
+        if not rot:
+            if self._f is None:
+                self._open()
+            self._wb("".join(map(enc, rs)).encode("utf-8"))
+            self.n += len(rs)
+            return
+        for r in rs:
+            b = enc(r).encode("utf-8")
+            if self._f is None or (
+                self._fr
+                and (
+                    (self.rot_rows and self._fr >= self.rot_rows)
+                    or (self.rot_b and self._fb + len(b) > self.rot_b)
+                )
+            ):
+                self._close_f()
+                self._open()
+            self._wb(b)
+            self._fr += 1
+            self.n += 1
@@ -0,0 +1,161 @@
+"""Line-protocol decision server (``waflite serve``).
+
+For inline checks from a reverse proxy the HTTP API is too heavy (HTTP
+parsing, JSON, pydantic). This server speaks one line per request over a
+Unix socket (or TCP)::
+
+    -> ip<TAB>req<TAB>ua<LF>        ("req" alone is fine too)
+    <- dec<TAB>scr<TAB>rid,rid<LF>  e.g. "block\\t9\\tsqli_union,sqli_or"
+
+Requests may be pipelined: every complete line in a read is answered in
+order with one write. Errors (bad or too long lines, rules db or scoring
+failures) are answered in place with ``err<TAB>msg``; the connection
+stays open.
+The engine comes from ``eng.EngC`` (snapshot aware, reloaded when the db
+version changes), checked once per read rather than per line.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import signal
+from pathlib import Path
+
+from .core import CfgErr
+from .db import DbErr
+from .eng import EngC
+
+MAX_LN = 64 * 1024
+
+
+def _err(x: Exception) -> str:
+    return "err\t" + (str(x) or type(x).__name__).replace("\n", " ")
+
+
+class _Conn(asyncio.Protocol):
+    """One client connection."""
+
+    def __init__(self, srv: "Srv") -> None:
+        self.srv = srv
+        self.buf = b""
+        self.tr: asyncio.Transport | None = None
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.tr = transport  # type: ignore[assignment]
+
+    def data_received(self, data: bytes) -> None:
+        b = self.buf + data if self.buf else data
+        j = b.rfind(b"\n")
+        if j < 0:
+            self.buf = b
+            if len(b) > MAX_LN:
+                assert self.tr is not None
+                self.tr.write(b"err\tline too long\n")
+                self.tr.close()
+            return
+        self.buf = b[j + 1 :]
+        assert self.tr is not None
+        self.tr.write(self.srv.ans(b[:j].split(b"\n")))
+
+
+class Srv:
+    """Decision server state (engine cache and counters).
+
+    Args:
+        dbp: Rules db path.
+
+    Attributes:
+        n: Requests answered.
+        blk: Block decisions.
+    """
+
+    def __init__(self, dbp: Path) -> None:
+        self.ec = EngC(dbp)
+        self.n = 0
+        self.blk = 0
+
+    def ans(self, lns: list[bytes]) -> bytes:
+        """Answer request lines (one reply line each)."""
+        try:
+            e = self.ec.get()
+        except (CfgErr, DbErr) as x:
+            return (_err(x) + "\n").encode("utf-8") * len(lns)
+        out = []
+        for ln in lns:
+            if len(ln) > MAX_LN:
+                out.append("err\tline too long")
+                continue
+            ps = ln.decode("utf-8", "replace").rstrip("\r").split("\t", 2)
+            if len(ps) == 1:
+                d = {"req": ps[0]}
+            elif len(ps) == 3:
+                d = {"ip": ps[0], "req": ps[1], "ua": ps[2]}
+            else:
+                out.append("err\tbad line")
+                continue
+            try:
+                r = e.run(d)
+            except Exception as x:  # e.g. re.error: answer it, keep the connection
+                out.append(_err(x))
+                continue
+            self.n += 1
+            if r["dec"] == "block":
+                self.blk += 1
+            out.append(f"{r['dec']}\t{r['scr']}\t{','.join(r['m'])}")
+        out.append("")
+        return "\n".join(out).encode("utf-8")
+
+    async def start(self, uds: Path | None = None, host: str = "", port: int = 0) -> list[asyncio.AbstractServer]:
+        """Start listening (Unix socket and / or TCP).
+
+        Args:
+            uds: Unix socket path (a stale socket file is replaced).
+            host: TCP host.
+            port: TCP port (0 with empty host: no TCP).
+
+        Returns:
+            Started servers.
+        """
+        lp = asyncio.get_running_loop()
+        ss: list[asyncio.AbstractServer] = []
+        if uds is not None:
+            if uds.is_socket():
+                uds.unlink()
+            ss.append(await lp.create_unix_server(lambda: _Conn(self), str(uds)))
+        if host or port:
+            ss.append(await lp.create_server(lambda: _Conn(self), host or "127.0.0.1", port))
+        return ss
+
+
+def serve(dbp: Path, uds: Path | None = None, host: str = "", port: int = 0) -> None:
+    """Run decision server until SIGINT / SIGTERM (the socket file is removed).
+
+    Args:
+        dbp: Rules db path.
+        uds: Unix socket path.
+        host: TCP host.
+        port: TCP port.
+    """
+
+    async def main() -> None:
+        s = Srv(dbp)
+        try:
+            s.ec.get()  # warm up: picks up snapshot if there is a fresh one
+        except (CfgErr, DbErr):
+            pass
+        ss = await s.start(uds, host, port)
+        stop = asyncio.Event()
+        lp = asyncio.get_running_loop()
+        for sg in (signal.SIGINT, signal.SIGTERM):
+            lp.add_signal_handler(sg, stop.set)
+        try:
+            await stop.wait()
+        finally:
+            for x in ss:
+                x.close()
+            if uds is not None and uds.is_socket():
+                os.unlink(uds)
+
+    asyncio.run(main())
+
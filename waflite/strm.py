@@ -0,0 +1,185 @@
+"""Streaming inspection of request bodies and headers.
+
+``BodyScan`` runs the "body" rules of an engine over ASGI body chunks as
+they arrive, without buffering the body. Chunks are decoded incrementally
+(utf-8, so a multibyte character split between chunks is fine) and every
+pattern is searched in a window made of the tail of the text seen so far
+plus the new chunk. The tail is as long as the longest possible match of
+any pattern, so a match split across chunks is still found; for unbounded
+regexes (``a.*b``) the tail is capped by ``ovl``. Memory per request is
+O(``ovl`` + chunk size) and scanning stops after ``lim`` bytes.
+Form bodies (``form=True``) are percent-decoded on the fly first, so rules
+see ``<script`` rather than ``%3Cscript``.
+
+Patterns that look past the end of the match (``$``, ``\\Z``, ``\\b``,
+lookahead) are searched on every window too, but before the last one a
+match only counts if it ends at least the lookahead width before the
+window end (a chunk end is not the body end); later matches are found
+again in the next window, whose tail keeps that width. On the last
+window (body end or ``lim``) every match counts.
+"""
+
+from __future__ import annotations
+
+import codecs
+import re
+import weakref
+from typing import Iterable
+from urllib.parse import unquote_to_bytes
+
+from .core import _rx
+from .eng import Eng, _sp, _walk
+
+# (rule index, regex or None for "sub", lowercase literal for "sub", max width, chars looked at past match end)
+Sp = tuple[int, "re.Pattern[str] | None", str, int, int]
+
+_CTX = 16  # chars kept before the searched part (lookbehind, \b)
+_SPS: weakref.WeakKeyDictionary[Eng, list[Sp]] = weakref.WeakKeyDictionary()
+
+
+def _ahead(t: object, ovl: int) -> int:
+    """Chars parsed regex may look at past its match end.
+
+    ``\\Z``, ``\\b`` and ``\\B``: 1; ``$``: 2 (it also matches before a
+    final newline); lookaheads: their width, capped by ovl.
+    """
+    r = 0
+    for op, av in _walk(t):
+        if op is _sp.AT and av == _sp.AT_END:
+            r = max(r, 2)
+        elif op is _sp.AT and av in (_sp.AT_END_STRING, _sp.AT_BOUNDARY, _sp.AT_NON_BOUNDARY):
+            r = max(r, 1)
+        if op in (_sp.ASSERT, _sp.ASSERT_NOT) and av[0] > 0:
+            r = max(r, min(av[1].getwidth()[1], ovl), 1)
+    return r
+
+
+def _re_sp(p: str, ovl: int) -> tuple[int, int]:
+    """(max match width capped by ovl, look-ahead width) for regex."""
+    try:
+        t = _sp.parse(p, re.IGNORECASE)
+        hi = t.getwidth()[1]
+    except Exception:
+        return ovl, ovl
+    return min(hi, ovl), _ahead(t, ovl)
+
+
+def _sps(eng: Eng, ovl: int) -> list[Sp]:
+    """Body pattern specs of engine (cached per engine)."""
+    r = _SPS.get(eng)
+    if r is not None:
+        return r
+    r = []
+    for i, rl in enumerate(eng.rls):
+        if rl.fld != "body":
+            continue
+        for p in rl.ps:
+            if rl.rtp == "re":
+                w, e = _re_sp(p, ovl)
+                r.append((i, _rx(p), "", w, e))
+            else:
+                r.append((i, None, p.lower(), len(p), 0))
+    _SPS[eng] = r
+    return r
+
+
+class BodyScan:
+    """Incremental "body" rules matcher for one request.
+
+    Args:
+        eng: Engine (only its "body" rules are used).
+        lim: Max body bytes to inspect.
+        ovl: Max chunk overlap in chars (tail kept for unbounded regexes).
+        form: Body is ``application/x-www-form-urlencoded``.
+
+    Attributes:
+        hit: Indexes (in ``eng.rls``) of matched rules; pass to ``Eng.run``.
+        n: Bytes inspected so far.
+        done: True after the last chunk or the size limit.
+    """
+
+    def __init__(self, eng: Eng, lim: int = 64 * 1024, ovl: int = 1024, form: bool = False) -> None:
+        self.lim = lim
+        self.form = form
+        self._pb = b""  # incomplete %XX escape from previous chunk
+        self.hit: set[int] = set()
+        self.n = 0
+        self.done = False
+        self._sp = _sps(eng, ovl)
+        self._w = max((x[3] + x[4] for x in self._sp), default=0)
+        self._nr = len({x[0] for x in self._sp})
+        self._t = ""
+        self._cut = False  # text was dropped from the tail
+        self._dc = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def feed(self, b: bytes, more: bool = True) -> bool:
+        """Inspect next chunk.
+
+        Args:
+            b: Chunk bytes.
+            more: False for the last chunk (ASGI ``more_body``).
+
+        Returns:
+            True if new rules matched.
+        """
+        if self.done:
+            return False
+        fin = not more or self.n + len(b) >= self.lim  # last window: body end or size limit
+        b = b[: self.lim - self.n]
+        self.n += len(b)
+        if self.form:
+            b = self._pb + b
+            j = b.rfind(b"%", max(0, len(b) - 2))
+            self._pb = b"" if fin or j < 0 else b[j:]
+            b = unquote_to_bytes((b[:j] if self._pb else b).replace(b"+", b" "))
+        s = self._dc.decode(b, final=fin)
+        w = self._t + s
+        p0 = len(self._t) - self._w if self._cut else 0
+        lw = ""
+        k = len(self.hit)
+        for i, rx, lit, _, la in self._sp:
+            if i in self.hit:
+                continue
+            if rx is None:
+                if not lw:
+                    lw = w.lower()
+                if lit in lw:
+                    self.hit.add(i)
+                continue
+            m = rx.search(w, max(p0, 0))
+            if la and not fin:
+                e = len(w) - la  # a match ending later may depend on text not seen yet
+                while m is not None and m.end() > e:
+                    m = rx.search(w, m.start() + 1) if m.start() < e else None
+            if m is not None:
+                self.hit.add(i)
+        keep = self._w + _CTX
+        if len(w) > keep:
+            self._t = w[-keep:]
+            self._cut = True
+        else:
+            self._t = w
+        self.done = fin or len(self.hit) == self._nr
+        return len(self.hit) > k
+
+
+def hdr_flds(hs: Iterable[tuple[str, str]], need: Iterable[str] | None = None) -> dict[str, str]:
+    """Request fields from headers.
+
+    Args:
+        hs: (name, value) pairs; repeated headers are joined with ", ".
+        need: Keep only these fields (e.g. ``Eng.flds``); None keeps all.
+
+    Returns:
+        Dict with "hdr:<lowercase name>" keys and "cookie" (all Cookie
+        headers joined with "; ").
+    """
+    nd = None if need is None else set(need)
+    r: dict[str, str] = {}
+    for k, v in hs:
+        k = "hdr:" + k.lower()
+        if k == "hdr:cookie" and (nd is None or "cookie" in nd):
+            r["cookie"] = r["cookie"] + "; " + v if "cookie" in r else v
+        if nd is None or k in nd:
+            r[k] = r[k] + ", " + v if k in r else v
+    return r
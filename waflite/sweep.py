@@ -0,0 +1,153 @@
+"""Single-pass threshold sweep.
+
+``waflite sweep`` scores a log once and keeps only a histogram of scores
+(per group, if asked), then reports block counts and rates for every
+threshold at which a decision can change, with and without the ``ign_ua``
+adjustment. Memory does not depend on the log size: a histogram has one
+bucket per distinct (score, ign_ua hit) pair and groups are capped
+(extra groups are counted under ``"(other)"``).
+
+Groups (``by``):
+
+- ``"path"``: first ``depth`` path segments (``/api/v1``);
+- ``"rules"``: set of matched rule ids (``sqli,xss``; ``""`` = none).
+"""
+
+from __future__ import annotations
+
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, Mapping, Sequence
+
+from .core import Rl, WfErr, scr
+from .io import rd_rqs
+from .rules import ld_rls
+
+OTHER = "(other)"
+
+# (raw score, ign_ua matched) -> count
+Hist = Counter
+
+
+def ign_adj(s: int) -> int:
+    """Score after the ``ign_ua`` adjustment."""
+    return max(0, s - 3)
+
+
+def _grp(by: str, depth: int) -> Callable[[Mapping[str, Any], list[str]], str] | None:
+    if by == "none":
+        return None
+    if by == "path":
+
+        def f(rq: Mapping[str, Any], ms: list[str]) -> str:
+            ps = [x for x in str(rq.get("path", "")).split("/") if x]
+            return "/" + "/".join(ps[:depth])
+
+        return f
+    if by == "rules":
+        return lambda rq, ms: ",".join(sorted(ms))
+    raise WfErr(f"bad sweep group: {by!r}")
+
+
+def thrs(h: Hist) -> list[int]:
+    """Thresholds at which some decision in histogram changes."""
+    return sorted({s for s, _ in h} | {ign_adj(s) for s, ig in h if ig})
+
+
+def tbl(h: Hist, ts: Iterable[int]) -> list[dict[str, Any]]:
+    """Block counts per threshold.
+
+    Args:
+        h: Histogram.
+        ts: Thresholds.
+
+    Returns:
+        Per threshold: "thr", "blocks" (with ``ign_ua``), "rate",
+        "blocks_raw" (without ``ign_ua``) and "ign" (requests let through
+        by ``ign_ua``).
+    """
+    n = sum(h.values())
+    r = []
+    for t in ts:
+        b = sum(c for (s, ig), c in h.items() if (ign_adj(s) if ig else s) >= t)
+        raw = sum(c for (s, _), c in h.items() if s >= t)
+        r.append({"thr": t, "blocks": b, "rate": round(b / n, 6) if n else 0.0, "blocks_raw": raw, "ign": raw - b})
+    return r
+
+
+def _scored(
+    rqs: Iterator[Mapping[str, Any]], rls: Sequence[Rl], eng: str, chunk: int
+) -> Iterator[tuple[Mapping[str, Any], int, list[str]]]:
+    if eng == "bulk":
+        from .bulk import bscr
+
+        ch: list[Mapping[str, Any]] = []
+        for rq in rqs:
+            ch.append(rq)
+            if len(ch) >= chunk:
+                for q, (s, ms) in zip(ch, bscr(rls, ch)):
+                    yield q, s, ms
+                ch = []
+        for q, (s, ms) in zip(ch, bscr(rls, ch)):
+            yield q, s, ms
+        return
+    for rq in rqs:
+        s, ms = scr(rls, rq)
+        yield rq, s, ms
+
+
+def sweep(
+    src: Path,
+    fmt: str,
+    cfg: dict[str, Any],
+    by: str = "none",
+    depth: int = 1,
+    max_grp: int = 100,
+    eng: str = "row",
+    chunk: int = 5000,
+) -> dict[str, Any]:
+    """Score log once and tabulate blocks for every threshold.
+
+    Args:
+        src: Input log (or ingested ``.wfc``).
+        fmt: "nginx", "raw" or "wfc".
+        cfg: Config dict (see ``rules.ld_cfg``).
+        by: "none", "path" or "rules".
+        depth: Path segments per group for ``by="path"``.
+        max_grp: Max groups kept; later groups go to ``"(other)"``.
+        eng: "row" or "bulk" scoring.
+        chunk: Requests per chunk for ``eng="bulk"``.
+
+    Returns:
+        Summary: request count, current threshold and its blocks, the
+        per-threshold table and, with ``by``, the same per group.
+
+    Raises:
+        WfErr: On bad config, input or group mode.
+    """
+    thr, rls, ign = ld_rls(cfg)
+    lig = [x.lower() for x in ign]
+    gf = _grp(by, depth)
+    h: Hist = Counter()
+    gs: dict[str, Hist] = {}
+    for rq, s, ms in _scored(rd_rqs(src, fmt), rls, eng, chunk):
+        ua = str(rq.get("ua", "")).lower()
+        k = (s, any(x in ua for x in lig))
+        h[k] += 1
+        if gf is not None:
+            g = gf(rq, ms)
+            gh = gs.get(g)
+            if gh is None:
+                if len(gs) >= max_grp:
+                    g = OTHER
+                gh = gs.setdefault(g, Counter())
+            gh[k] += 1
+    ts = sorted({t for t in thrs(h) if t > 0} | {thr})
+    r: dict[str, Any] = {"n": sum(h.values()), "thr": thr, "blocks": tbl(h, [thr])[0]["blocks"], "thrs": tbl(h, ts)}
+    if gf is not None:
+        r["by"] = by
+        r["groups"] = {
+            g: {"n": sum(gh.values()), "thrs": tbl(gh, ts)}
+            for g, gh in sorted(gs.items(), key=lambda x: (x[0] == OTHER, -sum(x[1].values()), x[0]))
+        }
+    return r
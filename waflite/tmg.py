@@ -0,0 +1,62 @@
+"""WAF timing: ``Server-Timing`` header and sampled timing log.
+
+Protected responses of ``WafMiddleware`` and the scan endpoints of the API
+carry::
+
+    Server-Timing: waf-rl;dur=0.004, waf-scr;dur=0.081, waf;dur=0.102
+
+(milliseconds: getting the engine, scoring, all WAF work), so an APM or
+the browser devtools can attribute latency to the WAF per route. With a
+sample rate, the same timings plus the decision and matched rule ids are
+logged as one JSON object per line to the ``waflite.timing`` logger.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import random
+import sys
+from typing import Any, Mapping
+
+LOG = logging.getLogger("waflite.timing")
+
+
+def srv_tm(rl: float, sc: float, tot: float) -> str:
+    """``Server-Timing`` value from durations in seconds."""
+    return f"waf-rl;dur={rl * 1000:.3f}, waf-scr;dur={sc * 1000:.3f}, waf;dur={tot * 1000:.3f}"
+
+
+def smp(rate: float) -> bool:
+    """True for a ``rate`` fraction of calls."""
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+def tlog(mt: str, path: str, r: Mapping[str, Any], rl: float, sc: float, tot: float) -> None:
+    """Log one timing record (caller does the sampling, see ``smp``)."""
+    if LOG.isEnabledFor(logging.INFO):
+        LOG.info(
+            json.dumps(
+                {
+                    "method": mt,
+                    "path": path,
+                    "dec": r["dec"],
+                    "scr": r["scr"],
+                    "m": list(r["m"]),
+                    "rl_ms": round(rl * 1000, 3),
+                    "scr_ms": round(sc * 1000, 3),
+                    "waf_ms": round(tot * 1000, 3),
+                },
+                ensure_ascii=False,
+            )
+        )
+
+
+def log_on() -> None:
+    """Send ``waflite.timing`` records to stderr (for the server CLIs)."""
+    if not LOG.handlers:
+        h = logging.StreamHandler(sys.stderr)
+        h.setFormatter(logging.Formatter("%(message)s"))
+        LOG.addHandler(h)
+    LOG.setLevel(logging.INFO)
+    LOG.propagate = False
@@ -3,11 +3,9 @@
 from __future__ import annotations
 
 import argparse
+import os
 from pathlib import Path
-
-import uvicorn
-
-from .webapp import mk_app
+from typing import Any
 
 
 def _ap() -> argparse.ArgumentParser:
@@ -15,11 +13,50 @@ def _ap() -> argparse.ArgumentParser:
     p.add_argument("--host", default="127.0.0.1")
     p.add_argument("--port", default=8000, type=int)
     p.add_argument("--db", default="data/rules_db.json", help="rules db path (json)")
+    p.add_argument("--shop-n", dest="shop_n", default=0, type=int, help="synthetic shop catalog size (0: demo items)")
+    p.add_argument("--workers", default=1, type=int, help="worker processes (coordinated rules reload)")
+    p.add_argument("--tm-log", dest="tm_log", default=0.0, type=float, help="log WAF timings for this fraction of requests")
     return p
 
 
+def _mk_env() -> Any:
+    """App factory for uvicorn workers (config from WAF_DB / WAF_SHM / WAF_SHOP_N / WAF_TM_LOG)."""
+    from .shm import ShmSt
+    from .shop import Cat, gen_itms
+    from .tmg import log_on
+    from .webapp import mk_app
+
+    n = int(os.environ.get("WAF_SHOP_N", "0"))
+    tl = float(os.environ.get("WAF_TM_LOG", "0"))
+    if tl > 0:
+        log_on()
+    return mk_app(Path(os.environ["WAF_DB"]), Cat(gen_itms(n)) if n > 0 else None, ShmSt.att(os.environ["WAF_SHM"]), tl)
+
+
 def run_web(argv: list[str] | None = None) -> int:
     a = _ap().parse_args(argv)
-    app = mk_app(Path(a.db))
+    import uvicorn
+
+    if a.workers > 1:
+        from .shm import ShmSt
+
+        shm = ShmSt.mk(nslot=max(64, 4 * a.workers))
+        os.environ["WAF_DB"] = str(Path(a.db).resolve())
+        os.environ["WAF_SHM"] = shm.name
+        os.environ["WAF_SHOP_N"] = str(a.shop_n)
+        os.environ["WAF_TM_LOG"] = str(a.tm_log)
+        try:
+            uvicorn.run("waflite.webcli:_mk_env", factory=True, workers=a.workers, host=a.host, port=a.port, log_level="info")
+        finally:
+            shm.close()
+        return 0
+
+    from .shop import Cat, gen_itms
+    from .tmg import log_on
+    from .webapp import mk_app
+
+    if a.tm_log > 0:
+        log_on()
+    app = mk_app(Path(a.db), Cat(gen_itms(a.shop_n)) if a.shop_n > 0 else None, tm_log=a.tm_log)
     uvicorn.run(app, host=a.host, port=a.port, log_level="info")
     return 0